@@ -1,26 +1,24 @@
 import streamlit as st
-import google.generativeai as genai
 import time
-from fpdf import FPDF
-import base64
+import contextlib
+import json
 import os
-import pandas as pd 
+# Heavy modules (google.generativeai, pandas/numpy, fpdf, pypdf) are imported
+# where they are first needed, so opening the app doesn't pay for all of them.
+from civilex.cache import ResponseCache, content_hash, make_cache_key
+from civilex.index import ProjectIndex
+from civilex.uploads import UploadFailedError, UploadManager, UploadTimeoutError
+from civilex.batch import INDEX_NAME, REPORT_SUFFIX, SUMMARY_INSTRUCTION, run_batch_audit
+from civilex.jobs import JobQueue
+from civilex.knowledge import FORENSIC_PROMPT, MASTER_CONTRACT_LIST, MY_CONTEXT, QUOTE_PROMPT, SCHEDULE_PROMPT, contract_family
+from civilex import metrics
+from civilex.context_cache import ContextCacheManager
+from civilex.backend import BackendError, make_backend
+from civilex.scheduler import QuotaExceededError, RequestScheduler, ScheduledBackend
 
 # --- PAGE SETUP ---
 st.set_page_config(page_title="Civilex | Master Contract & Tender Manager", page_icon="🛡️", layout="wide")
 
-# --- PDF CLASS ---
-class PDF(FPDF):
-    def header(self):
-        self.set_font('Arial', 'B', 12)
-        self.cell(0, 10, 'Civilex AI - Professional Document', 0, 1, 'C')
-        self.line(10, 20, 200, 20)
-        self.ln(10)
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
-        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
-
 # --- AUTHENTICATION ---
 if "GOOGLE_API_KEY" in st.secrets:
     api_key = st.secrets["GOOGLE_API_KEY"]
@@ -38,10 +36,42 @@ else:
     PROJECTS_ROOT = "Civil_Projects"
     STORAGE_MODE = "💻 Local Storage"
 
+INDEX_DB_PATH = os.path.join(".civilex", "index.sqlite") # Local disk, never inside OneDrive
+
+@st.cache_resource
+def get_project_index():
+    return ProjectIndex(INDEX_DB_PATH, PROJECTS_ROOT)
+
+@st.cache_resource
+def get_document_search():
+    from civilex.search import DocumentSearch
+    return DocumentSearch(INDEX_DB_PATH)
+
+@st.cache_resource
+def get_request_scheduler():
+    # Shared by all sessions: one token bucket sized to the API quota (CIVILEX_RPM requests/minute)
+    return RequestScheduler(requests_per_minute=int(os.environ.get("CIVILEX_RPM", "15")))
+
+@st.cache_resource
+def get_metrics_store():
+    # Append-only JSONL per project on local disk (like the index, never inside OneDrive)
+    return metrics.MetricsStore(os.path.join(".civilex", "metrics"))
+
+def track(project_name, module, operation, contract=None):
+    # contract: a form name from MASTER_CONTRACT_LIST or the governing contract's path
+    contract_type = contract_family(os.path.basename(contract)) if contract else "Unspecified"
+    return get_metrics_store().operation(project_name, module, operation, contract_type)
+
+@st.cache_resource
+def get_job_queue():
+    # Shared by all sessions; jobs keep running across reruns and module switches
+    return JobQueue(os.path.join(".civilex", "jobs.sqlite"))
+
 def get_projects():
     if not os.path.exists(PROJECTS_ROOT):
         os.makedirs(PROJECTS_ROOT)
-    return [f.name for f in os.scandir(PROJECTS_ROOT) if f.is_dir()]
+    # Only re-lists PROJECTS_ROOT when its mtime changes (cheap on a synced share)
+    return get_project_index().list_projects()
 
 def create_project_folder(name):
     clean_name = "".join([c for c in name if c.isalnum() or c in " -_"]).strip()
@@ -54,6 +84,7 @@ def create_project_folder(name):
         os.makedirs(f"{path}/Tenders/01_BQ_Documents")
         os.makedirs(f"{path}/Tenders/02_Supplier_Quotes")
         os.makedirs(f"{path}/Tenders/03_Cost_Analysis")
+        get_project_index().add_project(clean_name)
         return True
     return False
 
@@ -62,8 +93,10 @@ def save_to_project(project_name, file_bytes, file_name, subfolder):
     if not os.path.exists(full_folder_path):
         os.makedirs(full_folder_path)
     save_path = os.path.join(full_folder_path, file_name)
-    with open(save_path, "wb") as f:
+    with metrics.stage("file_write", bytes=len(file_bytes)), open(save_path, "wb") as f:
         f.write(file_bytes)
+    get_project_index().record_document(project_name, save_path, sha256=content_hash(file_bytes))
+    get_document_search().index_file_async(project_name, save_path) # PDF text extraction runs in the background
     return save_path
 
 def save_text_to_project(project_name, text_content, file_name, subfolder):
@@ -71,40 +104,20 @@ def save_text_to_project(project_name, text_content, file_name, subfolder):
     if not os.path.exists(full_folder_path):
         os.makedirs(full_folder_path)
     save_path = os.path.join(full_folder_path, file_name)
-    with open(save_path, "w") as f:
+    with metrics.stage("file_write", bytes=len(text_content)), open(save_path, "w", encoding="utf-8") as f:
         f.write(text_content)
+    if subfolder in ("Outgoing_Drafts", "Contracts"):
+        get_project_index().record_draft(project_name, save_path, "Draft" if subfolder == "Outgoing_Drafts" else "Contract", file_name)
+    else:
+        get_project_index().record_document(project_name, save_path)
+    get_document_search().index_text(project_name, save_path, text_content)
     return save_path
 
-# --- MASTER CONTRACT LIST ---
-MASTER_CONTRACT_LIST = [
-    "--- GOVERNMENT (SARAWAK) ---",
-    "PWD 75 (Sarawak) - Rev 2021 (Current)",
-    "PWD 75 (Sarawak) - Rev 2006 (Legacy)", 
-    "--- GOVERNMENT (FEDERAL) ---",
-    "PWD 203A (Federal) - Rev 1/2010 (Current)", 
-    "PWD 203A (Federal) - Rev 2007 (Legacy)",
-    "PWD 203 (Federal) - Lump Sum Rev 2010",
-    "PWD Design & Build (DB) - Rev 2007",
-    "PWD Form 203N (Nominated Sub-Con)",
-    "PWD Form 203P (Nominated Supplier)",
-    "--- PRIVATE SECTOR ---",
-    "PAM Contract 2018 (With Quantities)",
-    "PAM Contract 2018 (Without Quantities)",
-    "PAM Contract 2006 (Legacy)",
-    "PAM NSC 2018 (Nominated Sub-Con)",
-    "CIDB Standard Form 2022 (Collaborative)",
-    "CIDB Standard Form 2000 (Legacy)",
-    "AIAC Standard Form 2019",
-    "--- ENGINEERING ---",
-    "IEM.CE 2011 (Civil Engineering)",
-    "IEM.ME 2012 (Mech & Elec)",
-    "IEM Form 1989 (Legacy Civil)",
-    "--- INTERNATIONAL / SPECIAL ---",
-    "FIDIC Red Book (Construction)",
-    "FIDIC Yellow Book (Design-Build)",
-    "HDA Schedule G (Landed Residential)",
-    "HDA Schedule H (High-Rise Residential)"
-]
+def get_response_cache(project_name):
+    # Cached AI answers live inside the project so they travel with it (OneDrive sync)
+    if not project_name:
+        return None
+    return ResponseCache(os.path.join(PROJECTS_ROOT, project_name, ".civilex", "response_cache"))
 
 # --- SIDEBAR ---
 with st.sidebar:
@@ -117,6 +130,7 @@ with st.sidebar:
     proj_mode = st.radio("Mode:", ["Select Existing", "Create New"], horizontal=True, label_visibility="collapsed")
     
     current_project = None
+    governing_contract = None
     if proj_mode == "Create New":
         new_proj = st.text_input("New Project Name:")
         if st.button("Create Folder"):
@@ -128,45 +142,305 @@ with st.sidebar:
     else:
         if project_list:
             current_project = st.selectbox("Select Project:", project_list)
+            # Only folders whose mtime changed are re-listed, so files added or removed outside the app show up here
+            get_project_index().refresh_project(current_project)
             st.success(f"📂 Open: {current_project}")
+            with st.expander("🗂️ Project Files", expanded=False):
+                project_index = get_project_index()
+                docs = project_index.documents(current_project)
+                pending = sum(1 for d in docs if d["audit_status"] == "Pending")
+                st.caption(f"{len(docs)} file(s) · {len(project_index.drafts(current_project))} draft(s) · {pending} letter(s) not audited")
+                for d in docs[:15]:
+                    st.caption(f"{d['doc_type']}: {d['name']}")
+
+            # The governing contract is cached with the knowledge base for every AI call on this project
+            contract_pdfs = {d["name"]: d["path"] for d in get_project_index().documents(current_project, "Contracts") if d["name"].lower().endswith(".pdf")}
+            if contract_pdfs:
+                picked = st.selectbox("📜 Governing Contract:", ["(None)"] + sorted(contract_pdfs))
+                governing_contract = contract_pdfs.get(picked)
+                if governing_contract and not os.path.exists(governing_contract):
+                    get_project_index().forget_document(governing_contract) # Deleted/renamed since the last rescan
+                    st.error(f"⚠️ {picked} is no longer in the Contracts folder. AI answers will not use it.")
+                    governing_contract = None
         else:
             st.warning("No projects found. Create one!")
 
     st.markdown("---")
     with st.expander("📚 Master Library", expanded=False):
         st.caption("Includes all PWD, PAM, IEM, CIDB, FIDIC & HDA variations.")
+        api = get_request_scheduler().stats()
+        st.caption(f"📶 AI queue: {api['waiting']} waiting · {api['running']} running · avg wait {api['avg_wait']:.1f}s "
+                   f"· {api['retries']} retries · {api['coalesced']} shared")
+        if st.button("🛠️ Rebuild Project Index"):
+            get_project_index().rebuild()
+            st.rerun()
     
     menu = st.radio("Select Module:", 
         ["📂 Document Scanner", 
          "✍️ Draft Reply/Defense", 
          "📝 Create Contract/Deed",
-         "💰 Commercial Manager (Cash Flow)"]) # Renamed
+         "💰 Commercial Manager (Cash Flow)",
+         "🏢 Portfolio Cash Flow",
+         "📊 Tender Comparison",
+         "🔎 Search Correspondence",
+         "📈 Operations Metrics"]) # Renamed
     
     st.markdown("---")
 
 # --- MAIN APP LOGIC ---
-if not api_key:
+if not api_key and os.environ.get("CIVILEX_BACKEND") != "stub":
     st.warning("🔒 Key not found. Enter in sidebar.")
     st.stop()
 
-genai.configure(api_key=api_key)
-
 # USE STABLE 2.0 FLASH
-model = genai.GenerativeModel(model_name="models/gemini-2.0-flash")
-
-# --- INTELLIGENT CONTEXT ---
-MY_CONTEXT = """
-STRICT LANGUAGE RULE: UK/Malaysian English spelling only (Programme, Labour, Defence, Cheque).
-ROLE: Senior Consultant Quantity Surveyor (CQS) & Contract Manager in Malaysia.
-MASTER KNOWLEDGE BASE (VERSIONS & AMENDMENTS) - DO NOT HALLUCINATE:
-1. **PWD 75 (SARAWAK STATE):** Rev 2006 (Legacy), Rev 2021 (Current/Covid Clauses).
-2. **PWD 203A (FEDERAL):** Rev 2007 (Legacy), Rev 1/2010 (Current).
-3. **PAM CONTRACT:** 2006 (Legacy), 2018 (Current).
-4. **CIDB FORMS:** 2000 (Adversarial), 2022 (Collaborative/Compensation Events).
-5. **IEM FORMS:** 1989 (Old), 2011 (Civil), 2012 (ME).
-6. **STATUTORY:** HDA (Residential), CIPAA 2012 (Payment), Contracts Act 1950.
-INSTRUCTION: Identify the EXACT Version. Use correct Administrator.
-"""
+MODEL_NAME = "models/gemini-2.0-flash"
+
+CONTEXT_CACHE_MODEL = "models/gemini-2.0-flash-001" # Context caching needs a pinned version
+
+# The backend (and google.generativeai with it) is built on the first AI call, not on the first render.
+# No spinners: background jobs may be the first caller and have no page to draw on.
+@st.cache_resource(show_spinner=False)
+def get_backend(api_key):
+    # Configured once per process (and key); CIVILEX_BACKEND=stub runs against the local stub server.
+    # Every call goes through the shared scheduler.
+    return ScheduledBackend(make_backend(api_key), get_request_scheduler())
+
+@st.cache_resource(show_spinner=False)
+def get_model(api_key, model_name):
+    return get_backend(api_key).model(model_name)
+
+@st.cache_resource(show_spinner=False)
+def get_upload_manager(api_key):
+    # Shared by all sessions so the same PDF is only uploaded/processed once
+    return UploadManager(get_backend(api_key))
+
+@st.cache_resource(show_spinner=False)
+def get_context_cache(api_key):
+    # One server-side cache per (knowledge base, governing contract), shared across sessions
+    return ContextCacheManager(get_backend(api_key).cache_backend(CONTEXT_CACHE_MODEL))
+
+def contract_context_key(contract_path):
+    # Identifies the governing contract version without reading the file
+    if not contract_path: return "no-contract"
+    try:
+        info = os.stat(contract_path)
+    except FileNotFoundError:
+        return "no-contract" # Removed after it was picked (e.g. a queued job): answer without it
+    return f"{contract_path}:{info.st_size}:{info.st_mtime}"
+
+def ai_with_context(payload, project_name=None, contract_path=None, stream=False):
+    # MY_CONTEXT (+ governing contract) is the cached prefix; payload is only the new instruction
+    def load_contract():
+        with open(contract_path, "rb") as f:
+            return get_upload_manager(api_key).upload(f.read(), os.path.basename(contract_path))
+    contract_key = contract_context_key(contract_path)
+    return get_context_cache(api_key).generate(
+        MY_CONTEXT, payload, get_model(api_key, MODEL_NAME),
+        contract_loader=load_contract if contract_key != "no-contract" else None, contract_key=contract_key,
+        display_name=f"Civilex {project_name or 'General'}", stream=stream,
+    )
+
+def audit_pdf_bytes(project_name, file_bytes, file_name, contract_path=None, module="Batch Audit"):
+    # Used by the batch runner (worker threads) - no Streamlit calls in here
+    prompt = FORENSIC_PROMPT + SUMMARY_INSTRUCTION
+    with track(project_name, module, "forensic_audit", contract_path):
+        cache = get_response_cache(project_name)
+        cache_key = make_cache_key(file_bytes, f"{MY_CONTEXT}\n{contract_context_key(contract_path)}\n{prompt}", MODEL_NAME)
+        report = cache.get(cache_key) if cache else None
+        if report is None:
+            sample_file = get_upload_manager(api_key).upload(file_bytes, file_name)
+            report = ai_with_context([prompt, sample_file], project_name, contract_path).text
+            if cache: cache.put(cache_key, report, source=file_name)
+        else:
+            metrics.count("cache_hit")
+        return report
+
+def parse_json_reply(text):
+    # Models like to wrap JSON in ```json fences
+    with metrics.stage("json_parse", bytes=len(text or "")):
+        try:
+            return json.loads(text.replace("```json", "").replace("```", "").strip())
+        except (ValueError, AttributeError):
+            return None
+
+def extract_schedule_reply(project_name, schedule_bytes, file_name):
+    # No Streamlit calls - also runs as a background job. Returns (JSON text, result or None when cached)
+    from civilex.extraction import extract_schedule_items
+    with track(project_name, "Commercial Manager", "schedule_extraction"):
+        cache = get_response_cache(project_name)
+        cache_key = make_cache_key(schedule_bytes, SCHEDULE_PROMPT, MODEL_NAME)
+        response_text = cache.get(cache_key) if cache else None
+        if response_text is not None:
+            metrics.count("cache_hit")
+            return response_text, None
+
+        # Big BQs: table pages are split into page ranges and extracted in parallel
+        def extract_chunk(pdf_bytes, label, note):
+            return get_model(api_key, MODEL_NAME).generate_content([SCHEDULE_PROMPT + note, get_upload_manager(api_key).upload(pdf_bytes, f"Schedule {label}")]).text
+
+        result = extract_schedule_items(schedule_bytes, extract_chunk)
+        response_text = json.dumps(result["items"])
+        # Only cache answers we could actually use (and not partial imports)
+        if cache and result["items"] and result["complete"]: cache.put(cache_key, response_text, source=file_name)
+        return response_text, result
+
+def extract_quote_lines(file_bytes, file_name):
+    # Scanned quotes only (PDFs without a text layer); the tender module caches the parsed lines
+    from civilex.extraction import salvage_json_objects
+    reply = get_model(api_key, MODEL_NAME).generate_content([QUOTE_PROMPT, get_upload_manager(api_key).upload(file_bytes, file_name)]).text
+    with metrics.stage("json_parse", bytes=len(reply or "")):
+        items, _damaged = salvage_json_objects(reply)
+    return items
+
+def schedule_frame(response_text):
+    import pandas as pd
+    # Clean markdown formatting if present
+    extracted_data = parse_json_reply(response_text)
+    if not extracted_data: raise ValueError("No schedule items could be read from the document.")
+
+    # The AI gives "Value", but we need "Value (RM)"
+    new_df = pd.DataFrame(extracted_data).rename(columns={"Value": "Value (RM)", "Cost": "Cost (RM)"})
+    new_df["Start Date"] = pd.to_datetime(new_df["Start Date"])
+    new_df["End Date"] = pd.to_datetime(new_df["End Date"])
+    return new_df
+
+def ask_about_pdf(file_bytes, prompt, display_name, profile=None):
+    from civilex.pdftext import prepare_document
+    # With a profile ("terms"/"schedule") only the relevant pages (or their text) are sent
+    doc = prepare_document(file_bytes, profile) if profile else {"mode": "full", "reason": "full document"}
+    if doc["mode"] == "text":
+        payload = [prompt, "DOCUMENT TEXT (relevant pages only):\n" + doc["text"]]
+    elif doc["mode"] == "pages":
+        payload = [prompt, get_upload_manager(api_key).upload(doc["pdf_bytes"], f"{display_name} (selected pages)")]
+    else:
+        payload = [prompt, get_upload_manager(api_key).upload(file_bytes, display_name)]
+    return get_model(api_key, MODEL_NAME).generate_content(payload).text, doc
+
+@contextlib.contextmanager
+def friendly_api_errors():
+    # Quota / service errors left after the scheduler's retries: a message instead of a stack trace
+    try:
+        yield
+    except QuotaExceededError as e:
+        st.error(f"⏳ {e}")
+    except BackendError as e:
+        st.error(f"⚠️ The AI service failed ({e}). Please try again.")
+    except (UploadTimeoutError, UploadFailedError) as e:
+        st.error(f"⚠️ The document could not be prepared for the AI ({e}). Please try again.")
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def render_pdf_cached(text):
+    # Rendered once per distinct text (cache_data keys on the content) and shared by all sessions;
+    # st.download_button serves the bytes from a media URL instead of a base64 data: link
+    from civilex.pdfexport import render_text_pdf
+    metrics.count("pdf_rendered") # Only runs on a cache miss
+    return render_text_pdf(text)
+
+def export_pdf(text, project_name):
+    # Timed outside the cache so hits are recorded too, against the project that asked;
+    # once per text and session, not on every rerun that redraws the download button
+    seen = st.session_state.setdefault("pdf_exports", set())
+    text_key = (project_name, content_hash(text.encode("utf-8")))
+    if text_key in seen:
+        return render_pdf_cached(text)
+    with track(project_name, "PDF Export", "render_pdf") as op, metrics.stage("pdf_render", bytes=len(text)):
+        pdf_bytes = render_pdf_cached(text)
+        if not op.record["counters"].get("pdf_rendered"):
+            op.count("cache_hit")
+    seen.add(text_key)
+    return pdf_bytes
+
+def stream_chunks(response):
+    with metrics.stage("stream_response") as info:
+        for chunk in response:
+            info["prompt_tokens"], info["response_tokens"] = metrics.usage_of(chunk) # The last chunk has the totals
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # Chunk without text parts (e.g. safety/finish metadata)
+            if text: yield text
+
+def generate_draft(payload, stream=True, contract_path=None, module="Drafting", contract_form=None):
+    # Streaming shows the first words within a second or two; returns the full text (None on failure)
+    with friendly_api_errors(), track(current_project, module, "stream_draft" if stream else "draft",
+                                      contract_form or contract_path):
+        if not stream:
+            with st.spinner("Drafting..."):
+                return ai_with_context(payload, current_project, contract_path).text
+        response = ai_with_context(payload, current_project, contract_path, stream=True)
+        live_box = st.empty()
+        with live_box.container():
+            st.caption("✍️ Writing...")
+            full_text = st.write_stream(stream_chunks(response))
+        live_box.empty()
+        return full_text
+    return None
+
+# --- BACKGROUND JOBS (worker threads: no Streamlit calls in here) ---
+def audit_letter_job(report, project_name, file_bytes, file_name, letter_path, contract_path):
+    report(0.1, "Uploading & auditing")
+    text = audit_pdf_bytes(project_name, file_bytes, file_name, contract_path, module="Document Scanner")
+    report_path = os.path.splitext(letter_path)[0] + REPORT_SUFFIX
+    save_text_to_project(project_name, text, os.path.basename(report_path), "Incoming_Letters")
+    get_project_index().refresh_project(project_name)
+    return report_path
+
+def batch_audit_job(report, project_name, contract_path, workers, redo):
+    letters_folder = os.path.join(PROJECTS_ROOT, project_name, "Incoming_Letters")
+    def on_progress(done, total, path, error):
+        report(done / total, f"{done}/{total} - {os.path.basename(path)}" + (" (failed)" if error else ""))
+    result = run_batch_audit(letters_folder, lambda data, name: audit_pdf_bytes(project_name, data, name, contract_path),
+                             max_workers=workers, skip_done=not redo, on_progress=on_progress)
+    get_project_index().refresh_project(project_name)
+    get_document_search().sync_project(os.path.join(PROJECTS_ROOT, project_name), project_name)
+    if result["failed"]:
+        report(message=f"{result['audited']} audited, {len(result['failed'])} failed")
+    return os.path.join(letters_folder, INDEX_NAME)
+
+def schedule_job(report, project_name, schedule_bytes, file_name):
+    report(0.1, "Extracting schedule items")
+    response_text, result = extract_schedule_reply(project_name, schedule_bytes, file_name)
+    if result is not None and not result["complete"]:
+        report(message="Some page ranges failed - check the items before using them")
+    name = os.path.splitext(file_name)[0] + "_schedule_items.json"
+    return save_text_to_project(project_name, response_text, name, os.path.join("Tenders", "03_Cost_Analysis"))
+
+JOB_ICONS = {"queued": "🕒", "running": "⏳", "done": "✅", "failed": "❌", "interrupted": "⚠️"}
+
+@st.fragment(run_every=3)
+def job_panel(project_name):
+    # Re-runs on its own every few seconds; the rest of the page is untouched
+    job_queue = get_job_queue()
+    jobs = job_queue.jobs(project_name, limit=10)
+    if not jobs:
+        st.caption("No background jobs yet.")
+        return
+    st.caption(f"{job_queue.active_count(project_name)} running / queued")
+    for job in jobs:
+        st.markdown(f"{JOB_ICONS.get(job['status'], '')} **{job['label']}**")
+        if job["status"] in ("queued", "running"):
+            st.progress(job["progress"] or 0.0, text=job["message"] or "")
+        elif job["status"] == "failed":
+            st.caption(job["error"])
+        elif job["status"] == "done" and job["result_path"] and os.path.exists(job["result_path"]):
+            if job["kind"] == "audit" and st.button("👁️ Show report", key=f"job_{job['id']}"):
+                with open(job["result_path"], "r", encoding="utf-8") as f:
+                    st.session_state.scan_report = f.read()
+                st.rerun()
+            if job["kind"] == "schedule" and st.button("📥 Load into Cash Flow", key=f"job_{job['id']}"):
+                try:
+                    with open(job["result_path"], "r", encoding="utf-8") as f:
+                        st.session_state.schedule_df = schedule_frame(f.read())
+                    st.rerun()
+                except ValueError as e:
+                    st.error(str(e))
+    if st.button("🧹 Clear finished", key="jobs_clear"):
+        job_queue.clear_finished(project_name)
+
+if current_project:
+    with st.sidebar:
+        with st.expander("⏳ Background Jobs", expanded=get_job_queue().active_count(current_project) > 0):
+            job_panel(current_project)
 
 # ==========================================
 # MODULE 1: DOCUMENT SCANNER
@@ -179,28 +453,80 @@ if menu == "📂 Document Scanner":
     if "scan_report" not in st.session_state: st.session_state.scan_report = ""
 
     if uploaded_file:
+        if current_project and st.button("⏳ Audit in Background", help="Keep working while it runs; the report is saved next to the letter"):
+            pdf_bytes = uploaded_file.getvalue()
+            letter_path = save_to_project(current_project, pdf_bytes, uploaded_file.name, "Incoming_Letters")
+            get_job_queue().submit("audit", current_project, f"Audit: {uploaded_file.name}", audit_letter_job,
+                                   current_project, pdf_bytes, uploaded_file.name, letter_path, governing_contract)
+            st.toast("Queued. Progress is in the sidebar under Background Jobs.")
         if st.button("🚀 Run Forensic Audit"):
-            with st.spinner("🕵️ Detecting Contract Version..."):
-                if current_project: save_to_project(current_project, uploaded_file.getbuffer(), uploaded_file.name, "Incoming_Letters")
-                with open("temp.pdf", "wb") as f: f.write(uploaded_file.getbuffer())
-                
-                sample_file = genai.upload_file(path="temp.pdf", display_name="Scan", mime_type="application/pdf")
-                
-                while sample_file.state.name == "PROCESSING": time.sleep(1); sample_file = genai.get_file(sample_file.name)
+            with st.spinner("🕵️ Detecting Contract Version..."), friendly_api_errors(), \
+                    track(current_project, "Document Scanner", "forensic_audit", governing_contract):
+                # Work from this session's in-memory copy; no shared temp file on disk
+                pdf_bytes = uploaded_file.getvalue()
+                if current_project: save_to_project(current_project, pdf_bytes, uploaded_file.name, "Incoming_Letters")
+                prompt = FORENSIC_PROMPT
 
-                prompt = f"{MY_CONTEXT}\n Forensic Audit. Identify Form & Year. Check LAD, Payment, Design Liability."
-                
-                response = model.generate_content([prompt, sample_file])
-                st.session_state.scan_report = response.text 
+                # Same contract + same prompt + same model = reuse the saved audit
+                cache = get_response_cache(current_project)
+                cache_key = make_cache_key(pdf_bytes, f"{MY_CONTEXT}\n{contract_context_key(governing_contract)}\n{prompt}", MODEL_NAME)
+                report = cache.get(cache_key) if cache else None
+
+                if report is None:
+                    sample_file = get_upload_manager(api_key).upload(pdf_bytes, "Scan")
+
+                    response = ai_with_context([prompt, sample_file], current_project, governing_contract)
+                    report = response.text
+                    if cache: cache.put(cache_key, report, source=uploaded_file.name)
+                else:
+                    metrics.count("cache_hit")
+                    st.toast("⚡ Loaded saved audit for this document.")
+                st.session_state.scan_report = report 
     
     if st.session_state.scan_report:
         st.markdown("---")
         st.markdown(st.session_state.scan_report)
-        pdf = PDF(); pdf.add_page(); pdf.set_font("Arial", size=10)
-        clean_text = st.session_state.scan_report.replace("**", "").encode('latin-1', 'replace').decode('latin-1')
-        pdf.multi_cell(0, 5, clean_text)
-        b64 = base64.b64encode(pdf.output(dest='S').encode('latin-1')).decode()
-        st.markdown(f'<a href="data:application/octet-stream;base64,{b64}" download="Forensic_Report.pdf"><b>📥 Download Report as PDF</b></a>', unsafe_allow_html=True)
+        st.download_button("📥 Download Report as PDF", export_pdf(st.session_state.scan_report, current_project), file_name="Forensic_Report.pdf", mime="application/pdf", on_click="ignore")
+
+    # --- BATCH MODE: AUDIT THE WHOLE INCOMING_LETTERS FOLDER ---
+    if current_project:
+        st.markdown("---")
+        with st.expander("📦 Batch Audit: all PDFs in Incoming_Letters", expanded=False):
+            letters_folder = os.path.join(PROJECTS_ROOT, current_project, "Incoming_Letters")
+            st.caption(f"Reports are saved next to each letter. Summary: {current_project}/Incoming_Letters/_Audit_Index.csv")
+            b1, b2 = st.columns(2)
+            with b1: workers = st.slider("Parallel audits", min_value=1, max_value=8, value=4)
+            with b2: redo = st.checkbox("Re-audit letters that already have a report", value=False)
+
+            if st.button("⏳ Run Batch Audit in Background"):
+                get_job_queue().submit("batch", current_project, "Batch Audit: Incoming_Letters", batch_audit_job,
+                                       current_project, governing_contract, workers, redo)
+                st.toast("Queued. Progress is in the sidebar under Background Jobs.")
+
+            if st.button("🚀 Run Batch Audit"):
+                progress = st.progress(0.0, text="Looking for letters...")
+
+                def show_progress(done, total, path, error):
+                    label = f"{done}/{total} - {os.path.basename(path)}" + (" ❌" if error else " ✅")
+                    progress.progress(done / total, text=label)
+
+                result = run_batch_audit(
+                    letters_folder,
+                    lambda data, name: audit_pdf_bytes(current_project, data, name, governing_contract),
+                    max_workers=workers,
+                    skip_done=not redo,
+                    on_progress=show_progress,
+                )
+                progress.progress(1.0, text="Done")
+                get_project_index().refresh_project(current_project) # Picks up the new reports
+                get_document_search().sync_project(os.path.join(PROJECTS_ROOT, current_project), current_project)
+                st.success(f"✅ Audited {result['audited']} letter(s).")
+                for path, error in result["failed"].items():
+                    st.error(f"{os.path.basename(path)}: {error}")
+                if result["rows"]:
+                    st.dataframe(result["rows"], use_container_width=True)
+                else:
+                    st.info("No PDFs found in Incoming_Letters.")
 
 # ==========================================
 # MODULE 2: DRAFT REPLY
@@ -222,30 +548,38 @@ elif menu == "✍️ Draft Reply/Defense":
             
         recipient = st.text_input("To:", value=def_to)
         goal = st.text_area("Goal:", placeholder="e.g., Claim for EOT due to rain.")
+        stream_mode = st.toggle("⚡ Live typing (stream the draft)", value=True, key="draft_stream")
+        use_history = st.toggle("📚 Use relevant prior letters from this project", value=bool(current_project), disabled=not current_project)
 
     if st.button("Generate Letter"):
-        with st.spinner("Drafting..."):
-            prompt_text = f"{MY_CONTEXT}\n Draft Letter. Context: {contract_type}. From: {sender_role}. To: {recipient}. Goal: {goal}."
+        with st.spinner("Preparing..."):
+            prompt_text = f"Draft Letter. Context: {contract_type}. From: {sender_role}. To: {recipient}. Goal: {goal}."
             
+            # Pull the most relevant earlier letters/clauses from the local index instead of re-uploading PDFs
+            if use_history and current_project:
+                history = get_document_search().related_context(f"{goal} {contract_type} {recipient}", current_project)
+                if history:
+                    prompt_text += f"\n\nPRIOR PROJECT CORRESPONDENCE (stay consistent with it, cite dates/refs where useful):\n{history}"
+
             api_payload = [prompt_text]
             
             if uploaded_file:
-                if current_project: save_to_project(current_project, uploaded_file.getbuffer(), uploaded_file.name, "Incoming_Letters")
-                with open("temp.pdf", "wb") as f: f.write(uploaded_file.getbuffer())
-                sample_file = genai.upload_file(path="temp.pdf", display_name="Context", mime_type="application/pdf")
-                while sample_file.state.name == "PROCESSING": time.sleep(1); sample_file = genai.get_file(sample_file.name)
-                api_payload.append(sample_file)
-
-            response = model.generate_content(api_payload)
-            if current_project: save_text_to_project(current_project, response.text, f"Draft_{int(time.time())}.txt", "Outgoing_Drafts")
+                pdf_bytes = uploaded_file.getvalue()
+                # Start the upload first (straight from memory); the project copy is written while Gemini processes it
+                upload_future = get_upload_manager(api_key).submit(pdf_bytes, "Context")
+                if current_project: save_to_project(current_project, pdf_bytes, uploaded_file.name, "Incoming_Letters")
+                api_payload = None # Stays None (no draft) if the upload fails
+                with friendly_api_errors():
+                    api_payload = [prompt_text, upload_future.result()]
+
+        draft_text = generate_draft(api_payload, stream=stream_mode, contract_path=governing_contract,
+                                    module="Draft Reply", contract_form=contract_type) if api_payload else None
+        if draft_text:
+            if current_project: save_text_to_project(current_project, draft_text, f"Draft_{int(time.time())}.txt", "Outgoing_Drafts")
             st.markdown("---")
-            st.text_area("Result:", value=response.text, height=400)
+            st.text_area("Result:", value=draft_text, height=400)
             
-            pdf = PDF(); pdf.add_page(); pdf.set_font("Arial", size=10)
-            clean_text = response.text.replace("**", "").encode('latin-1', 'replace').decode('latin-1')
-            pdf.multi_cell(0, 5, clean_text)
-            b64 = base64.b64encode(pdf.output(dest='S').encode('latin-1')).decode()
-            st.markdown(f'<a href="data:application/octet-stream;base64,{b64}" download="Draft_Letter.pdf"><b>📥 Download Letter as PDF</b></a>', unsafe_allow_html=True)
+            st.download_button("📥 Download Letter as PDF", export_pdf(draft_text, current_project), file_name="Draft_Letter.pdf", mime="application/pdf", on_click="ignore")
 
 # ==========================================
 # MODULE 3: CONTRACT CREATOR
@@ -261,26 +595,27 @@ elif menu == "📝 Create Contract/Deed":
         with c1: project = st.text_input("Project"); my_comp = st.text_input("My Company")
         with c2: other = st.text_input("Counterparty"); val = st.text_input("Value")
         extra = st.text_area("Details:", value="Back-to-back basis.")
+        stream_mode = st.toggle("⚡ Live typing (stream the document)", value=True)
         sub = st.form_submit_button("🚀 Generate Document")
     
     if sub:
-        with st.spinner("Drafting..."):
-            prompt = f"{MY_CONTEXT}\n Draft {doc_type}. Base: {base_contract}. Project: {project}. Parties: {my_comp} vs {other}. Val: {val}. Terms: {extra}."
-            response = model.generate_content(prompt)
-            if current_project: save_text_to_project(current_project, response.text, f"{doc_type}.txt", "Contracts")
+        prompt = f"Draft {doc_type}. Base: {base_contract}. Project: {project}. Parties: {my_comp} vs {other}. Val: {val}. Terms: {extra}."
+        doc_text = generate_draft(prompt, stream=stream_mode, contract_path=governing_contract,
+                                  module="Contract Creator", contract_form=base_contract)
+        if doc_text:
+            if current_project: save_text_to_project(current_project, doc_text, f"{doc_type}.txt", "Contracts")
             st.markdown("---")
-            st.text_area("Result:", value=response.text, height=500)
+            st.text_area("Result:", value=doc_text, height=500)
             
-            pdf = PDF(); pdf.add_page(); pdf.set_font("Arial", size=10)
-            clean_text = response.text.replace("**", "").encode('latin-1', 'replace').decode('latin-1')
-            pdf.multi_cell(0, 5, clean_text)
-            b64 = base64.b64encode(pdf.output(dest='S').encode('latin-1')).decode()
-            st.markdown(f'<a href="data:application/octet-stream;base64,{b64}" download="{doc_type}.pdf"><b>📥 Download PDF</b></a>', unsafe_allow_html=True)
+            st.download_button("📥 Download PDF", export_pdf(doc_text, current_project), file_name=f"{doc_type}.pdf", mime="application/pdf", on_click="ignore")
 
 # ==========================================
 # MODULE 4: COMMERCIAL MANAGER (CASH FLOW)
 # ==========================================
 elif menu == "💰 Commercial Manager (Cash Flow)":
+    import pandas as pd
+    from civilex.cashflow import DEFAULT_TERMS, LiveCashFlow, monte_carlo_cash_flow
+    from civilex.storage import ProjectStore
     st.title("💰 Commercial Manager & Cash Flow")
     st.caption("Combine Contract Clauses with Project Schedule to predict Cash Flow.")
 
@@ -291,14 +626,23 @@ elif menu == "💰 Commercial Manager (Cash Flow)":
     # --- TAB SETUP ---
     tab1, tab2, tab3 = st.tabs(["1. Extract Contract Terms", "2. Project Schedule", "3. Cash Flow Dashboard"])
 
+    # --- LOAD SAVED SCHEDULE & TERMS (only when the project changes) ---
+    if st.session_state.get("cm_project") != current_project:
+        project_store = ProjectStore(os.path.join(PROJECTS_ROOT, current_project))
+        saved_schedule, saved_terms = project_store.load()
+        st.session_state.project_store = project_store
+        st.session_state.cm_project = current_project
+        st.session_state.comm_terms = {**DEFAULT_TERMS, **(saved_terms or {})}
+        if saved_schedule is not None:
+            st.session_state.schedule_df = saved_schedule
+        else:
+            st.session_state.pop("schedule_df", None) # Demo data is filled in below
+    project_store = st.session_state.project_store
+
     # --- GLOBAL VARIABLES FOR THIS SESSION ---
     if "comm_terms" not in st.session_state:
-        st.session_state.comm_terms = {
-            "payment_period": 30, # Default days
-            "honor_cert_period": 14, # Default days
-            "retention_percent": 10.0, # Default %
-            "retention_limit": 5.0 # Default %
-        }
+        st.session_state.comm_terms = dict(DEFAULT_TERMS) # 30/14 days, 10% retention, 5% limit
+    project_store.save_terms_if_changed(st.session_state.comm_terms)
     
     # --- TAB 1: AI CONTRACT SCANNER ---
     with tab1:
@@ -319,12 +663,11 @@ elif menu == "💰 Commercial Manager (Cash Flow)":
 
         # AI TRIGGER
         if contract_file and st.button("🔍 AI: Extract Terms"):
-            with st.spinner("Reading Contract Clauses..."):
-                # Save and Upload
-                with open("temp_contract.pdf", "wb") as f: f.write(contract_file.getbuffer())
-                sample_file = genai.upload_file(path="temp_contract.pdf", display_name="Contract", mime_type="application/pdf")
-                while sample_file.state.name == "PROCESSING": time.sleep(1); sample_file = genai.get_file(sample_file.name)
-
+            with st.spinner("Reading Contract Clauses..."), friendly_api_errors(), \
+                    track(current_project, "Commercial Manager", "terms_extraction", contract_file.name):
+                contract_bytes = contract_file.getvalue()
+                # Keep the contract in the project so it can be picked as the Governing Contract
+                save_to_project(current_project, contract_bytes, contract_file.name, "Contracts")
                 # STRICT JSON PROMPT
                 prompt = """
                 Analyze the attached construction contract. Extract these 4 numerical values.
@@ -336,21 +679,33 @@ elif menu == "💰 Commercial Manager (Cash Flow)":
                 4. 'Limit of Retention' (Percentage of Contract Sum).
                 If not found, use standard PAM 2018 values.
                 """
-                response = model.generate_content([prompt, sample_file])
+                cache = get_response_cache(current_project)
+                cache_key = make_cache_key(contract_bytes, prompt, MODEL_NAME)
+                response_text = cache.get(cache_key)
+
+                if response_text is None:
+                    # Local pre-read: only the Appendix / payment & retention clauses go to the AI
+                    response_text, doc = ask_about_pdf(contract_bytes, prompt, "Contract", profile="terms")
+                    if not isinstance(parse_json_reply(response_text), dict) and doc["mode"] != "full":
+                        # Selected pages weren't enough - fall back to the whole contract
+                        response_text, doc = ask_about_pdf(contract_bytes, prompt, "Contract")
+                    st.caption(f"📄 Sent to AI: {doc['reason']}")
+                else:
+                    metrics.count("cache_hit")
                 
-                try:
-                    # Clean the response to get pure JSON
-                    import json
-                    json_str = response.text.replace("```json", "").replace("```", "").strip()
-                    extracted = json.loads(json_str)
-                    
+                # Clean the response to get pure JSON
+                extracted = parse_json_reply(response_text)
+                if isinstance(extracted, dict):
+                    # Only cache answers we could actually use
+                    cache.put(cache_key, response_text, source=contract_file.name)
+
                     # Update Session State
                     st.session_state.comm_terms.update(extracted)
                     st.success("✅ Terms Extracted! Go to 'Project Schedule' tab.")
                     st.rerun() # Refresh to update the number inputs
-                except:
+                else:
                     st.error("AI read the file but couldn't format the JSON perfectly. Please update the numbers manually above.")
-                    st.write(response.text)
+                    st.write(response_text)
 
    # --- TAB 2: SCHEDULE (PROFIT VS COST) ---
     with tab2:
@@ -360,49 +715,30 @@ elif menu == "💰 Commercial Manager (Cash Flow)":
         st.info("Upload your Work Programme or BQ (PDF) to auto-fill the table.")
         schedule_file = st.file_uploader("Upload Schedule/BQ (PDF)", type=["pdf"], key="sched_pdf")
         
-        if schedule_file and st.button("🚀 AI: Extract Schedule Data"):
-            with st.spinner("Analyzing Schedule/BQ..."):
-                # Save & Upload
-                with open("temp_schedule.pdf", "wb") as f: f.write(schedule_file.getbuffer())
-                sample_file = genai.upload_file(path="temp_schedule.pdf", display_name="Schedule", mime_type="application/pdf")
-                while sample_file.state.name == "PROCESSING": time.sleep(1); sample_file = genai.get_file(sample_file.name)
+        if schedule_file and st.button("⏳ Extract in Background", help="Load the result from Background Jobs in the sidebar when it's done"):
+            get_job_queue().submit("schedule", current_project, f"Schedule: {schedule_file.name}", schedule_job,
+                                   current_project, schedule_file.getvalue(), schedule_file.name)
+            st.toast("Queued. Progress is in the sidebar under Background Jobs.")
 
-                # Prompt for Tabular Data
-                prompt = """
-                Analyze this construction document. Extract the project schedule items.
-                Return ONLY a JSON list of objects.
-                Format: [{"Activity": "Description", "Start Date": "YYYY-MM-DD", "End Date": "YYYY-MM-DD", "Value": 1000.50, "Cost": 800.00}]
-                Rules:
-                1. Look for Activity Names, Dates, and Amounts.
-                2. If "Cost" is not listed, estimate it as 80% of "Value".
-                3. Ensure numbers are floats (allow decimals).
-                """
-                response = model.generate_content([prompt, sample_file])
+        if schedule_file and st.button("🚀 AI: Extract Schedule Data"):
+            with st.spinner("Analyzing Schedule/BQ..."), friendly_api_errors():
+                schedule_bytes = schedule_file.getvalue()
+                response_text, result = extract_schedule_reply(current_project, schedule_bytes, schedule_file.name)
+                extraction_complete = result is None or result["complete"]
+                if result is not None:
+                    if len(result["chunks"]) > 1 or not extraction_complete:
+                        st.caption(f"📄 Extracted in {len(result['chunks'])} page range(s).")
+                    for chunk in result["chunks"]:
+                        if chunk["error"]: st.warning(f"Pages {chunk['pages']}: {chunk['error']}")
+                        if chunk["rejected"]: st.caption(f"Pages {chunk['pages']}: skipped {len(chunk['rejected'])} unreadable item(s).")
                 
                 try:
-                    import json
-                    # Clean markdown formatting if present
-                    json_str = response.text.replace("```json", "").replace("```", "").strip()
-                    extracted_data = json.loads(json_str)
-                    
-                    # Convert to DataFrame
-                    new_df = pd.DataFrame(extracted_data)
-                    
-                    # --- FIX: RENAME COLUMNS TO MATCH APP STANDARD ---
-                    # The AI gives "Value", but we need "Value (RM)"
-                    new_df = new_df.rename(columns={
-                        "Value": "Value (RM)", 
-                        "Cost": "Cost (RM)"
-                    })
-                    
-                    # Fix Dates
-                    new_df["Start Date"] = pd.to_datetime(new_df["Start Date"])
-                    new_df["End Date"] = pd.to_datetime(new_df["End Date"])
-                    
+                    new_df = schedule_frame(response_text)
+
                     # Update Session State
                     st.session_state.schedule_df = new_df
                     st.success(f"✅ Extracted {len(new_df)} activities!")
-                    st.rerun()
+                    if extraction_complete: st.rerun() # Otherwise keep the per-chunk warnings on screen
                 except Exception as e:
                     st.error("AI couldn't perfectly parse the table. It might be too complex. Try manual entry for now.")
                     st.write(e)
@@ -417,6 +753,7 @@ elif menu == "💰 Commercial Manager (Cash Flow)":
                 "Cost (RM)":  [100000.0, 240000.0, 200000.0, 650000.0, 480000.0, 320000.0] 
             }
             st.session_state.schedule_df = pd.DataFrame(data)
+            project_store.mark_unchanged(schedule_df=st.session_state.schedule_df)
 
         # Safety Check: Ensure columns exist before display
         # This prevents the crash if the rename failed or session state is old
@@ -449,6 +786,9 @@ elif menu == "💰 Commercial Manager (Cash Flow)":
             use_container_width=True
         )
         st.session_state.schedule_df = edited_df
+        # Writes Tenders/03_Cost_Analysis/schedule.npz only when the table really changed
+        if project_store.save_schedule_if_changed(edited_df):
+            st.toast("💾 Schedule saved to project.")
         
         # Metrics
         # Wrapped in try/except to prevent crash during editing
@@ -461,6 +801,7 @@ elif menu == "💰 Commercial Manager (Cash Flow)":
             c1.metric("Total Contract Value", f"RM {total_val:,.2f}")
             c2.metric("Total Est. Cost", f"RM {total_cost:,.2f}")
             c3.metric("Projected Profit", f"RM {projected_margin:,.2f}", delta_color="normal")
+            st.caption(f"💾 Auto-saved to {current_project}/Tenders/03_Cost_Analysis/ (used by Portfolio Cash Flow)")
         except KeyError:
             st.warning("Resetting table structure...")
             del st.session_state.schedule_df
@@ -473,70 +814,39 @@ elif menu == "💰 Commercial Manager (Cash Flow)":
         # New: Input your starting position
         start_balance = st.number_input("Starting Bank Balance / Overdraft (RM)", value=0.0, step=1000.0)
 
-        if st.button("🚀 Run Simulation"):
-            # 1. GET VARIABLES
-            df = st.session_state.schedule_df.copy()
-            pay_lag = st.session_state.comm_terms['payment_period'] + st.session_state.comm_terms['honor_cert_period']
-            ret_percent = st.session_state.comm_terms['retention_percent'] / 100
-            ret_limit_percent = st.session_state.comm_terms['retention_limit'] / 100
-            contract_sum = df['Value (RM)'].sum()
-            max_retention = contract_sum * ret_limit_percent
-
-            # 2. CALCULATE DATES
-            df['End Date'] = pd.to_datetime(df['End Date'])
-            df['Cash In Date'] = df['End Date'] + pd.Timedelta(days=pay_lag)
-            df['Cash Out Date'] = df['End Date'] # Assumes you pay suppliers same month (Conservative)
-            
-            # 3. CALCULATE AMOUNTS (WITH RETENTION CAP)
-            df['Gross Claim'] = df['Value (RM)']
-            
-            # Smart Retention Logic: Don't deduct if we already hit the limit
-            cumulative_retention = 0
-            retention_deductions = []
-            
-            for val in df['Gross Claim']:
-                potential_cut = val * ret_percent
-                if cumulative_retention + potential_cut > max_retention:
-                    actual_cut = max_retention - cumulative_retention
-                    cumulative_retention = max_retention
-                elif cumulative_retention >= max_retention:
-                    actual_cut = 0
-                else:
-                    actual_cut = potential_cut
-                    cumulative_retention += actual_cut
-                retention_deductions.append(actual_cut)
-            
-            df['Retention'] = retention_deductions
-            df['Net Cash In'] = df['Gross Claim'] - df['Retention']
-            
-            # 4. PREPARE TIMELINE DATA
-            # A. Construction Cash Flow
-            inflow = df[['Cash In Date', 'Net Cash In']].rename(columns={'Cash In Date': 'Date', 'Net Cash In': 'Amount'})
-            inflow['Type'] = 'Progress Payment'
-            
-            outflow = df[['Cash Out Date', 'Cost (RM)']].rename(columns={'Cash Out Date': 'Date', 'Cost (RM)': 'Amount'})
-            outflow['Amount'] = outflow['Amount'] * -1 
-            outflow['Type'] = 'Expenses'
-
-            # B. Retention Release (The "Bonus" Check)
-            # Assumption: 50% at last activity end, 50% 12 months later
-            last_date = df['End Date'].max()
-            ret_release_1 = {'Date': last_date + pd.Timedelta(days=pay_lag), 'Amount': cumulative_retention * 0.5, 'Type': 'Retention Release (CPC)'}
-            ret_release_2 = {'Date': last_date + pd.Timedelta(days=365), 'Amount': cumulative_retention * 0.5, 'Type': 'Retention Release (CMGD)'}
-            
-            # Combine all flows
-            timeline_data = [inflow, outflow, pd.DataFrame([ret_release_1, ret_release_2])]
-            timeline = pd.concat(timeline_data)
-            
-            timeline['Date'] = pd.to_datetime(timeline['Date'])
-            timeline['Month'] = timeline['Date'].dt.to_period('M')
-            
-            # 5. AGGREGATE
-            monthly_flow = timeline.groupby('Month')['Amount'].sum().reset_index()
-            monthly_flow['Month_Str'] = monthly_flow['Month'].astype(str)
-            
-            # Add Starting Balance to the first month calculation
-            monthly_flow['Cumulative Balance'] = monthly_flow['Amount'].cumsum() + start_balance
+        # How value & cost are booked: lump on End Date, or spread over each activity's duration
+        d1, d2 = st.columns(2)
+        with d1:
+            spread = st.radio("Value/Cost Booking:", ["Lump sum at End Date", "Linear over duration", "S-curve over duration"], horizontal=True)
+        with d2:
+            resolution = st.radio("Resolution:", ["Monthly", "Daily"], horizontal=True, help="Daily also checks the bank balance day by day (catches mid-month overdraft peaks).")
+        distribution = {"Lump sum at End Date": "lump", "Linear over duration": "linear", "S-curve over duration": "s-curve"}[spread]
+
+        # Optional: thousands of "what if the S.O. certifies late / client pays late" scenarios
+        with st.expander("🎲 Payment Delay Risk (Monte Carlo)", expanded=False):
+            run_mc = st.checkbox("Also run delay scenarios", value=False)
+            m1, m2, m3 = st.columns(3)
+            with m1:
+                mc_runs = st.number_input("Scenarios", min_value=100, max_value=50000, value=10000, step=1000)
+            with m2:
+                mc_cert = st.number_input("Avg. extra certification delay (days)", min_value=0.0, value=14.0, step=1.0)
+                mc_pay = st.number_input("Avg. extra payment delay (days)", min_value=0.0, value=21.0, step=1.0)
+            with m3:
+                mc_over = st.number_input("Avg. cost overrun (%)", value=0.0, step=1.0)
+                mc_over_sd = st.number_input("Overrun spread (± %)", min_value=0.0, value=5.0, step=1.0)
+
+        live_mode = st.toggle("⚡ Live update while editing", value=True, help="Charts follow every edit in the Project Schedule table.")
+        if live_mode or st.button("🚀 Run Simulation"):
+            # 1-5. SIMULATE (see civilex/cashflow.py) - only rows changed since the last run are re-booked
+            if "cash_engine" not in st.session_state:
+                st.session_state.cash_engine = LiveCashFlow()
+            cash_engine = st.session_state.cash_engine
+            cash_engine.configure(st.session_state.comm_terms, start_balance, distribution, resolution.lower())
+            monthly_flow, cf_summary = cash_engine.update(st.session_state.schedule_df)
+            cumulative_retention = cf_summary["total_retention"]
+            if monthly_flow.empty:
+                st.warning("No activities with an End Date to simulate.")
+                st.stop()
             
             # 6. VISUALIZE
             st.write("### 📊 Cash Flow Forecast")
@@ -550,7 +860,7 @@ elif menu == "💰 Commercial Manager (Cash Flow)":
             st.line_chart(monthly_flow, x='Month_Str', y='Cumulative Balance')
             
             # 7. METRICS
-            min_bal = monthly_flow['Cumulative Balance'].min()
+            min_bal = cf_summary.get("min_balance_daily", monthly_flow['Cumulative Balance'].min())
             
             st.markdown("---")
             c1, c2, c3 = st.columns(3)
@@ -561,4 +871,211 @@ elif menu == "💰 Commercial Manager (Cash Flow)":
                 st.error(f"You will run out of cash. You need a facility of at least RM {abs(min_bal):,.0f}.")
             else:
                 c2.metric("Lowest Bank Balance", f"RM {min_bal:,.2f}", delta="SAFE")
-                st.success("✅ You are cashflow positive throughout.")
\ No newline at end of file
+                st.success("✅ You are cashflow positive throughout.")
+
+            # 8. DELAY RISK (MONTE CARLO) - too heavy to repeat on every edit in live mode
+            if run_mc and (not live_mode or st.button("🎲 Run Delay Scenarios")):
+                with st.spinner(f"Running {int(mc_runs):,} delay scenarios..."):
+                    mc = monte_carlo_cash_flow(st.session_state.schedule_df, st.session_state.comm_terms, start_balance,
+                                               n_scenarios=int(mc_runs), cert_delay_days=mc_cert, pay_delay_days=mc_pay,
+                                               overrun_mean_pct=mc_over, overrun_sd_pct=mc_over_sd, distribution=distribution)
+                if mc["percentiles"]:
+                    c3.metric("🎲 P90 Overdraft (with delays)", f"RM {mc['percentiles'][90]['overdraft']:,.0f}")
+                    st.caption("Overdraft needed if certification/payment slips (P90 = enough in 9 out of 10 scenarios)")
+                    p1, p2, p3 = st.columns(3)
+                    for col, p in zip((p1, p2, p3), (50, 90, 99)):
+                        col.metric(f"P{p} Lowest Balance", f"RM {mc['percentiles'][p]['min_balance']:,.0f}",
+                                   delta=f"Overdraft RM {mc['percentiles'][p]['overdraft']:,.0f}", delta_color="off")
+
+# ==========================================
+# MODULE 5: PORTFOLIO CASH FLOW (ALL PROJECTS)
+# ==========================================
+elif menu == "🏢 Portfolio Cash Flow":
+    from civilex.portfolio import simulate_portfolio
+    st.title("🏢 Portfolio Cash Flow")
+    st.caption("One overdraft facility, every job. Uses each project's saved schedule & terms (saved automatically by the Commercial Manager).")
+
+    selected = st.multiselect("Projects:", project_list, default=project_list)
+    col1, col2 = st.columns(2)
+    with col1: company_balance = st.number_input("Company Bank Balance / Facility Used (RM)", value=0.0, step=10000.0)
+    with col2: spread = st.radio("Value/Cost Booking:", ["Lump sum at End Date", "Linear over duration", "S-curve over duration"], horizontal=True)
+    distribution = {"Lump sum at End Date": "lump", "Linear over duration": "linear", "S-curve over duration": "s-curve"}[spread]
+
+    if st.button("🚀 Run Portfolio Simulation") and selected:
+        with st.spinner(f"Simulating {len(selected)} projects..."):
+            result = simulate_portfolio(PROJECTS_ROOT, selected, company_balance, distribution=distribution)
+
+        if result["skipped"]:
+            st.caption("Skipped: " + ", ".join(f"{name} ({why})" for name, why in result["skipped"].items()))
+        if result["ledger"].empty:
+            st.warning("No project has a saved schedule yet.")
+            st.stop()
+
+        ledger = result["ledger"]
+        project_cols = [c for c in ledger.columns if c not in ("Month", "Month_Str", "Total", "Cumulative Balance")]
+
+        st.write("### 📊 Company Cash Flow")
+        st.caption("Monthly Net Flow by Project")
+        st.bar_chart(ledger, x="Month_Str", y=project_cols)
+        st.caption("Company Bank Balance (All Projects)")
+        st.line_chart(ledger, x="Month_Str", y="Cumulative Balance")
+
+        st.markdown("---")
+        c1, c2 = st.columns(2)
+        if result["peak_balance"] < 0:
+            c1.metric("⚠️ Peak Funding Requirement", f"RM {abs(result['peak_balance']):,.0f}", delta="-CRITICAL")
+        else:
+            c1.metric("Lowest Company Balance", f"RM {result['peak_balance']:,.0f}", delta="SAFE")
+        c2.metric("Peak Month", result["peak_month"])
+
+        st.write("### 🔎 Who Drives the Peak")
+        st.dataframe(result["drivers"], use_container_width=True)
+
+# ==========================================
+# MODULE 6: TENDER COMPARISON
+# ==========================================
+elif menu == "📊 Tender Comparison":
+    st.title("📊 Supplier Quote Comparison")
+    st.caption("Every quote in Tenders/02_Supplier_Quotes is matched against the BQ in Tenders/01_BQ_Documents. "
+               "Put each supplier's files in their own subfolder (or name the file after the supplier).")
+    if not current_project:
+        st.warning("Select a project first.")
+        st.stop()
+
+    from civilex import tender
+    project_folder = os.path.join(PROJECTS_ROOT, current_project)
+    bq_files = tender.find_documents(os.path.join(project_folder, tender.BQ_FOLDER))
+    quote_files = tender.find_documents(os.path.join(project_folder, tender.QUOTES_FOLDER))
+    c1, c2 = st.columns(2)
+    c1.metric("BQ Documents", len(bq_files))
+    c2.metric("Quote Files", len(quote_files))
+
+    col1, col2 = st.columns(2)
+    with col1: min_score = st.slider("Minimum Match Score", 0.2, 0.9, tender.MIN_SCORE, 0.05,
+                                     help="Quote lines scoring below this against every BQ item are treated as not quoted.")
+    with col2: use_ai = st.checkbox("🤖 Use AI for scanned quotes", value=False,
+                                    help="Only PDFs without a text layer are sent to the AI; readable files never are.")
+
+    if st.button("⚖️ Compare Quotes", disabled=not (bq_files and quote_files)):
+        progress = st.progress(0.0, text="Reading quotes...")
+        def on_progress(done, total, path):
+            progress.progress(done / total, text=f"Reading quotes... {done}/{total} ({os.path.basename(path)})")
+        with friendly_api_errors(), st.spinner("Matching quote lines to the BQ..."), \
+                track(current_project, "Tender Comparison", "quote_comparison"):
+            st.session_state.tender_result = tender.run_comparison(
+                project_folder, extract_fn=extract_quote_lines if use_ai else None,
+                cache=get_response_cache(current_project), min_score=min_score, on_progress=on_progress)
+            get_project_index().refresh_project(current_project)
+        progress.empty()
+
+    result = st.session_state.get("tender_result")
+    if result:
+        for path, error in result["failed"].items():
+            st.caption(f"⚠️ Could not read {os.path.basename(path)}: {error}")
+        if result["summary"] is None:
+            st.warning("No BQ items or no quote lines could be read. Scanned PDFs need the AI option; Excel files need openpyxl.")
+        else:
+            st.success(f"{result['lines']:,} quote lines matched against {result['bq_items']:,} BQ items. "
+                       f"Saved to {current_project}/{tender.ANALYSIS_FOLDER}/")
+            st.write("### 🏷️ Suppliers")
+            st.dataframe(result["summary"], use_container_width=True, hide_index=True)
+            st.write("### 📋 Rate Comparison")
+            only_gaps = st.toggle("Only items with missing quotes")
+            comparison = result["comparison"]
+            st.dataframe(comparison[comparison["Missing From"] != ""] if only_gaps else comparison,
+                         use_container_width=True, hide_index=True)
+            d1, d2, d3 = st.columns(3)
+            for column, name in zip((d1, d2, d3), (tender.COMPARISON_NAME, tender.SUMMARY_NAME, tender.LINES_NAME)):
+                path = result["paths"].get(name)
+                if path and os.path.exists(path):
+                    with open(path, "rb") as f:
+                        column.download_button(f"📥 {name}", f.read(), file_name=name, mime="text/csv", on_click="ignore")
+
+# ==========================================
+# MODULE 7: SEARCH CORRESPONDENCE
+# ==========================================
+elif menu == "🔎 Search Correspondence":
+    st.title("🔎 Search Correspondence")
+    st.caption("Letters, drafts, contracts and audit reports saved in your projects.")
+
+    document_search = get_document_search()
+    col1, col2 = st.columns([3, 1])
+    with col1: query = st.text_input("Search:", placeholder="e.g., EOT inclement weather clause 43")
+    with col2: scope = st.radio("Scope:", ["This Project", "All Projects"], disabled=not current_project)
+    kinds = st.multiselect("Only:", ["Incoming Letters", "Outgoing Drafts", "Contracts", "Audit Report"])
+
+    if current_project and st.button("🔄 Re-index This Project"):
+        with st.spinner("Indexing..."):
+            n = document_search.sync_project(os.path.join(PROJECTS_ROOT, current_project), current_project)
+        st.success(f"Indexed {n} new/changed file(s).")
+
+    if query:
+        project_filter = current_project if (current_project and scope == "This Project") else None
+        hits = document_search.search(query, project=project_filter, limit=25, kinds=kinds or None)
+        if not hits:
+            st.info("No matches. Try fewer or different words (or re-index the project).")
+        for hit in hits:
+            st.markdown(f"**{hit['title']}** · {hit['kind']} · _{hit['project']}_")
+            st.markdown(hit["snippet"])
+            with st.expander("Show passage"):
+                st.text(hit["passage"])
+
+# ==========================================
+# MODULE 8: OPERATIONS METRICS
+# ==========================================
+elif menu == "📈 Operations Metrics":
+    import pandas as pd
+    st.title("📈 Operations Metrics")
+    st.caption("Where the time goes in every AI operation: file writes, uploads, PROCESSING waits, "
+               "generate_content, JSON parsing and PDF rendering. Recorded locally in .civilex/metrics/.")
+
+    store = get_metrics_store()
+    known = store.projects()
+    col1, col2 = st.columns(2)
+    with col1: picked = st.multiselect("Projects:", known, default=[current_project] if current_project in known else known)
+    with col2: period = st.radio("Period:", ["24 hours", "7 days", "30 days", "All"], index=1, horizontal=True)
+    days = {"24 hours": 1, "7 days": 7, "30 days": 30, "All": None}[period]
+    records = store.load(picked, since=time.time() - days * 86400 if days else None)
+    if not records:
+        st.info("No operations recorded yet for this selection.")
+        st.stop()
+
+    frame = metrics.stage_frame(records)
+    totals = frame[frame["stage"] == "total"]
+    stages = frame[frame["stage"] != "total"]
+    cache_hits = sum(r.get("counters", {}).get("cache_hit", 0) for r in records)
+    c1, c2, c3, c4, c5 = st.columns(5)
+    c1.metric("Operations", f"{len(records):,}")
+    c2.metric("Errors", f"{totals['error'].count() / len(totals) * 100:.1f}%")
+    c3.metric("p95 per Operation", f"{totals['duration'].quantile(0.95):.1f} s")
+    c4.metric("Uploaded", f"{stages.loc[stages['stage'] == 'upload', 'bytes'].sum() / 1e6:,.1f} MB")
+    c5.metric("Answered from Cache", f"{cache_hits / len(records) * 100:.0f}%")
+
+    st.write("### ⏱️ By Stage")
+    by_stage = metrics.percentile_table(stages, "stage")
+    if not by_stage.empty:
+        order = {name: i for i, name in enumerate(metrics.STAGES)}
+        by_stage = by_stage.sort_values("stage", key=lambda col: col.map(order).fillna(len(order)))
+        st.dataframe(by_stage, use_container_width=True, hide_index=True)
+        st.bar_chart(by_stage, x="stage", y="Total (s)")
+
+    st.write("### 🧩 By Module")
+    st.dataframe(metrics.percentile_table(totals, ["module", "operation"]), use_container_width=True, hide_index=True)
+
+    st.write("### 📜 By Contract Type")
+    st.dataframe(metrics.percentile_table(totals, "contract_type"), use_container_width=True, hide_index=True)
+
+    st.write("### 📉 Daily p95 (spot regressions)")
+    daily = frame.assign(day=frame["time"].dt.date).pivot_table(index="day", columns="stage", values="duration",
+                                                                 aggfunc=lambda v: v.quantile(0.95))
+    st.line_chart(daily)
+
+    counters = pd.DataFrame([r.get("counters", {}) for r in records]).sum()
+    if not counters.empty:
+        st.caption("Counters: " + " · ".join(f"{name} {int(n):,}" for name, n in counters.items()))
+    with st.expander("🧾 Recent Operations"):
+        recent = totals.sort_values("ts", ascending=False).head(200)
+        st.dataframe(recent[["time", "project", "module", "operation", "contract_type", "duration", "error"]],
+                     use_container_width=True, hide_index=True)
+    st.download_button("📥 Stage Timings (CSV)", frame.drop(columns=["ts"]).to_csv(index=False), file_name="civilex_metrics.csv",
+                       mime="text/csv", on_click="ignore")
@@ -0,0 +1 @@
+# Civilex-Core helper modules (kept out of app.py so they can be reused and tested outside Streamlit)
@@ -0,0 +1,232 @@
+import contextlib
+import io
+import json
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+from types import SimpleNamespace
+
+# --- MODEL BACKENDS ---
+# Everything the app needs from an AI provider: upload a file, poll it, build a
+# model and generate (optionally streaming), plus context caching. The Gemini
+# backend wraps google.generativeai; the stub backend talks to the local
+# stand-in server (python -m civilex.stub_server) so the app and the benchmark
+# suite can run without a key or quota.
+#
+#   CIVILEX_BACKEND=stub CIVILEX_STUB_URL=http://127.0.0.1:8765 streamlit run app.py
+
+
+class BackendError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class RateLimitError(BackendError):
+    pass
+
+
+def _google_error_types():
+    # google.api_core errors (5xx, InvalidArgument, PermissionDenied...) plus the
+    # discovery client's HttpError that older upload_file versions raise
+    types = []
+    try:
+        from google.api_core.exceptions import GoogleAPICallError
+        types.append(GoogleAPICallError)
+    except ImportError:
+        pass
+    try:
+        from googleapiclient.errors import HttpError
+        types.append(HttpError)
+    except ImportError:
+        pass
+    return tuple(types)
+
+
+@contextlib.contextmanager
+def api_errors(error_types):
+    """Re-raises provider errors as BackendError / RateLimitError (status = HTTP code)."""
+    try:
+        yield
+    except error_types as e:
+        status = getattr(e, "code", None)
+        if not isinstance(status, int):
+            status = getattr(getattr(e, "resp", None), "status", None)
+        status = int(status) if status else None
+        error_class = RateLimitError if status == 429 else BackendError
+        raise error_class(f"{type(e).__name__}: {e}", status=status) from e
+
+
+class GeminiStream:
+    def __init__(self, response, error_types):
+        self.response = response
+        self.error_types = error_types
+
+    def __iter__(self):
+        with api_errors(self.error_types):
+            yield from self.response
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+
+class GeminiModel:
+    def __init__(self, model, error_types):
+        self.model = model
+        self.error_types = error_types
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        with api_errors(self.error_types):
+            response = self.model.generate_content(contents, stream=stream, **kwargs)
+        return GeminiStream(response, self.error_types) if stream else response
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class GeminiBackend:
+    name = "gemini"
+
+    def __init__(self, api_key):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self.error_types = _google_error_types()
+
+    def upload_file(self, source, display_name=None, mime_type=None):
+        with api_errors(self.error_types):
+            return self.genai.upload_file(source, display_name=display_name, mime_type=mime_type)
+
+    def get_file(self, name):
+        with api_errors(self.error_types):
+            return self.genai.get_file(name)
+
+    def model(self, model_name):
+        return GeminiModel(self.genai.GenerativeModel(model_name=model_name), self.error_types)
+
+    def cache_backend(self, model_name):
+        from civilex.context_cache import GeminiCacheBackend
+        return GeminiCacheBackend(self.genai, model_name, self.error_types)
+
+
+# --- STUB (LOCAL STAND-IN SERVER) ---
+
+def _file_handle(data):
+    return SimpleNamespace(name=data["name"], display_name=data.get("display_name"),
+                           state=SimpleNamespace(name=data["state"]), size_bytes=data.get("size_bytes", 0))
+
+
+class _StubResponse:
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(**(usage or {}))
+
+
+class _StubStream:
+    def __init__(self, lines):
+        self._lines = lines
+        self.text = ""
+
+    def __iter__(self):
+        for line in self._lines:
+            line = line.strip()
+            if not line:
+                continue
+            chunk = json.loads(line)
+            self.text += chunk["text"]
+            yield _StubResponse(chunk["text"], chunk.get("usage"))
+
+
+class StubModel:
+    def __init__(self, backend, model_name, cached_content=None):
+        self.backend = backend
+        self.model_name = model_name
+        self.cached_content = cached_content
+
+    def generate_content(self, contents, stream=False):
+        parts = []
+        for part in contents if isinstance(contents, list) else [contents]:
+            if isinstance(part, str):
+                parts.append({"text": part})
+            else:
+                parts.append({"file": part.name})
+        body = {"model": self.model_name, "parts": parts, "stream": stream, "cached_content": self.cached_content}
+        if stream:
+            return _StubStream(self.backend._request("POST", "/generate", body, stream=True))
+        data = self.backend._request("POST", "/generate", body)
+        return _StubResponse(data["text"], data.get("usage"))
+
+
+class StubCacheBackend:
+    def __init__(self, backend, model_name):
+        self.backend = backend
+        self.model_name = model_name
+
+    def create(self, system_instruction, contents, ttl_seconds, display_name):
+        files = [c.name for c in contents or []]
+        data = self.backend._request("POST", "/caches", {"system_instruction": system_instruction, "files": files,
+                                                         "ttl": ttl_seconds, "display_name": display_name})
+        return data["name"]
+
+    def model_for(self, handle):
+        return StubModel(self.backend, self.model_name, cached_content=handle)
+
+    def extend(self, handle, ttl_seconds):
+        self.backend._request("POST", f"/{handle}:extend", {"ttl": ttl_seconds})
+
+    def delete(self, handle):
+        self.backend._request("DELETE", f"/{handle}")
+
+
+class StubBackend:
+    name = "stub"
+
+    def __init__(self, base_url="http://127.0.0.1:8765", timeout=120):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, method, path, body=None, raw=None, headers=None, stream=False):
+        data = raw if raw is not None else (json.dumps(body).encode() if body is not None else None)
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers or {"Content-Type": "application/json"})
+        try:
+            resp = urllib.request.urlopen(req, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            message = e.read().decode(errors="replace")
+            if e.code == 429:
+                raise RateLimitError(f"429 Resource exhausted: {message}", status=429) from None
+            raise BackendError(f"{e.code} {message}", status=e.code) from None
+        except OSError as e:  # URLError (refused, not running) and socket timeouts
+            raise BackendError(f"Stub server at {self.base_url} unreachable: {getattr(e, 'reason', e)}") from e
+        if stream:
+            return (line.decode() for line in resp)
+        with resp:
+            payload = resp.read()
+        return json.loads(payload) if payload else {}
+
+    def upload_file(self, source, display_name=None, mime_type=None):
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                data = f.read()
+        elif isinstance(source, io.IOBase):
+            data = source.read()
+        else:
+            data = bytes(source)
+        headers = {"Content-Type": mime_type or "application/octet-stream", "X-Display-Name": urllib.parse.quote(display_name or "file")}
+        return _file_handle(self._request("POST", "/files", raw=data, headers=headers))
+
+    def get_file(self, name):
+        return _file_handle(self._request("GET", f"/{name}"))
+
+    def model(self, model_name):
+        return StubModel(self, model_name)
+
+    def cache_backend(self, model_name):
+        return StubCacheBackend(self, model_name)
+
+
+def make_backend(api_key=None, kind=None):
+    kind = kind or os.environ.get("CIVILEX_BACKEND", "gemini")
+    if kind == "stub":
+        return StubBackend(os.environ.get("CIVILEX_STUB_URL", "http://127.0.0.1:8765"))
+    return GeminiBackend(api_key)
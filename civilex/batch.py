@@ -0,0 +1,128 @@
+import csv
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# --- BATCH FORENSIC AUDIT ---
+# Audits every PDF in a folder (e.g. <project>/Incoming_Letters) on a bounded
+# thread pool. Each letter gets "<name>_Forensic_Report.md" next to it and the
+# run writes/refreshes a summary index for the whole folder.
+
+REPORT_SUFFIX = "_Forensic_Report.md"
+INDEX_NAME = "_Audit_Index.csv"
+INDEX_COLUMNS = ["File", "Form Detected", "LAD Flag", "Payment Flag", "Design Liability Flag", "Status"]
+
+# Appended to the audit prompt so the summary can be read without a second call
+SUMMARY_INSTRUCTION = """
+At the very end, add ONE line exactly like this (JSON, no markdown):
+SUMMARY_JSON: {"form": "PWD 203A Rev 2010", "lad_flag": true, "payment_flag": false, "design_liability_flag": false}
+Set a flag to true if that clause is missing, capped wrongly, void (e.g. Pay-When-Paid under CIPAA) or otherwise risky.
+"""
+
+_SUMMARY_RE = re.compile(r"SUMMARY_JSON:\s*(\{.*?\})", re.DOTALL)
+
+
+def report_path_for(pdf_path):
+    return os.path.splitext(pdf_path)[0] + REPORT_SUFFIX
+
+
+def find_pdfs(folder, skip_done=True):
+    found = []
+    for root, _dirs, files in os.walk(folder):
+        for name in sorted(files):
+            if not name.lower().endswith(".pdf"):
+                continue
+            path = os.path.join(root, name)
+            if skip_done and os.path.exists(report_path_for(path)):
+                continue
+            found.append(path)
+    return found
+
+
+def parse_summary(report_text):
+    # Returns (report without the summary line, summary dict)
+    summary = {"form": "Unknown", "lad_flag": None, "payment_flag": None, "design_liability_flag": None}
+    match = _SUMMARY_RE.search(report_text or "")
+    if not match:
+        return report_text, summary
+    try:
+        summary.update(json.loads(match.group(1)))
+    except ValueError:
+        pass
+    body = (report_text[:match.start()] + report_text[match.end():]).rstrip()
+    return body, summary
+
+
+def _flag(value):
+    if value is None:
+        return "?"
+    return "⚠️ YES" if value else "OK"
+
+
+def write_index(folder):
+    # Rebuilt from the reports on disk, so earlier runs and skipped files stay listed
+    rows = []
+    for root, _dirs, files in os.walk(folder):
+        for name in sorted(files):
+            if not name.endswith(REPORT_SUFFIX):
+                continue
+            with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+                _body, summary = parse_summary(f.read())
+            source = os.path.relpath(os.path.join(root, name[:-len(REPORT_SUFFIX)] + ".pdf"), folder)
+            rows.append({
+                "File": source,
+                "Form Detected": summary.get("form") or "Unknown",
+                "LAD Flag": _flag(summary.get("lad_flag")),
+                "Payment Flag": _flag(summary.get("payment_flag")),
+                "Design Liability Flag": _flag(summary.get("design_liability_flag")),
+                "Status": "Audited",
+            })
+
+    index_path = os.path.join(folder, INDEX_NAME)
+    with open(index_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=INDEX_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return index_path, rows
+
+
+def _audit_one(pdf_path, audit_fn):
+    with open(pdf_path, "rb") as f:
+        data = f.read()
+    report = audit_fn(data, os.path.basename(pdf_path))
+    # Keep the SUMMARY_JSON line in the saved report so write_index can read it back
+    with open(report_path_for(pdf_path), "w", encoding="utf-8") as f:
+        f.write(report)
+    return report
+
+
+def run_batch_audit(folder, audit_fn, max_workers=4, skip_done=True, on_progress=None):
+    """Audit every pending PDF under folder.
+
+    audit_fn(pdf_bytes, file_name) -> report text (should follow SUMMARY_INSTRUCTION).
+    on_progress(done, total, pdf_path, error) is called from the calling thread,
+    so it is safe to update Streamlit widgets from it.
+    """
+    pending = find_pdfs(folder, skip_done=skip_done)
+    errors = {}
+    done = 0
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="civilex-audit") as pool:
+            futures = {pool.submit(_audit_one, path, audit_fn): path for path in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                error = future.exception()
+                if error is not None:
+                    errors[path] = error
+                done += 1
+                if on_progress:
+                    on_progress(done, len(pending), path, error)
+
+    index_path, rows = write_index(folder)
+    for path, error in errors.items():
+        rows.append({
+            "File": os.path.relpath(path, folder), "Form Detected": "", "LAD Flag": "",
+            "Payment Flag": "", "Design Liability Flag": "", "Status": f"Failed: {error}",
+        })
+    return {"audited": len(pending) - len(errors), "failed": errors, "index_path": index_path, "rows": rows}
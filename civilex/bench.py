@@ -0,0 +1,223 @@
+import argparse
+import io
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from civilex import pdftext
+from civilex.backend import make_backend, StubBackend
+from civilex.knowledge import FORENSIC_PROMPT, SCHEDULE_PROMPT
+from civilex.extraction import extract_schedule_items, salvage_json_objects
+from civilex.scheduler import RequestScheduler, ScheduledBackend
+from civilex.uploads import wait_until_active
+
+# --- LATENCY BENCHMARK HARNESS ---
+# Replays a request mix (scan / draft / extract_terms / extract_schedule) against
+# a backend - by default a stub server started in-process - and reports p50/p95
+# per pipeline stage and end to end.
+#
+#   python -m civilex.bench --mix benchmarks/default_mix.json --concurrency 4 --repeat 3
+#   python -m civilex.bench --backend gemini --api-key $GOOGLE_API_KEY --repeat 1
+
+MODEL_NAME = "models/gemini-2.0-flash"
+
+PROMPTS = {
+    "scan": FORENSIC_PROMPT,
+    "draft": "Draft Letter. Context: PWD 203A (Federal) - Rev 1/2010 (Current). Goal: Claim for EOT due to rain.",
+    "extract_terms": "Analyze the attached construction contract. Extract these 4 numerical values. Return ONLY a JSON string.",
+    "extract_schedule": SCHEDULE_PROMPT,
+}
+
+
+def synthetic_pdf(pages, kind="letter"):
+    """Text-layer PDF shaped like the real inputs (uses fpdf, as the app does)."""
+    from fpdf import FPDF
+    pdf = FPDF()
+    pdf.set_font("Arial", size=9)
+    for i in range(pages):
+        pdf.add_page()
+        if kind == "bq" and i % 3 != 0:
+            rows = "\n".join(f"{i}.{j} Reinforced concrete grade 30 to column  12.5 m3  285.00  3,562.50" for j in range(40))
+            pdf.multi_cell(0, 4, "BILL OF QUANTITIES   Item  Description  Qty  Unit  Rate  Amount (RM)\n" + rows)
+        elif kind == "contract" and i == pages - 2:
+            pdf.multi_cell(0, 4, "APPENDIX - Contract Particulars\nPeriod of Honouring Certificates: 21 days\n"
+                                 "Period of Payment: 30 days\nRetention: 10%  Limit of Retention: 5% of Contract Sum\n" * 4)
+        else:
+            pdf.multi_cell(0, 4, "General conditions. The Contractor shall carry out and complete the Works. " * 30)
+    return pdf.output(dest="S").encode("latin-1")
+
+
+class StageTimer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}  # (op, stage) -> [seconds]
+
+    def record(self, op, stage, seconds):
+        with self.lock:
+            self.samples.setdefault((op, stage), []).append(seconds)
+
+    def stage(self, op, stage):
+        timer = self
+
+        class _Stage:
+            def __enter__(self):
+                self.t0 = time.perf_counter()
+
+            def __exit__(self, *exc):
+                timer.record(op, stage, time.perf_counter() - self.t0)
+        return _Stage()
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _upload(backend, timer, op, data, name):
+    with timer.stage(op, "upload"):
+        handle = backend.upload_file(io.BytesIO(data), display_name=name, mime_type="application/pdf")
+    with timer.stage(op, "poll"):
+        return wait_until_active(backend, handle, first_delay=0.25)
+
+
+def run_request(backend, model, timer, request, documents):
+    op = request["op"]
+    t0 = time.perf_counter()
+    data = documents.get(request.get("doc"))
+
+    if op == "scan":
+        handle = _upload(backend, timer, op, data, "Scan")
+        with timer.stage(op, "generate"):
+            model.generate_content([PROMPTS[op], handle]).text
+
+    elif op == "draft":
+        payload = [PROMPTS[op]]
+        if data is not None:
+            payload.append(_upload(backend, timer, op, data, "Context"))
+        start = time.perf_counter()
+        first = None
+        for chunk in model.generate_content(payload, stream=True):
+            if first is None and chunk.text:
+                first = time.perf_counter() - start
+                timer.record(op, "first_token", first)
+        timer.record(op, "generate", time.perf_counter() - start)
+
+    elif op == "extract_terms":
+        with timer.stage(op, "local_preprocess"):
+            doc = pdftext.prepare_document(data, "terms")
+        if doc["mode"] == "text":
+            payload = [PROMPTS[op], doc["text"]]
+        else:
+            payload = [PROMPTS[op], _upload(backend, timer, op, doc["pdf_bytes"] or data, "Contract")]
+        with timer.stage(op, "generate"):
+            text = model.generate_content(payload).text
+        with timer.stage(op, "parse"):
+            salvage_json_objects(text)
+
+    elif op == "extract_schedule":
+        def extract_chunk(pdf_bytes, label, note):
+            handle = _upload(backend, timer, op, pdf_bytes, f"Schedule {label}")
+            with timer.stage(op, "generate"):
+                return model.generate_content([PROMPTS[op] + note, handle]).text
+        with timer.stage(op, "extract_pipeline"):
+            extract_schedule_items(data, extract_chunk)
+    else:
+        raise ValueError(f"Unknown op {op!r}")
+
+    timer.record(op, "end_to_end", time.perf_counter() - t0)
+
+
+def load_mix(path):
+    with open(path, "r", encoding="utf-8") as f:
+        mix = json.load(f)
+    documents = {}
+    for name, spec in mix.get("documents", {}).items():
+        if "path" in spec:
+            with open(spec["path"], "rb") as f:
+                documents[name] = f.read()
+        else:
+            documents[name] = synthetic_pdf(spec.get("pages", 3), spec.get("kind", "letter"))
+    return mix["requests"], documents
+
+
+def run_benchmark(requests, documents, backend, concurrency=4, repeat=1, seed=0):
+    model = backend.model(MODEL_NAME)
+    timer = StageTimer()
+    replay = [r for _ in range(repeat) for r in requests]
+    random.Random(seed).shuffle(replay)  # Interleave ops like real traffic
+    errors = []
+
+    def one(request):
+        try:
+            run_request(backend, model, timer, request, documents)
+        except Exception as e:
+            errors.append((request["op"], repr(e)))
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, replay))
+    return timer, errors, time.perf_counter() - t0
+
+
+def format_report(timer, errors, wall_seconds, total):
+    lines = [f"{'op':<18}{'stage':<18}{'n':>5}{'p50 (s)':>10}{'p95 (s)':>10}{'max (s)':>10}"]
+    for (op, stage), values in sorted(timer.samples.items()):
+        lines.append(f"{op:<18}{stage:<18}{len(values):>5}{percentile(values, 50):>10.3f}"
+                     f"{percentile(values, 95):>10.3f}{max(values):>10.3f}")
+    lines.append(f"\n{total} requests in {wall_seconds:.1f}s, {len(errors)} error(s)")
+    for op, error in errors[:10]:
+        lines.append(f"  {op}: {error}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a Civilex request mix and report stage latencies")
+    parser.add_argument("--mix", default=os.path.join(os.path.dirname(__file__), "..", "benchmarks", "default_mix.json"))
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--backend", choices=["stub", "gemini"], default="stub")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY"))
+    parser.add_argument("--stub-url", help="Use an already running stub instead of starting one")
+    parser.add_argument("--stub-config", help="JSON overrides for the in-process stub")
+    parser.add_argument("--rpm", type=int, help="Route calls through the rate-limited scheduler at this quota")
+    args = parser.parse_args()
+
+    requests, documents = load_mix(args.mix)
+    server = None
+    if args.backend == "gemini":
+        backend = make_backend(args.api_key, kind="gemini")
+    elif args.stub_url:
+        backend = StubBackend(args.stub_url)
+    else:
+        from civilex.stub_server import start_server
+        config = {}
+        if args.stub_config:
+            with open(args.stub_config, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        server, url = start_server(config)
+        backend = StubBackend(url)
+
+    scheduler = None
+    if args.rpm:
+        scheduler = RequestScheduler(requests_per_minute=args.rpm)
+        backend = ScheduledBackend(backend, scheduler)
+
+    try:
+        timer, errors, wall = run_benchmark(requests, documents, backend, args.concurrency, args.repeat)
+        print(format_report(timer, errors, wall, len(requests) * args.repeat))
+        if scheduler:
+            print("scheduler:", scheduler.stats())
+    finally:
+        if server:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# --- PERSISTENT AI RESPONSE CACHE ---
+# One JSON file per (document hash, prompt, model) key. Reads touch the file's
+# mtime so eviction can drop the least-recently-used entries once the folder
+# grows past max_bytes.
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024  # 50 MB per project
+
+
+def content_hash(data):
+    return hashlib.sha256(bytes(data)).hexdigest()
+
+
+def make_cache_key(file_bytes, prompt, model_name):
+    h = hashlib.sha256()
+    h.update(content_hash(file_bytes).encode() if file_bytes is not None else b"-")
+    for part in (prompt, model_name):
+        h.update(b"\0")
+        h.update(part.encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, folder, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        return entry.get("text")
+
+    def put(self, key, text, **meta):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # Jobs and batch workers write from several threads
+        entry = {"text": text, "created": time.time(), **meta}
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)  # Atomic, so concurrent readers never see half a file
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for e in os.scandir(self.folder):
+            if not e.name.endswith(".json"):
+                continue
+            try:
+                st = e.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, e.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for e in os.scandir(self.folder):
+            if e.name.endswith(".json"):
+                os.remove(e.path)
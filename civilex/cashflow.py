@@ -0,0 +1,521 @@
+import numpy as np
+import pandas as pd
+
+# --- CASH FLOW ENGINE ---
+# Pure pandas/NumPy version of the Commercial Manager "Run Simulation" logic so
+# it can run on 50k-line BQ schedules, on whole portfolios, and outside Streamlit.
+#
+#   ledger, summary = simulate_cash_flow(schedule_df, comm_terms, start_balance)
+#
+# schedule_df needs "End Date", "Value (RM)" and "Cost (RM)" columns (the Tab 2 table).
+# comm_terms is the Tab 1 dict: payment_period, honor_cert_period, retention_percent,
+# retention_limit (percentages as 10.0 = 10%).
+
+DEFAULT_TERMS = {
+    "payment_period": 30,
+    "honor_cert_period": 14,
+    "retention_percent": 10.0,
+    "retention_limit": 5.0,
+}
+
+CMGD_DAYS = 365  # Second retention moiety released ~12 months after completion
+
+LEDGER_COLUMNS = ["Month", "Month_Str", "Cash In", "Cash Out", "Retention Release", "Amount", "Cumulative Balance"]
+
+
+def pay_lag_days(comm_terms):
+    terms = {**DEFAULT_TERMS, **(comm_terms or {})}
+    return int(terms["payment_period"]) + int(terms["honor_cert_period"])
+
+
+def clean_schedule(schedule_df):
+    # st.data_editor can hand us blank rows and text numbers while the user is typing
+    df = schedule_df.copy()
+    df["Start Date"] = pd.to_datetime(df.get("Start Date", df.get("End Date")), errors="coerce")
+    df["End Date"] = pd.to_datetime(df["End Date"], errors="coerce")
+    for col in ("Value (RM)", "Cost (RM)"):
+        df[col] = pd.to_numeric(df.get(col, 0.0), errors="coerce").fillna(0.0)
+    return df[df["End Date"].notna()].reset_index(drop=True)
+
+
+def retention_deductions(gross_claims, retention_rate, max_retention):
+    # Cumulative retention is capped at the limit; each claim gives up whatever is left under the cap
+    capped = np.minimum(np.cumsum(np.asarray(gross_claims, dtype=float) * retention_rate), max_retention)
+    return np.diff(capped, prepend=0.0)
+
+
+def month_index(dates):
+    # Months since year 0 - cheap integer bucket for bincount
+    d = pd.DatetimeIndex(dates)
+    return d.year.to_numpy() * 12 + d.month.to_numpy() - 1
+
+
+def month_periods(first_index, count):
+    start = pd.Period(year=int(first_index // 12), month=int(first_index % 12) + 1, freq="M")
+    return pd.period_range(start=start, periods=count, freq="M")
+
+
+def build_ledger(first_month, cash_in, cash_out, releases, start_balance=0.0):
+    months = month_periods(first_month, len(cash_in))
+    amount = cash_in - cash_out + releases
+    return pd.DataFrame({
+        "Month": months,
+        "Month_Str": months.astype(str),
+        "Cash In": cash_in,
+        "Cash Out": cash_out,
+        "Retention Release": releases,
+        "Amount": amount,
+        "Cumulative Balance": np.cumsum(amount) + start_balance,
+    })
+
+
+def activity_flows(schedule_df, comm_terms):
+    """Per-activity cash events (all arrays aligned with the cleaned schedule)."""
+    terms = {**DEFAULT_TERMS, **(comm_terms or {})}
+    df = clean_schedule(schedule_df)
+    lag = pd.Timedelta(days=pay_lag_days(terms))
+
+    gross = df["Value (RM)"].to_numpy(dtype=float)
+    max_retention = gross.sum() * terms["retention_limit"] / 100
+    retention = retention_deductions(gross, terms["retention_percent"] / 100, max_retention)
+
+    return {
+        "schedule": df,
+        "gross": gross,
+        "retention": retention,
+        "net_in": gross - retention,
+        "cost": df["Cost (RM)"].to_numpy(dtype=float),
+        "in_month": month_index(df["End Date"] + lag),
+        "out_month": month_index(df["End Date"]),  # Assumes suppliers are paid the same month (conservative)
+        "last_end": df["End Date"].max(),
+        "lag": lag,
+    }
+
+
+def retention_release_months(last_end, lag):
+    # 50% at CPC (+ payment lag), 50% at CMGD
+    return month_index([last_end + lag, last_end + pd.Timedelta(days=CMGD_DAYS)])
+
+
+# --- TIME-PHASED (S-CURVE) DISTRIBUTION ---
+# Instead of booking an activity's whole value on its End Date, spread it from
+# Start Date to End Date. Built as one (period boundary x activity) matrix of
+# cumulative progress, so thousands of activities cost one matrix product.
+# Work done is still valued in monthly progress claims (PWD/PAM valuations);
+# "daily" resolution spreads cost day by day and also tracks the daily bank
+# balance, which catches overdraft peaks hidden inside a month.
+
+DISTRIBUTIONS = ["lump", "linear", "s-curve"]
+RESOLUTIONS = ["monthly", "daily"]
+
+_EPOCH_MONTH = 1970 * 12  # month_index() of datetime64 zero
+
+
+def _day_numbers(dates):
+    return pd.DatetimeIndex(dates).to_numpy(dtype="datetime64[D]").astype(np.int64)
+
+
+def _month_of_day(days):
+    return np.asarray(days, dtype=np.int64).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64) + _EPOCH_MONTH
+
+
+def _last_day_of_month(months):
+    next_month = (np.asarray(months, dtype=np.int64) - _EPOCH_MONTH + 1).astype("datetime64[M]")
+    return next_month.astype("datetime64[D]").astype(np.int64) - 1
+
+
+def progress_curve(fraction, distribution):
+    if distribution == "s-curve":
+        return fraction * fraction * (3.0 - 2.0 * fraction)  # Slow mobilisation, fast middle, slow finishing
+    return fraction
+
+
+def period_boundaries(first_day, last_day, resolution):
+    """Day numbers where each period starts, plus one closing boundary."""
+    if resolution == "daily":
+        return np.arange(first_day, last_day + 2, dtype=np.int64)
+    first = _month_of_day([first_day])[0]
+    last = _month_of_day([last_day])[0]
+    return _last_day_of_month(np.arange(first - 1, last + 1)) + 1
+
+
+def phase_weights(starts, ends, boundaries, distribution="linear"):
+    """(period x activity) share of each activity done in each period; columns sum to 1."""
+    duration = np.maximum(ends - starts + 1, 1).astype(float)
+    elapsed = (boundaries[:, None] - starts[None, :]) / duration[None, :]
+    done = progress_curve(np.clip(elapsed, 0.0, 1.0), distribution)
+    return np.diff(done, axis=0)
+
+
+def phased_amounts(starts, ends, amounts, boundaries, distribution="linear"):
+    """Per-period totals of amounts (activities x k) spread over [start, end] (inclusive days)."""
+    return phase_weights(starts, ends, boundaries, distribution) @ amounts
+
+
+def _lump_events(flows):
+    ends = _day_numbers(flows["schedule"]["End Date"])
+    return {
+        "in_day": ends + flows["lag"].days,
+        "net_in": flows["net_in"],
+        "out_day": ends,
+        "cost": flows["cost"],
+        "retention": flows["retention"],
+    }
+
+
+def _phased_events(flows, comm_terms, distribution, resolution):
+    terms = {**DEFAULT_TERMS, **(comm_terms or {})}
+    df = flows["schedule"]
+    ends = _day_numbers(df["End Date"])
+    starts = np.minimum(_day_numbers(df["Start Date"].fillna(df["End Date"])), ends)
+
+    boundaries = period_boundaries(starts.min(), ends.max(), resolution)
+    weights = phase_weights(starts, ends, boundaries, distribution)
+    per_period = weights @ np.column_stack([flows["gross"], flows["cost"]])
+    period_days = boundaries[:-1]
+
+    # One progress claim per month, valued on its last day; retention capped in claim order
+    period_month = _month_of_day(period_days)
+    first_month = period_month.min()
+    claims = np.bincount(period_month - first_month, weights=per_period[:, 0])
+    claim_days = _last_day_of_month(np.arange(first_month, first_month + len(claims)))
+    max_retention = flows["gross"].sum() * terms["retention_limit"] / 100
+    retention = retention_deductions(claims, terms["retention_percent"] / 100, max_retention)
+
+    return {
+        "in_day": claim_days + flows["lag"].days,
+        "net_in": claims - retention,
+        "out_day": period_days if resolution == "daily" else _last_day_of_month(period_month),
+        "cost": per_period[:, 1],
+        "cost_weights": weights,  # Lets Monte Carlo re-spread per-activity cost overruns
+        "retention": retention,
+    }
+
+
+def build_events(flows, comm_terms, distribution="lump", resolution="monthly"):
+    if distribution == "lump":
+        return _lump_events(flows)
+    return _phased_events(flows, comm_terms, distribution, resolution)
+
+
+def daily_min_balance(events, release_days, release_amount, start_balance=0.0):
+    days = np.concatenate([events["in_day"], events["out_day"], release_days])
+    first = days.min()
+    n = int(days.max() - first + 1)
+    daily = (np.bincount(events["in_day"] - first, weights=events["net_in"], minlength=n)
+             - np.bincount(events["out_day"] - first, weights=events["cost"], minlength=n)
+             + np.bincount(release_days - first, weights=[release_amount] * len(release_days), minlength=n))
+    return float(np.cumsum(daily).min() + start_balance)
+
+
+def simulate_cash_flow(schedule_df, comm_terms, start_balance=0.0, distribution="lump", resolution="monthly"):
+    """Monthly ledger + summary for one schedule. Returns (ledger_df, summary_dict).
+
+    distribution: "lump" books value/cost on End Date (original model), "linear" or
+    "s-curve" spread them from Start Date to End Date. resolution="daily" spreads cost
+    per day and adds summary["min_balance_daily"].
+    """
+    flows = activity_flows(schedule_df, comm_terms)
+    if len(flows["gross"]) == 0:
+        empty = pd.DataFrame(columns=LEDGER_COLUMNS)
+        return empty, {"contract_sum": 0.0, "total_retention": 0.0, "min_balance": float(start_balance)}
+
+    events = build_events(flows, comm_terms, distribution, resolution)
+    total_retention = float(events["retention"].sum())
+
+    last_end = _day_numbers([flows["last_end"]])[0]
+    release_days = np.array([last_end + flows["lag"].days, last_end + CMGD_DAYS], dtype=np.int64)
+    in_month, out_month, release_months = (_month_of_day(events["in_day"]), _month_of_day(events["out_day"]),
+                                           _month_of_day(release_days))
+    all_months = np.concatenate([in_month, out_month, release_months])
+    first, last = all_months.min(), all_months.max()
+    n = int(last - first + 1)
+
+    cash_in = np.bincount(in_month - first, weights=events["net_in"], minlength=n)
+    cash_out = np.bincount(out_month - first, weights=events["cost"], minlength=n)
+    releases = np.bincount(release_months - first, weights=[total_retention * 0.5] * 2, minlength=n)
+
+    ledger = build_ledger(first, cash_in, cash_out, releases, start_balance)
+    summary = {
+        "contract_sum": float(flows["gross"].sum()),
+        "total_retention": total_retention,
+        "min_balance": float(ledger["Cumulative Balance"].min()),
+    }
+    if resolution == "daily":
+        summary["min_balance_daily"] = daily_min_balance(events, release_days, total_retention * 0.5, start_balance)
+    return ledger, summary
+
+
+# --- MONTE CARLO PAYMENT-DELAY SCENARIOS ---
+# pay_lag is never exact: S.O./Architect certification and client payment slip
+# by weeks, and costs overrun. Each scenario draws a certification delay and a
+# payment delay for every progress claim (gamma distributed: never early,
+# occasionally very late) and a cost overrun for every activity. Everything is
+# computed as (scenarios x months) arrays in chunks to cap memory.
+
+PERCENTILES = [50, 90, 99]
+
+
+def _gamma_delay(rng, mean_days, shape, size):
+    if mean_days <= 0:
+        return np.zeros(size)
+    return rng.gamma(shape, mean_days / shape, size=size)
+
+
+def monte_carlo_cash_flow(schedule_df, comm_terms, start_balance=0.0, n_scenarios=10000,
+                          cert_delay_days=14.0, pay_delay_days=21.0, overrun_mean_pct=0.0, overrun_sd_pct=5.0,
+                          distribution="lump", resolution="monthly", delay_shape=2.0, seed=None, chunk_size=2000):
+    """Distribution of the lowest bank balance over n_scenarios.
+
+    Returns {"min_balances": array, "percentiles": {50: {"min_balance", "overdraft"}, 90: ..., 99: ...}}.
+    P90 means 90% of scenarios need less overdraft than this.
+    """
+    flows = activity_flows(schedule_df, comm_terms)
+    if len(flows["gross"]) == 0:
+        return {"min_balances": np.full(n_scenarios, float(start_balance)), "percentiles": {}}
+
+    events = build_events(flows, comm_terms, distribution, resolution)
+    total_retention = float(events["retention"].sum())
+    last_end = _day_numbers([flows["last_end"]])[0]
+    cpc_day = last_end + flows["lag"].days
+    cmgd_day = last_end + CMGD_DAYS
+
+    in_day = np.asarray(events["in_day"], dtype=np.int64)
+    out_day = np.asarray(events["out_day"], dtype=np.int64)
+    net_in = np.asarray(events["net_in"], dtype=float)
+    base_cost = flows["cost"]
+    cost_weights = events.get("cost_weights")  # None for lump: one cost event per activity
+
+    # 10x the mean delay bounds the month axis; anything later is clipped into the last month
+    max_delay = int(10 * (cert_delay_days + pay_delay_days)) + 31
+    first_day = min(in_day.min(), out_day.min())
+    last_day = max(in_day.max(), cmgd_day, cpc_day) + max_delay
+    day_to_month = _month_of_day(np.arange(first_day, last_day + 1))
+    first_month = day_to_month[0]
+    n_months = int(day_to_month[-1] - first_month + 1)
+    out_month = day_to_month[out_day - first_day] - first_month
+    cmgd_month = day_to_month[cmgd_day - first_day] - first_month
+
+    rng = np.random.default_rng(seed)
+    min_balances = np.empty(n_scenarios)
+    for lo in range(0, n_scenarios, chunk_size):
+        s = min(chunk_size, n_scenarios - lo)
+        rows = np.arange(s)[:, None] * n_months
+
+        # Cash in: every claim slips by its own certification + payment delay
+        delay = (_gamma_delay(rng, cert_delay_days, delay_shape, (s, len(in_day)))
+                 + _gamma_delay(rng, pay_delay_days, delay_shape, (s, len(in_day)))).astype(np.int64)
+        paid = np.minimum(in_day[None, :] + delay - first_day, len(day_to_month) - 1)
+        ledger = np.bincount((rows + day_to_month[paid] - first_month).ravel(),
+                             weights=np.broadcast_to(net_in, (s, len(in_day))).ravel(), minlength=s * n_months)
+
+        # Cash out: per-activity overrun, re-spread over periods for phased schedules
+        overrun = 1.0 + rng.normal(overrun_mean_pct, overrun_sd_pct, size=(s, len(base_cost))) / 100.0
+        cost = base_cost[None, :] * overrun
+        if cost_weights is not None:
+            cost = cost @ cost_weights.T
+        ledger -= np.bincount((rows + out_month[None, :]).ravel(), weights=cost.ravel(), minlength=s * n_months)
+
+        # Retention: CPC half slips like a claim, CMGD half on its date
+        cpc_paid = np.minimum(cpc_day + delay[:, -1] - first_day, len(day_to_month) - 1)
+        ledger += np.bincount(rows[:, 0] + day_to_month[cpc_paid] - first_month,
+                              weights=np.full(s, total_retention * 0.5), minlength=s * n_months)
+        ledger += np.bincount(rows[:, 0] + cmgd_month, weights=np.full(s, total_retention * 0.5), minlength=s * n_months)
+
+        balances = np.cumsum(ledger.reshape(s, n_months), axis=1) + start_balance
+        min_balances[lo:lo + s] = balances.min(axis=1)
+
+    percentiles = {}
+    for p in PERCENTILES:
+        worst = float(np.percentile(min_balances, 100 - p))
+        percentiles[p] = {"min_balance": worst, "overdraft": max(0.0, -worst)}
+    return {"min_balances": min_balances, "percentiles": percentiles}
+
+
+# --- LIVE (INCREMENTAL) RECOMPUTATION ---
+# While the schedule table is being edited the dashboard recomputes on every
+# rerun. LiveCashFlow keeps each row's bookings in day buckets and, on update(),
+# diffs the new table against the previous one by position: only changed, added
+# or removed rows are un-booked and re-booked (plus rows whose retention moved
+# because the cap shifted). Months, claims and balances are then re-aggregated
+# from the day buckets, which is a few thousand numbers however long the
+# schedule is. Terms, balance or booking-mode changes trigger a full rebuild.
+# Results match simulate_cash_flow().
+
+_NAT = np.iinfo(np.int64).min
+_GRID_MARGIN_DAYS = 400
+
+
+def _as_dates(column):
+    # The data editor already hands back datetime64 columns; parsing them again dominates an update
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column
+    return pd.to_datetime(column, errors="coerce")
+
+
+def schedule_arrays(schedule_df):
+    """Positional row arrays (invalid rows keep their slot with zero amounts)."""
+    ends = _as_dates(schedule_df["End Date"]) if "End Date" in schedule_df else pd.Series(pd.NaT, index=schedule_df.index)
+    starts = _as_dates(schedule_df["Start Date"]) if "Start Date" in schedule_df else ends
+    valid = ends.notna().to_numpy()
+    end_days = np.where(valid, ends.to_numpy(dtype="datetime64[D]").astype(np.int64), _NAT)
+    start_days = starts.fillna(ends).to_numpy(dtype="datetime64[D]").astype(np.int64)
+    start_days = np.where(valid, np.minimum(start_days, end_days), _NAT)
+    amounts = {}
+    for col in ("Value (RM)", "Cost (RM)"):
+        values = pd.to_numeric(schedule_df[col], errors="coerce") if col in schedule_df else pd.Series(0.0, index=schedule_df.index)
+        amounts[col] = np.where(valid, values.fillna(0.0).to_numpy(dtype=float), 0.0)
+    return {"start": start_days, "end": end_days, "gross": amounts["Value (RM)"], "cost": amounts["Cost (RM)"], "valid": valid}
+
+
+def changed_rows(old, new):
+    """(old rows to un-book, new rows to re-book) between two schedule_arrays() results."""
+    n_old, n_new = len(old["end"]), len(new["end"])
+    m = min(n_old, n_new)
+    diff = np.zeros(m, dtype=bool)
+    for key in ("start", "end", "gross", "cost", "valid"):
+        diff |= old[key][:m] != new[key][:m]
+    same = np.flatnonzero(diff)
+    return np.concatenate([same, np.arange(m, n_old)]), np.concatenate([same, np.arange(m, n_new)])
+
+
+class LiveCashFlow:
+    def __init__(self, comm_terms=None, start_balance=0.0, distribution="lump", resolution="monthly"):
+        self.rows = None
+        self.settings = None
+        self.configure(comm_terms, start_balance, distribution, resolution)
+
+    def configure(self, comm_terms=None, start_balance=0.0, distribution="lump", resolution="monthly"):
+        terms = {**DEFAULT_TERMS, **(comm_terms or {})}
+        settings = (tuple(sorted(terms.items())), float(start_balance), distribution, resolution)
+        if settings != self.settings:
+            self.settings = settings
+            self.terms, self.start_balance = terms, float(start_balance)
+            self.distribution, self.resolution = distribution, resolution
+            self.lag = pay_lag_days(terms)
+            self.rows = None  # Next update() rebuilds
+
+    # --- day buckets ---
+
+    def _allocate(self, rows):
+        lo = rows["start"][rows["valid"]].min() - _GRID_MARGIN_DAYS
+        hi = rows["end"][rows["valid"]].max() + self.lag + CMGD_DAYS + 62 + _GRID_MARGIN_DAYS
+        self.origin = int(lo)
+        size = int(hi - lo + 1)
+        self.value_day = np.zeros(size)  # lump: net value paid on its pay day; phased: gross value of work done that day
+        self.cost_day = np.zeros(size)
+        self.day_month = _month_of_day(np.arange(self.origin, self.origin + size))
+
+    def _fits(self, rows, idx):
+        idx = idx[rows["valid"][idx]]
+        if len(idx) == 0:
+            return True
+        last = len(self.cost_day) - 1 - self.lag - CMGD_DAYS - 62
+        return rows["start"][idx].min() >= self.origin and rows["end"][idx].max() - self.origin <= last
+
+    def _book(self, rows, retention, idx, sign):
+        idx = idx[rows["valid"][idx]]
+        if len(idx) == 0:
+            return
+        size = len(self.cost_day)
+        if self.distribution == "lump":
+            ends = rows["end"][idx] - self.origin
+            self.value_day += sign * np.bincount(ends + self.lag, weights=rows["gross"][idx] - retention[idx], minlength=size)
+            self.cost_day += sign * np.bincount(ends, weights=rows["cost"][idx], minlength=size)
+            return
+        # Phased: each row's share per day, only over its own days
+        starts, ends = rows["start"][idx], rows["end"][idx]
+        duration = ends - starts + 1
+        row = np.repeat(np.arange(len(idx)), duration)
+        step = np.arange(len(row)) - np.repeat(np.cumsum(duration) - duration, duration)
+        share = (progress_curve((step + 1) / duration[row], self.distribution)
+                 - progress_curve(step / duration[row], self.distribution))
+        day = starts[row] + step - self.origin
+        self.value_day += sign * np.bincount(day, weights=share * rows["gross"][idx][row], minlength=size)
+        self.cost_day += sign * np.bincount(day, weights=share * rows["cost"][idx][row], minlength=size)
+
+    def _row_retention(self, rows):
+        # Lump mode books retention per activity (in table order); phased mode per monthly claim
+        if self.distribution != "lump":
+            return np.zeros(len(rows["gross"]))
+        max_retention = rows["gross"].sum() * self.terms["retention_limit"] / 100
+        return retention_deductions(rows["gross"], self.terms["retention_percent"] / 100, max_retention)
+
+    # --- public ---
+
+    def update(self, schedule_df):
+        """Returns (ledger_df, summary) like simulate_cash_flow(), re-booking only what changed."""
+        rows = schedule_arrays(schedule_df)
+        if not rows["valid"].any():
+            self.rows = None
+            empty = pd.DataFrame(columns=LEDGER_COLUMNS)
+            return empty, {"contract_sum": 0.0, "total_retention": 0.0, "min_balance": self.start_balance}
+
+        retention = self._row_retention(rows)
+        if self.rows is None:
+            self._allocate(rows)
+            self._book(rows, retention, np.arange(len(rows["end"])), +1)
+            self.last_changed = len(rows["end"])
+        else:
+            old_idx, new_idx = changed_rows(self.rows, rows)
+            if self.distribution == "lump":
+                # A value edit can move the retention cap for rows further down the table
+                m = min(len(retention), len(self.retention))
+                moved = np.flatnonzero(retention[:m] != self.retention[:m])
+                old_idx, new_idx = np.union1d(old_idx, moved), np.union1d(new_idx, moved)
+            if not self._fits(rows, new_idx):
+                self._allocate(rows)
+                old_idx, new_idx = np.array([], dtype=np.int64), np.arange(len(rows["end"]))
+            self._book(self.rows, self.retention, old_idx, -1)
+            self._book(rows, retention, new_idx, +1)
+            self.last_changed = len(new_idx)
+        self.rows, self.retention = rows, retention
+        return self._ledger()
+
+    def _ledger(self):
+        rows, size = self.rows, len(self.cost_day)
+        valid = rows["valid"]
+        first_day = (rows["end"] if self.distribution == "lump" else rows["start"])[valid].min() - self.origin
+        last_end = rows["end"][valid].max() - self.origin
+        cash_in_day = self.value_day
+        total_retention = float(self.retention.sum())
+
+        if self.distribution != "lump":
+            # Monthly progress claims, valued on the last day of the month and paid lag days later
+            work_month = self.day_month - self.day_month[first_day]
+            span = slice(first_day, last_end + 1)
+            claims = np.bincount(work_month[span], weights=self.value_day[span])
+            max_retention = rows["gross"].sum() * self.terms["retention_limit"] / 100
+            retention = retention_deductions(claims, self.terms["retention_percent"] / 100, max_retention)
+            total_retention = float(retention.sum())
+            claim_days = _last_day_of_month(self.day_month[first_day] + np.arange(len(claims))) - self.origin
+            cash_in_day = np.bincount(claim_days + self.lag, weights=claims - retention, minlength=size)
+
+        cost_day = self.cost_day
+        if self.distribution != "lump" and self.resolution == "monthly":
+            cost_day = np.bincount(_last_day_of_month(self.day_month) - self.origin,
+                                   weights=self.cost_day, minlength=size)[:size]
+
+        release_days = np.array([last_end + self.lag, last_end + CMGD_DAYS])
+        release_day = np.bincount(release_days, weights=[total_retention * 0.5] * 2, minlength=size)
+        last_day = release_days.max()
+        if self.distribution != "lump":
+            last_day = max(last_day, claim_days[-1] + self.lag)
+
+        month = self.day_month[first_day:last_day + 1] - self.day_month[first_day]
+        span = slice(first_day, last_day + 1)
+        cash_in = np.bincount(month, weights=cash_in_day[span])
+        cash_out = np.bincount(month, weights=cost_day[span])
+        releases = np.bincount(month, weights=release_day[span])
+
+        ledger = build_ledger(self.day_month[first_day], cash_in, cash_out, releases, self.start_balance)
+        summary = {
+            "contract_sum": float(rows["gross"].sum()),
+            "total_retention": total_retention,
+            "min_balance": float(ledger["Cumulative Balance"].min()),
+            "rows_recomputed": self.last_changed,
+        }
+        if self.resolution == "daily":
+            daily = cash_in_day[span] - cost_day[span] + release_day[span]
+            summary["min_balance_daily"] = float(np.cumsum(daily).min() + self.start_balance)
+        return ledger, summary
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# --- COLD START MEASUREMENT ---
+# How long a fresh server process takes to import things, to render the first
+# page and to handle a click. Every number comes from a new interpreter so
+# nothing is already in sys.modules.
+#
+#   python -m civilex.coldstart              # import times + first render (needs streamlit)
+#   python -m civilex.coldstart --repeat 5 --json
+
+# What app.py imports at startup vs. what the modules pull in when opened
+STARTUP_MODULES = ["streamlit", "civilex.cache", "civilex.index", "civilex.uploads", "civilex.batch", "civilex.jobs",
+                   "civilex.metrics", "civilex.knowledge", "civilex.context_cache", "civilex.backend", "civilex.scheduler"]
+DEFERRED_MODULES = ["pandas", "numpy", "fpdf", "pypdf", "civilex.cashflow",
+                    "civilex.search", "civilex.extraction", "civilex.pdfexport", "civilex.tender"]
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+RENDER_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.secrets["GOOGLE_API_KEY"] = "coldstart"
+at.run()
+t2 = time.perf_counter()
+at.run()
+t3 = time.perf_counter()
+modules = {{}}
+menu = next(r for r in at.radio if r.label == "Select Module:")
+for option in menu.options[1:]:
+    started = time.perf_counter()
+    menu.set_value(option).run()
+    modules[option] = time.perf_counter() - started
+    menu = next(r for r in at.radio if r.label == "Select Module:")
+print(json.dumps({{"import_streamlit_testing": t1 - t0, "first_render": t2 - t1, "rerun": t3 - t2,
+                  "first_open": modules, "genai_imported": "google.generativeai" in sys.modules, "exceptions": [str(e.value) for e in at.exception]}}))
+"""
+
+
+def _run(code, env=None):
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env,
+                         cwd=os.path.dirname(APP_PATH))
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "failed")
+    return out.stdout.strip().splitlines()[-1]
+
+
+def import_time(module, repeat=3):
+    samples = []
+    for _ in range(repeat):
+        try:
+            samples.append(float(_run(IMPORT_SNIPPET.format(module=module))))
+        except RuntimeError:
+            return None  # Not installed here
+    return statistics.median(samples)
+
+
+def render_times(repeat=1):
+    # Same backend selection as a real start (CIVILEX_BACKEND from the environment, Gemini by default).
+    # Rendering and opening modules makes no AI call, so a placeholder key is enough.
+    runs = [json.loads(_run(RENDER_SNIPPET.format(app=APP_PATH))) for _ in range(repeat)]
+    result = runs[0]
+    result["first_render"] = statistics.median(r["first_render"] for r in runs)
+    result["rerun"] = statistics.median(r["rerun"] for r in runs)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Civilex import and first-render time")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = {
+        "startup_imports": {m: import_time(m, args.repeat) for m in STARTUP_MODULES},
+        "deferred_imports": {m: import_time(m, args.repeat) for m in DEFERRED_MODULES},
+    }
+    try:
+        report["render"] = render_times(args.repeat)
+    except (RuntimeError, StopIteration) as e:
+        report["render"] = {"error": str(e)}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for section in ("startup_imports", "deferred_imports"):
+        print(section.replace("_", " ").upper())
+        for module, seconds in report[section].items():
+            print(f"  {module:<24}{'not installed' if seconds is None else f'{seconds * 1000:8.0f} ms'}")
+    render = report["render"]
+    if "error" in render:
+        print(f"RENDER: skipped ({render['error']})")
+        return
+    print(f"RENDER\n  first render            {render['first_render'] * 1000:8.0f} ms\n  rerun (click)           {render['rerun'] * 1000:8.0f} ms")
+    for module, seconds in render["first_open"].items():
+        print(f"  open {module:<34}{seconds * 1000:8.0f} ms")
+    print(f"  google.generativeai imported: {'yes' if render['genai_imported'] else 'no'}")
+    for error in render["exceptions"]:
+        print(f"  ! {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import datetime
+import hashlib
+import threading
+import time
+from concurrent.futures import Future
+
+from civilex.backend import GeminiModel, api_errors
+
+# --- EXPLICIT CONTEXT CACHING ---
+# Every Draft / Create Contract / Forensic Audit call starts with the same
+# MY_CONTEXT knowledge base and, for a project, the same governing contract.
+# Gemini can cache that prefix server-side once; later calls only send the new
+# instruction. Entries are per (system prompt, contract) pair with a sliding TTL;
+# if creation is refused (e.g. prefix below the minimum token count) or the cache
+# has expired server-side, the call transparently falls back to the full prompt.
+
+DEFAULT_TTL_SECONDS = 60 * 60
+EXTEND_WHEN_LEFT = 0.25   # Extend the TTL when less than a quarter of it remains
+RETRY_CREATE_AFTER = 15 * 60  # Don't retry a refused cache creation on every click
+
+
+def _is_expired_error(error):
+    name = type(error).__name__
+    text = str(error).lower().replace(" ", "")
+    return name in ("NotFound", "CacheExpired") or getattr(error, "status", None) == 404 or "cachedcontent" in text
+
+
+class GeminiCacheBackend:
+    """Talks to google.generativeai's caching API."""
+
+    def __init__(self, genai_module, model_name, error_types=()):
+        self.genai = genai_module
+        self.model_name = model_name  # Caching needs an explicit model version, e.g. models/gemini-2.0-flash-001
+        self.error_types = error_types  # Raised as civilex.backend.BackendError
+
+    def create(self, system_instruction, contents, ttl_seconds, display_name):
+        from google.generativeai import caching
+        with api_errors(self.error_types):
+            return caching.CachedContent.create(
+                model=self.model_name,
+                system_instruction=system_instruction,
+                contents=contents or None,
+                ttl=datetime.timedelta(seconds=ttl_seconds),
+                display_name=display_name[:100],
+            )
+
+    def model_for(self, handle):
+        return GeminiModel(self.genai.GenerativeModel.from_cached_content(cached_content=handle), self.error_types)
+
+    def extend(self, handle, ttl_seconds):
+        with api_errors(self.error_types):
+            handle.update(ttl=datetime.timedelta(seconds=ttl_seconds))
+
+    def delete(self, handle):
+        with api_errors(self.error_types):
+            handle.delete()
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+    def __iter__(self):
+        # Streaming: a few chunks
+        for i in range(0, len(self.text), 40):
+            yield _FakeResponse(self.text[i:i + 40])
+
+
+class FakeCacheBackend:
+    """In-memory stand-in for local runs and tests: counts creations, can expire entries on demand."""
+
+    def __init__(self, min_chars=0):
+        self.min_chars = min_chars
+        self.created = 0
+        self.live = {}
+
+    def create(self, system_instruction, contents, ttl_seconds, display_name):
+        if len(system_instruction) < self.min_chars:
+            raise ValueError("Cached content is too small")
+        self.created += 1
+        name = f"cachedContents/fake-{self.created}"
+        self.live[name] = time.time() + ttl_seconds
+        return name
+
+    def model_for(self, handle):
+        backend = self
+
+        class _Model:
+            def generate_content(self, contents, stream=False):
+                if backend.live.get(handle, 0) < time.time():
+                    raise LookupError(f"CachedContent {handle} not found")
+                parts = contents if isinstance(contents, list) else [contents]
+                return _FakeResponse(f"[{handle}] " + " ".join(str(p) for p in parts))
+        return _Model()
+
+    def extend(self, handle, ttl_seconds):
+        self.live[handle] = time.time() + ttl_seconds
+
+    def delete(self, handle):
+        self.live.pop(handle, None)
+
+    def expire(self, handle):
+        self.live[handle] = 0
+
+
+class ContextCacheManager:
+    def __init__(self, backend, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> {"handle", "model", "expires"}
+        self._refused = {}  # key -> time creation was refused
+        self._building = {}  # key -> Future of a cache being built (resolves to the model or None)
+        self.stats = {"hits": 0, "created": 0, "fallbacks": 0, "expired": 0}
+
+    @staticmethod
+    def key(system_instruction, contract_key=None):
+        return (hashlib.sha256(system_instruction.encode("utf-8")).hexdigest(), contract_key)
+
+    def _cached_model(self, key, system_instruction, contract_loader, display_name):
+        # The shared lock only guards the dicts. Building a cache (contract upload + PROCESSING
+        # wait + create) happens outside it; concurrent callers for the same key wait on one build.
+        now = time.time()
+        extend = build = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry["expires"] > now:
+                self.stats["hits"] += 1
+                if entry["expires"] - now >= self.ttl * EXTEND_WHEN_LEFT or entry.get("extending"):
+                    return entry["model"]
+                entry["extending"] = extend = True
+            elif now - self._refused.get(key, 0) < RETRY_CREATE_AFTER:
+                return None
+            elif key in self._building:
+                pending = self._building[key]
+            else:
+                pending = build = self._building[key] = Future()
+
+        if extend:
+            try:
+                self.backend.extend(entry["handle"], self.ttl)
+                entry["expires"] = now + self.ttl
+            except Exception:
+                pass  # Still valid for now; recreated once it lapses
+            finally:
+                entry["extending"] = False
+            return entry["model"]
+        if build is None:
+            return pending.result()  # Someone else is building this cache; None if it was refused
+
+        model = None
+        try:
+            contents = [contract_loader()] if contract_loader else []
+            handle = self.backend.create(system_instruction, contents, self.ttl, display_name)
+            model = self.backend.model_for(handle)
+        except Exception:
+            with self._lock:
+                self._refused[key] = now
+        else:
+            with self._lock:
+                self._entries[key] = {"handle": handle, "model": model, "expires": now + self.ttl}
+                self.stats["created"] += 1
+        finally:
+            with self._lock:
+                self._building.pop(key, None)
+            build.set_result(model)
+        return model
+
+    def invalidate(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry:
+            try:
+                self.backend.delete(entry["handle"])
+            except Exception:
+                pass
+
+    def generate(self, system_instruction, payload, fallback_model, contract_loader=None, contract_key=None,
+                 display_name="Civilex context", stream=False):
+        """Run payload against the cached prefix; falls back to fallback_model with the full prompt.
+
+        contract_loader() -> uploaded contract file; only called when the cache must be (re)built
+        or on fallback, so a warm cache never re-uploads the contract.
+        """
+        payload = payload if isinstance(payload, list) else [payload]
+        key = self.key(system_instruction, contract_key)
+        for attempt in range(2):
+            model = self._cached_model(key, system_instruction, contract_loader, display_name)
+            if model is None:
+                break
+            try:
+                return model.generate_content(payload, stream=stream)
+            except Exception as e:
+                if not _is_expired_error(e):
+                    raise
+                with self._lock:
+                    self.stats["expired"] += 1
+                self.invalidate(key)  # Expired server-side: rebuild once, then fall back
+
+        with self._lock:
+            self.stats["fallbacks"] += 1
+        prefix = [system_instruction] + ([contract_loader()] if contract_loader else [])
+        return fallback_model.generate_content(prefix + payload, stream=stream)
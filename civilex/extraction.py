@@ -0,0 +1,149 @@
+import datetime
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from civilex import metrics, pdftext
+
+# --- CHUNKED SCHEDULE / BQ EXTRACTION ---
+# A big BQ doesn't fit in one JSON answer: the reply gets truncated and one bad
+# item used to throw the whole import away. Here the relevant pages are split
+# into page ranges, extracted concurrently, every item is validated on its own
+# and the good ones are merged (in page order) into one list. Failures are
+# reported per chunk instead of failing everything.
+
+CHUNK_PAGES = 8
+MAX_WORKERS = 4
+
+CHUNK_NOTE = ("\nNOTE: This is only pages {first}-{last} of a larger document. "
+              "Extract ONLY the items that appear on these pages. Do not summarise or total.")
+
+_DECODER = json.JSONDecoder()
+
+
+def page_chunks(pages, chunk_pages=CHUNK_PAGES):
+    return [pages[i:i + chunk_pages] for i in range(0, len(pages), chunk_pages)]
+
+
+def salvage_json_objects(text):
+    """Every complete {...} object in text - survives truncated lists and stray prose."""
+    text = (text or "").replace("```json", "").replace("```", "")
+    try:
+        data = json.loads(text.strip())
+        if isinstance(data, list):
+            return data, False
+    except ValueError:
+        pass
+
+    items, pos, damaged = [], 0, False
+    while True:
+        start = text.find("{", pos)
+        if start < 0:
+            break
+        try:
+            obj, end = _DECODER.raw_decode(text, start)
+        except ValueError:
+            damaged = True  # Truncated or malformed object: skip its opening brace and carry on
+            pos = start + 1
+            continue
+        if isinstance(obj, dict):
+            items.append(obj)
+        pos = end
+    return items, damaged or not items
+
+
+def _to_float(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        cleaned = re.sub(r"[^\d.\-]", "", value)
+        try:
+            return float(cleaned)
+        except ValueError:
+            return None
+    return None
+
+
+def _to_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(str(value)[:10]).isoformat()
+    except ValueError:
+        return None
+
+
+def normalise_item(raw):
+    """Returns (item, None) or (None, reason)."""
+    if not isinstance(raw, dict):
+        return None, "not an object"
+    activity = str(raw.get("Activity") or raw.get("Description") or "").strip()
+    if not activity:
+        return None, "missing Activity"
+    value = _to_float(raw.get("Value", raw.get("Value (RM)")))
+    if value is None:
+        return None, f"'{activity[:40]}': missing Value"
+    cost = _to_float(raw.get("Cost", raw.get("Cost (RM)")))
+    if cost is None:
+        cost = round(value * 0.8, 2)  # Same rule as the prompt
+    start, end = _to_date(raw.get("Start Date")), _to_date(raw.get("End Date"))
+    return {"Activity": activity, "Start Date": start or end, "End Date": end or start, "Value": value, "Cost": cost}, None
+
+
+def _extract_chunk(data, pages, extract_fn):
+    label = f"pp. {pages[0] + 1}-{pages[-1] + 1}"
+    chunk_bytes = pdftext.subset_pdf(data, pages)
+    note = CHUNK_NOTE.format(first=pages[0] + 1, last=pages[-1] + 1)
+    return extract_fn(chunk_bytes, label, note)
+
+
+def extract_schedule_items(data, extract_fn, chunk_pages=CHUNK_PAGES, max_workers=MAX_WORKERS):
+    """extract_fn(pdf_bytes, label, prompt_note) -> model reply text.
+
+    Returns {"items": [...], "chunks": [{"pages", "items", "rejected", "error"}], "complete": bool}.
+    """
+    pages, total = [], 0
+    if pdftext.PdfReader is not None:
+        try:
+            texts = pdftext.page_texts(data)
+            total = len(texts)
+            pages = pdftext.select_pages(texts, pdftext.PROFILES["schedule"]) or list(range(total))
+        except Exception:
+            pages = []
+
+    if not pages or (len(pages) == total and total <= chunk_pages):
+        # Unreadable locally (or a small file that is all relevant): one call with the whole file
+        jobs = [("all pages", lambda: extract_fn(bytes(data), "full", ""))]
+    elif len(pages) <= chunk_pages:
+        # A few relevant pages out of a bigger file: only those are sent
+        jobs = [(f"{pages[0] + 1}-{pages[-1] + 1}", lambda: _extract_chunk(data, pages, extract_fn))]
+    else:
+        jobs = [(f"{c[0] + 1}-{c[-1] + 1}", lambda c=c: _extract_chunk(data, c, extract_fn)) for c in page_chunks(pages, chunk_pages)]
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="civilex-extract") as pool:
+        futures = [(label, pool.submit(metrics.bind(job))) for label, job in jobs]
+
+    items, chunks = [], []
+    for label, future in futures:
+        report = {"pages": label, "items": 0, "rejected": [], "error": None}
+        try:
+            reply = future.result()
+            with metrics.stage("json_parse", bytes=len(reply or "")):
+                raw_items, damaged = salvage_json_objects(reply)
+            if damaged:
+                report["error"] = "reply was truncated or malformed (kept the readable items)"
+        except Exception as e:
+            raw_items = []
+            report["error"] = str(e)
+
+        for raw in raw_items:
+            item, reason = normalise_item(raw)
+            if item is None:
+                report["rejected"].append(reason)
+                continue
+            items.append(item)
+            report["items"] += 1
+        chunks.append(report)
+
+    complete = all(c["error"] is None for c in chunks)
+    return {"items": items, "chunks": chunks, "complete": complete}
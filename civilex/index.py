@@ -0,0 +1,248 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# --- LOCAL PROJECT & DOCUMENT INDEX ---
+# A small SQLite database (kept on the local disk, NOT in the OneDrive folder)
+# that remembers the projects and every document inside them. The sidebar reads
+# from it instead of enumerating a synced share on every Streamlit rerun.
+# Folders are only re-listed when their mtime changes; file hashes are only
+# recomputed when size/mtime change. rebuild() throws it all away and rescans.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    path TEXT PRIMARY KEY,
+    project TEXT NOT NULL,
+    subfolder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    sha256 TEXT,
+    doc_type TEXT,
+    audit_status TEXT
+);
+CREATE INDEX IF NOT EXISTS documents_project ON documents(project, subfolder);
+CREATE INDEX IF NOT EXISTS documents_hash ON documents(sha256);
+CREATE TABLE IF NOT EXISTS drafts (
+    path TEXT PRIMARY KEY,
+    project TEXT NOT NULL,
+    kind TEXT,
+    title TEXT,
+    created REAL
+);
+"""
+
+DOC_TYPES = {
+    "Incoming_Letters": "Incoming Letter",
+    "Outgoing_Drafts": "Draft",
+    "Contracts": "Contract",
+    os.path.join("Tenders", "01_BQ_Documents"): "BQ",
+    os.path.join("Tenders", "02_Supplier_Quotes"): "Supplier Quote",
+    os.path.join("Tenders", "03_Cost_Analysis"): "Cost Analysis",
+}
+
+REPORT_SUFFIX = "_Forensic_Report.md"  # Same naming as civilex.batch
+
+
+def doc_type_for(subfolder, name):
+    if name.endswith(REPORT_SUFFIX):
+        return "Audit Report"
+    for folder, doc_type in DOC_TYPES.items():
+        if subfolder == folder or subfolder.startswith(folder + os.sep):
+            return doc_type
+    return "Other"
+
+
+def audit_status_for(path, doc_type):
+    if doc_type != "Incoming Letter" or not path.lower().endswith(".pdf"):
+        return None
+    return "Audited" if os.path.exists(os.path.splitext(path)[0] + REPORT_SUFFIX) else "Pending"
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ProjectIndex:
+    def __init__(self, db_path, projects_root):
+        self.db_path = db_path
+        self.projects_root = projects_root
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _query(self, sql, params=()):
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def _write(self, fn):
+        with self._write_lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    return fn(conn)
+            finally:
+                conn.close()
+
+    def _folder_changed(self, conn, path):
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            conn.execute("DELETE FROM folders WHERE path = ?", (path,))
+            return None
+        row = conn.execute("SELECT mtime FROM folders WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == mtime:
+            return False
+        conn.execute("INSERT OR REPLACE INTO folders(path, mtime) VALUES (?, ?)", (path, mtime))
+        return True
+
+    # --- PROJECTS ---
+    def refresh_projects(self):
+        # One stat of PROJECTS_ROOT per rerun; only list it when something was added/removed
+        def work(conn):
+            if not self._folder_changed(conn, self.projects_root):
+                return False
+            on_disk = {e.name: e.path for e in os.scandir(self.projects_root) if e.is_dir() and not e.name.startswith(".")}
+            known = {name for (name,) in conn.execute("SELECT name FROM projects")}
+            for name in known - set(on_disk):
+                self._drop_project(conn, name)
+            for name in set(on_disk) - known:
+                conn.execute("INSERT INTO projects(name, path, created) VALUES (?, ?, ?)", (name, on_disk[name], time.time()))
+            return True
+        return self._write(work)
+
+    def list_projects(self):
+        self.refresh_projects()
+        return [name for (name,) in self._query("SELECT name FROM projects ORDER BY name COLLATE NOCASE")]
+
+    def add_project(self, name):
+        path = os.path.join(self.projects_root, name)
+        self._write(lambda conn: conn.execute(
+            "INSERT OR IGNORE INTO projects(name, path, created) VALUES (?, ?, ?)", (name, path, time.time())))
+
+    def _drop_project(self, conn, name):
+        conn.execute("DELETE FROM projects WHERE name = ?", (name,))
+        conn.execute("DELETE FROM documents WHERE project = ?", (name,))
+        conn.execute("DELETE FROM drafts WHERE project = ?", (name,))
+        conn.execute("DELETE FROM folders WHERE path LIKE ?", (os.path.join(self.projects_root, name) + os.sep + "%",))
+
+    # --- DOCUMENTS ---
+    def _upsert_document(self, conn, project, path, sha256=None):
+        st = os.stat(path)
+        project_folder = os.path.join(self.projects_root, project)
+        subfolder = os.path.dirname(os.path.relpath(path, project_folder))
+        name = os.path.basename(path)
+        row = conn.execute("SELECT size, mtime, sha256 FROM documents WHERE path = ?", (path,)).fetchone()
+        if sha256 is None:
+            unchanged = row and row[0] == st.st_size and row[1] == st.st_mtime and row[2]
+            sha256 = row[2] if unchanged else file_sha256(path)
+        doc_type = doc_type_for(subfolder, name)
+        conn.execute(
+            "INSERT OR REPLACE INTO documents(path, project, subfolder, name, size, mtime, sha256, doc_type, audit_status) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, project, subfolder, name, st.st_size, st.st_mtime, sha256, doc_type, audit_status_for(path, doc_type)),
+        )
+        if doc_type == "Audit Report":
+            # The letter it belongs to is audited now; no need to wait for the folder to be rescanned
+            letter_base = path[:-len(REPORT_SUFFIX)]
+            for (letter,) in conn.execute("SELECT path FROM documents WHERE project = ? AND subfolder = ? AND audit_status = 'Pending'",
+                                          (project, subfolder)).fetchall():
+                if os.path.splitext(letter)[0] == letter_base:
+                    conn.execute("UPDATE documents SET audit_status = 'Audited' WHERE path = ?", (letter,))
+        if doc_type in ("Draft", "Contract") and name.endswith(".txt"):
+            # Lets rebuild() recover drafts written before the index existed
+            conn.execute("INSERT OR IGNORE INTO drafts(path, project, kind, title, created) VALUES (?, ?, ?, ?, ?)",
+                         (path, project, doc_type, os.path.splitext(name)[0], st.st_mtime))
+
+    def record_document(self, project, path, sha256=None):
+        # Called right after the app writes a file, so the index never needs a rescan for our own saves
+        self._write(lambda conn: self._upsert_document(conn, project, path, sha256))
+
+    def record_draft(self, project, path, kind, title):
+        def work(conn):
+            self._upsert_document(conn, project, path)
+            conn.execute("INSERT OR REPLACE INTO drafts(path, project, kind, title, created) VALUES (?, ?, ?, ?, ?)",
+                         (path, project, kind, title, time.time()))
+        self._write(work)
+
+    def forget_document(self, path):
+        # A file that vanished between rescans (deleted/renamed in the synced folder)
+        def work(conn):
+            conn.execute("DELETE FROM documents WHERE path = ?", (path,))
+            conn.execute("DELETE FROM drafts WHERE path = ?", (path,))
+        self._write(work)
+
+    def set_audit_status(self, path, status):
+        self._write(lambda conn: conn.execute("UPDATE documents SET audit_status = ? WHERE path = ?", (status, path)))
+
+    def refresh_project(self, project):
+        """Re-list only the folders of this project whose mtime changed."""
+        project_folder = os.path.join(self.projects_root, project)
+
+        def work(conn):
+            changed = 0
+            for root, dirs, files in os.walk(project_folder):
+                dirs[:] = [d for d in dirs if not d.startswith(".")]  # Skip .civilex caches
+                if not self._folder_changed(conn, root):
+                    continue
+                on_disk = {os.path.join(root, f) for f in files}
+                known = {p for (p,) in conn.execute(
+                    "SELECT path FROM documents WHERE project = ? AND subfolder = ?",
+                    (project, os.path.relpath(root, project_folder) if root != project_folder else ""))}
+                for path in known - on_disk:
+                    conn.execute("DELETE FROM documents WHERE path = ?", (path,))
+                    conn.execute("DELETE FROM drafts WHERE path = ?", (path,))
+                for path in on_disk:
+                    self._upsert_document(conn, project, path)
+                changed += 1
+            return changed
+        return self._write(work)
+
+    def documents(self, project, subfolder=None):
+        sql = "SELECT path, subfolder, name, size, mtime, sha256, doc_type, audit_status FROM documents WHERE project = ?"
+        params = [project]
+        if subfolder is not None:
+            sql += " AND subfolder = ?"
+            params.append(subfolder)
+        cols = ["path", "subfolder", "name", "size", "mtime", "sha256", "doc_type", "audit_status"]
+        return [dict(zip(cols, row)) for row in self._query(sql + " ORDER BY mtime DESC", params)]
+
+    def drafts(self, project):
+        cols = ["path", "kind", "title", "created"]
+        rows = self._query("SELECT path, kind, title, created FROM drafts WHERE project = ? ORDER BY created DESC", (project,))
+        return [dict(zip(cols, row)) for row in rows]
+
+    def find_by_hash(self, sha256):
+        return [row[0] for row in self._query("SELECT path FROM documents WHERE sha256 = ?", (sha256,))]
+
+    def rebuild(self):
+        def wipe(conn):
+            for table in ("projects", "folders", "documents", "drafts"):
+                conn.execute(f"DELETE FROM {table}")
+        self._write(wipe)
+        for project in self.list_projects():
+            self.refresh_project(project)
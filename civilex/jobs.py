@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# --- BACKGROUND JOB QUEUE ---
+# Long AI operations (forensic audits, schedule extraction, batch audits) run on
+# a small worker pool instead of inside the Streamlit script, so a rerun or a
+# click on another module no longer kills them. Every job has a row in a SQLite
+# table next to the project index; workers update status/progress there and the
+# UI only reads it. Results are written into the project folder by the job
+# itself - the row just remembers where.
+#
+# Job functions get a report(progress, message) callback as first argument and
+# must not call Streamlit. Their return value (a path, or None) is stored as
+# result_path.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    project TEXT,
+    label TEXT,
+    status TEXT NOT NULL,
+    progress REAL DEFAULT 0,
+    message TEXT,
+    result_path TEXT,
+    error TEXT,
+    created REAL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_project ON jobs(project, created);
+"""
+
+
+class JobQueue:
+    def __init__(self, db_path, max_workers=2):
+        self.db_path = db_path
+        self._write_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="civilex-job")
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        # Jobs from a previous server process can't be resumed (the work lived in memory)
+        self._update("UPDATE jobs SET status = 'interrupted', finished = ? WHERE status IN ('queued', 'running')",
+                     (time.time(),))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _update(self, sql, params=()):
+        with self._write_lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(sql, params)
+            finally:
+                conn.close()
+
+    def _query(self, sql, params=()):
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+
+    def submit(self, kind, project, label, fn, *args, **kwargs):
+        job_id = uuid.uuid4().hex[:12]
+        self._update(
+            "INSERT INTO jobs(id, kind, project, label, status, message, created) VALUES (?, ?, ?, ?, 'queued', 'Waiting for a worker', ?)",
+            (job_id, kind, project, label, time.time()),
+        )
+        self._pool.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update("UPDATE jobs SET status = 'running', started = ?, message = 'Started' WHERE id = ?",
+                     (time.time(), job_id))
+
+        def report(progress=None, message=None):
+            if progress is not None:
+                self._update("UPDATE jobs SET progress = ? WHERE id = ?", (max(0.0, min(1.0, progress)), job_id))
+            if message is not None:
+                self._update("UPDATE jobs SET message = ? WHERE id = ?", (message, job_id))
+
+        try:
+            result_path = fn(report, *args, **kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            self._update("UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE id = ?",
+                         (f"{type(e).__name__}: {e}", time.time(), job_id))
+            return
+        self._update(
+            "UPDATE jobs SET status = 'done', progress = 1, message = 'Finished', result_path = ?, finished = ? WHERE id = ?",
+            (result_path, time.time(), job_id),
+        )
+
+    def get(self, job_id):
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    def jobs(self, project=None, limit=30):
+        if project:
+            return self._query("SELECT * FROM jobs WHERE project = ? ORDER BY created DESC LIMIT ?", (project, limit))
+        return self._query("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,))
+
+    def active_count(self, project=None):
+        sql = "SELECT COUNT(*) AS n FROM jobs WHERE status IN ('queued', 'running')"
+        rows = self._query(sql + " AND project = ?", (project,)) if project else self._query(sql)
+        return rows[0]["n"]
+
+    def clear_finished(self, project=None):
+        sql = "DELETE FROM jobs WHERE status NOT IN ('queued', 'running')"
+        if project:
+            self._update(sql + " AND project = ?", (project,))
+        else:
+            self._update(sql)
@@ -0,0 +1,88 @@
+# --- SHARED KNOWLEDGE & PROMPTS ---
+# Plain module constants: built once per server process when first imported and
+# shared by every session, instead of being re-created on each Streamlit rerun.
+
+# --- MASTER CONTRACT LIST ---
+MASTER_CONTRACT_LIST = [
+    "--- GOVERNMENT (SARAWAK) ---",
+    "PWD 75 (Sarawak) - Rev 2021 (Current)",
+    "PWD 75 (Sarawak) - Rev 2006 (Legacy)", 
+    "--- GOVERNMENT (FEDERAL) ---",
+    "PWD 203A (Federal) - Rev 1/2010 (Current)", 
+    "PWD 203A (Federal) - Rev 2007 (Legacy)",
+    "PWD 203 (Federal) - Lump Sum Rev 2010",
+    "PWD Design & Build (DB) - Rev 2007",
+    "PWD Form 203N (Nominated Sub-Con)",
+    "PWD Form 203P (Nominated Supplier)",
+    "--- PRIVATE SECTOR ---",
+    "PAM Contract 2018 (With Quantities)",
+    "PAM Contract 2018 (Without Quantities)",
+    "PAM Contract 2006 (Legacy)",
+    "PAM NSC 2018 (Nominated Sub-Con)",
+    "CIDB Standard Form 2022 (Collaborative)",
+    "CIDB Standard Form 2000 (Legacy)",
+    "AIAC Standard Form 2019",
+    "--- ENGINEERING ---",
+    "IEM.CE 2011 (Civil Engineering)",
+    "IEM.ME 2012 (Mech & Elec)",
+    "IEM Form 1989 (Legacy Civil)",
+    "--- INTERNATIONAL / SPECIAL ---",
+    "FIDIC Red Book (Construction)",
+    "FIDIC Yellow Book (Design-Build)",
+    "HDA Schedule G (Landed Residential)",
+    "HDA Schedule H (High-Rise Residential)"
+]
+
+# --- INTELLIGENT CONTEXT ---
+MY_CONTEXT = """
+STRICT LANGUAGE RULE: UK/Malaysian English spelling only (Programme, Labour, Defence, Cheque).
+ROLE: Senior Consultant Quantity Surveyor (CQS) & Contract Manager in Malaysia.
+MASTER KNOWLEDGE BASE (VERSIONS & AMENDMENTS) - DO NOT HALLUCINATE:
+1. **PWD 75 (SARAWAK STATE):** Rev 2006 (Legacy), Rev 2021 (Current/Covid Clauses).
+2. **PWD 203A (FEDERAL):** Rev 2007 (Legacy), Rev 1/2010 (Current).
+3. **PAM CONTRACT:** 2006 (Legacy), 2018 (Current).
+4. **CIDB FORMS:** 2000 (Adversarial), 2022 (Collaborative/Compensation Events).
+5. **IEM FORMS:** 1989 (Old), 2011 (Civil), 2012 (ME).
+6. **STATUTORY:** HDA (Residential), CIPAA 2012 (Payment), Contracts Act 1950.
+INSTRUCTION: Identify the EXACT Version. Use correct Administrator.
+"""
+FORENSIC_PROMPT = "Forensic Audit. Identify Form & Year. Check LAD, Payment, Design Liability."
+
+SCHEDULE_PROMPT = """
+Analyze this construction document. Extract the project schedule items.
+Return ONLY a JSON list of objects.
+Format: [{"Activity": "Description", "Start Date": "YYYY-MM-DD", "End Date": "YYYY-MM-DD", "Value": 1000.50, "Cost": 800.00}]
+Rules:
+1. Look for Activity Names, Dates, and Amounts.
+2. If "Cost" is not listed, estimate it as 80% of "Value".
+3. Ensure numbers are floats (allow decimals).
+"""
+
+QUOTE_PROMPT = """
+This is a supplier's quotation / priced Bill of Quantities for a construction tender.
+Extract every priced line item.
+Return ONLY a JSON list of objects.
+Format: [{"Ref": "A.1", "Description": "Concrete grade 30 to slab", "Unit": "m3", "Qty": 12.5, "Rate": 285.00, "Amount": 3562.50}]
+Rules:
+1. Copy item references and descriptions as printed. Leave "Ref" empty if there is none.
+2. Numbers are floats without currency symbols or thousands separators. Use null when a column is blank.
+3. Skip headings, page totals, carried-forward lines and terms & conditions.
+"""
+
+# Contract families for reporting (metrics dashboard), most specific first
+CONTRACT_FAMILIES = [
+    ("PWD 75", "PWD 75 (Sarawak)"), ("PWD 203", "PWD 203/203A (Federal)"), ("PWD DB", "PWD Design & Build"),
+    ("PWD", "PWD (Other)"), ("PAM", "PAM"), ("CIDB", "CIDB"), ("AIAC", "AIAC"), ("IEM", "IEM"),
+    ("FIDIC", "FIDIC"), ("HDA", "HDA"),
+]
+
+
+def contract_family(name):
+    """'PAM 2018 Main Contract.pdf' -> 'PAM'; 'Unspecified' without a governing contract."""
+    if not name or name.startswith("---"):
+        return "Unspecified"
+    text = " ".join(name.upper().replace("_", " ").replace("-", " ").split())
+    for keyword, family in CONTRACT_FAMILIES:
+        if keyword in text or keyword.replace(" ", "") in text.replace(" ", ""):
+            return family
+    return "Other"
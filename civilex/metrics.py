@@ -0,0 +1,187 @@
+import contextlib
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+
+# --- PER-STAGE METRICS ---
+# Every AI operation (an audit, a draft, a schedule extraction...) is wrapped in
+# operation(); the hot paths underneath (file writes, uploads, the PROCESSING
+# poll, generate_content, JSON parsing, PDF rendering) open a stage() that
+# records its duration, bytes and token counts on the current operation. When
+# the operation ends it is appended as one JSON line to a per-project file on
+# local disk (.civilex/metrics/<project>.jsonl), never rewritten.
+#
+# stage() outside an operation does nothing, so library code can be
+# instrumented unconditionally. Worker pools get the caller's operation through
+# bind().
+
+STAGES = ["file_write", "queue_wait", "upload", "processing_poll", "context_cache", "generate_content",
+          "stream_response", "json_parse", "pdf_render"]
+
+_current = contextvars.ContextVar("civilex_operation", default=None)
+
+
+class Operation:
+    def __init__(self, project, module, name, contract_type=None):
+        self.record = {"ts": time.time(), "project": project, "module": module, "operation": name,
+                       "contract_type": contract_type or "Unspecified", "ok": True, "error": None,
+                       "duration": 0.0, "counters": {}, "stages": []}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage):
+        with self._lock:
+            self.record["stages"].append(stage)
+
+    def count(self, name, delta=1):
+        with self._lock:
+            counters = self.record["counters"]
+            counters[name] = counters.get(name, 0) + delta
+
+
+def count(name, delta=1):
+    op = _current.get()
+    if op is not None:
+        op.count(name, delta)
+
+
+def usage_of(response):
+    """(prompt_tokens, response_tokens) from a generate_content response, None when not reported."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None, None
+    return getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None)
+
+
+@contextlib.contextmanager
+def stage(name, **fields):
+    """Times one stage of the current operation. The yielded dict takes extra fields (bytes, tokens)."""
+    op = _current.get()
+    info = dict(fields)
+    if op is None:
+        yield info
+        return
+    started = time.perf_counter()
+    try:
+        yield info
+    except Exception as e:
+        info["error"] = type(e).__name__
+        raise
+    finally:
+        info["stage"] = name
+        info["duration"] = time.perf_counter() - started
+        op.add_stage(info)
+
+
+def add_stage(name, duration, **fields):
+    # For waits measured elsewhere (e.g. the scheduler's token bucket)
+    op = _current.get()
+    if op is not None:
+        op.add_stage({"stage": name, "duration": duration, **fields})
+
+
+def bind(fn):
+    """fn running in another thread but counted on the caller's operation."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+class MetricsStore:
+    def __init__(self, folder):
+        self.folder = folder
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def path_for(self, project):
+        safe = re.sub(r"[^A-Za-z0-9_. -]", "_", project or "_general").strip() or "_general"
+        return os.path.join(self.folder, safe + ".jsonl")
+
+    def append(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            with open(self.path_for(record.get("project")), "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def projects(self):
+        return sorted(os.path.splitext(n)[0] for n in os.listdir(self.folder) if n.endswith(".jsonl"))
+
+    def load(self, projects=None, since=None):
+        records = []
+        for project in projects if projects is not None else self.projects():
+            path = self.path_for(project)
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Half-written last line from a crash
+                    if since is None or record.get("ts", 0) >= since:
+                        records.append(record)
+        return records
+
+    @contextlib.contextmanager
+    def operation(self, project, module, name, contract_type=None):
+        op = Operation(project, module, name, contract_type)
+        token = _current.set(op)
+        started = time.perf_counter()
+        try:
+            yield op
+        except Exception as e:  # Not BaseException: Streamlit's rerun/stop are not failures
+            op.record["ok"] = False
+            op.record["error"] = f"{type(e).__name__}: {e}"[:300]
+            raise
+        finally:
+            _current.reset(token)
+            op.record["duration"] = time.perf_counter() - started
+            try:
+                self.append(op.record)
+            except OSError:
+                pass  # Metrics must never break the operation itself
+
+
+# --- REPORTING (dashboard) ---
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+def stage_frame(records):
+    """One row per stage (plus one "total" row per operation) with the operation's tags."""
+    import pandas as pd
+    rows = []
+    for r in records:
+        tags = {k: r.get(k) for k in ("ts", "project", "module", "operation", "contract_type")}
+        stages = r.get("stages", [])
+        # The total row carries what the operation uploaded and the tokens it used
+        rows.append({**tags, "stage": "total", "duration": r.get("duration", 0.0), "error": r.get("error"),
+                     "bytes": sum(s.get("bytes") or 0 for s in stages if s.get("stage") == "upload") or None,
+                     "prompt_tokens": sum(s.get("prompt_tokens") or 0 for s in stages) or None,
+                     "response_tokens": sum(s.get("response_tokens") or 0 for s in stages) or None})
+        for s in stages:
+            rows.append({**tags, "stage": s.get("stage"), "duration": s.get("duration", 0.0), "error": s.get("error"),
+                         "bytes": s.get("bytes"), "prompt_tokens": s.get("prompt_tokens"),
+                         "response_tokens": s.get("response_tokens")})
+    frame = pd.DataFrame(rows, columns=["ts", "project", "module", "operation", "contract_type", "stage", "duration",
+                                        "error", "bytes", "prompt_tokens", "response_tokens"])
+    frame["time"] = pd.to_datetime(frame["ts"], unit="s")
+    return frame
+
+
+def percentile_table(frame, by):
+    """Count, errors, p50/p95/p99 seconds, MB moved and tokens per group."""
+    import pandas as pd
+    if frame.empty:
+        return pd.DataFrame()
+    grouped = frame.groupby(by, dropna=False)
+    table = grouped["duration"].quantile(list(PERCENTILES)).unstack()
+    table.columns = [f"p{int(q * 100)} (s)" for q in PERCENTILES]
+    table.insert(0, "Count", grouped.size())
+    table.insert(1, "Errors", grouped["error"].count())
+    table["Total (s)"] = grouped["duration"].sum()
+    table["MB"] = grouped["bytes"].sum(min_count=1) / 1e6
+    table["Prompt Tokens"] = grouped["prompt_tokens"].sum(min_count=1)
+    table["Response Tokens"] = grouped["response_tokens"].sum(min_count=1)
+    return table.round(3).reset_index()
@@ -0,0 +1,84 @@
+import os
+
+import fpdf
+from fpdf import FPDF
+
+# --- PDF EXPORT ---
+# Imported only when a report/letter is turned into a PDF (keeps fpdf off the startup path).
+# Text is set in a Unicode TrueType font when one can be found, so “quotes”, dashes,
+# bullets and non-Latin names survive; otherwise it falls back to Arial + latin-1.
+#
+#   CIVILEX_PDF_FONT=C:\Windows\Fonts\calibri.ttf   (any .ttf)
+
+FONT_ENV = "CIVILEX_PDF_FONT"
+FONT_CANDIDATES = [
+    os.path.join(os.path.dirname(__file__), "fonts", "DejaVuSans.ttf"),
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    r"C:\Windows\Fonts\arial.ttf",
+]
+
+fpdf.set_global("FPDF_CACHE_MODE", 1)  # Don't write .pkl metric caches next to system fonts
+
+
+class PDF(FPDF):
+    def header(self):
+        self.set_font('Arial', 'B', 12)
+        self.cell(0, 10, 'Civilex AI - Professional Document', 0, 1, 'C')
+        self.line(10, 20, 200, 20)
+        self.ln(10)
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 8)
+        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+
+
+def unicode_font_path():
+    for path in [os.environ.get(FONT_ENV)] + FONT_CANDIDATES:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def _printable(text, widths):
+    # fpdf's TrueType subsetting breaks on characters above U+FFFF (emoji) and prints
+    # nothing useful for characters the font has no glyph for: replace both
+    out = []
+    for ch in text:
+        code = ord(ch)
+        if ch in "\n\r\t" or (code <= 0xFFFF and widths[code]):
+            out.append(ch)
+        elif 0xFE00 <= code <= 0xFE0F or code == 0x200D:
+            continue  # Emoji variation selectors / joiners: nothing to print
+        else:
+            out.append("?")
+    return "".join(out)
+
+
+def _render(text, font_size, font_path):
+    pdf = PDF()
+    if font_path:
+        pdf.add_font("Body", "", font_path, uni=True)
+        text = _printable(text, pdf.fonts["body"]["cw"])
+    pdf.add_page()
+    if font_path:
+        pdf.set_font("Body", size=font_size)
+    else:
+        pdf.set_font("Arial", size=font_size)
+        text = text.encode('latin-1', 'replace').decode('latin-1')
+    pdf.multi_cell(0, 5, text)
+    return pdf.output(dest='S').encode('latin-1')
+
+
+def render_text_pdf(text, font_size=10):
+    """Plain report/letter text -> PDF bytes. Markdown bold markers are dropped."""
+    text = text.replace("**", "")
+    font_path = unicode_font_path()
+    if font_path:
+        try:
+            return _render(text, font_size, font_path)
+        except Exception:
+            pass  # Unreadable font file or a glyph fpdf can't subset: fall back rather than fail the page
+    return _render(text, font_size, None)
@@ -0,0 +1,124 @@
+import io
+import re
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # Without pypdf every call simply sends the full file, as before
+    PdfReader = PdfWriter = None
+
+# --- LOCAL PDF PRE-PROCESSING ---
+# Read the PDF's own text layer locally, find the pages that matter for a task
+# (Contract Particulars / Appendix for payment terms, priced tables for a BQ)
+# and send only those to Gemini. Falls back to the whole file when the PDF is
+# scanned (no text layer), small, or nothing relevant was found.
+
+PROFILES = {
+    # Extract Terms: payment / retention / LAD clauses and the Appendix where the numbers live
+    "terms": {
+        "keywords": {
+            "period of honouring": 6, "honouring certificate": 6, "period of payment": 6,
+            "payment period": 4, "retention": 3, "limit of retention": 6, "retention fund": 3,
+            "liquidated": 3, "ascertained damages": 4, "lad": 2, "appendix": 3,
+            "contract particulars": 5, "articles of agreement": 2, "interim certificate": 2,
+        },
+        "numeric_weight": 0.0,
+        "min_score": 3,
+        "max_pages": 8,
+        "neighbours": 1,  # Clause text often runs onto the next page
+        "send": "text",
+    },
+    # Extract Schedule: priced BQ / programme tables - keep layout, so send the pages as PDF
+    "schedule": {
+        "keywords": {
+            "bill of quantities": 3, "qty": 2, "unit": 1, "rate": 2, "amount": 2, "rm": 1,
+            "duration": 2, "start": 1, "finish": 1, "programme": 2, "activity": 2, "total": 1,
+        },
+        "numeric_weight": 0.25,
+        "min_score": 6,
+        "max_pages": None,
+        "neighbours": 0,
+        "send": "pdf",
+    },
+}
+
+MIN_CHARS_PER_PAGE = 200  # Below this the PDF is probably a scan
+SMALL_DOC_PAGES = 4       # Not worth trimming
+
+_MONEY_RE = re.compile(r"\d[\d,]*\.\d{2}\b")
+
+
+def page_texts(data):
+    reader = PdfReader(io.BytesIO(bytes(data)))
+    texts = []
+    for page in reader.pages:
+        try:
+            texts.append(page.extract_text() or "")
+        except Exception:
+            texts.append("")
+    return texts
+
+
+def score_page(text, profile):
+    low = text.lower()
+    score = sum(weight * len(re.findall(rf"\b{re.escape(k)}\b", low)) for k, weight in profile["keywords"].items())
+    if profile["numeric_weight"]:
+        score += profile["numeric_weight"] * len(_MONEY_RE.findall(text))
+    return score
+
+
+def select_pages(texts, profile):
+    scores = [score_page(t, profile) for t in texts]
+    ranked = sorted((i for i, s in enumerate(scores) if s >= profile["min_score"]), key=lambda i: -scores[i])
+    if profile["max_pages"]:
+        ranked = ranked[:profile["max_pages"]]
+    chosen = set(ranked)
+    for i in ranked:
+        for j in range(i - profile["neighbours"], i + profile["neighbours"] + 1):
+            if 0 <= j < len(texts):
+                chosen.add(j)
+    return sorted(chosen)
+
+
+def subset_pdf(data, pages):
+    reader = PdfReader(io.BytesIO(bytes(data)))
+    writer = PdfWriter()
+    for i in pages:
+        writer.add_page(reader.pages[i])
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def pages_as_text(texts, pages):
+    return "\n\n".join(f"--- PAGE {i + 1} ---\n{texts[i].strip()}" for i in pages)
+
+
+def prepare_document(data, profile_name):
+    """Decide what to send for this task.
+
+    Returns {"mode": "text"|"pages"|"full", "pages": [...], "page_count": n,
+             "text": str (mode text), "pdf_bytes": bytes (mode pages), "reason": str}.
+    """
+    full = {"mode": "full", "pages": [], "page_count": 0, "text": None, "pdf_bytes": None}
+    if PdfReader is None:
+        return {**full, "reason": "pypdf not installed"}
+    try:
+        texts = page_texts(data)
+    except Exception as e:
+        return {**full, "reason": f"could not read PDF locally ({e})"}
+
+    full["page_count"] = len(texts)
+    if len(texts) <= SMALL_DOC_PAGES:
+        return {**full, "reason": "short document"}
+    if sum(len(t) for t in texts) < MIN_CHARS_PER_PAGE * len(texts):
+        return {**full, "reason": "scanned PDF (no text layer)"}
+
+    profile = PROFILES[profile_name]
+    pages = select_pages(texts, profile)
+    if not pages:
+        return {**full, "reason": "no relevant pages found"}
+
+    result = {**full, "pages": pages, "reason": f"{len(pages)} of {len(texts)} pages"}
+    if profile["send"] == "text":
+        return {**result, "mode": "text", "text": pages_as_text(texts, pages)}
+    return {**result, "mode": "pages", "pdf_bytes": subset_pdf(data, pages)}
@@ -0,0 +1,100 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from civilex.cashflow import simulate_cash_flow
+from civilex.storage import load_schedule, load_terms
+
+# --- PORTFOLIO CASH FLOW ---
+# The overdraft facility is shared by every job, so simulate each project's saved
+# schedule + terms (Tenders/03_Cost_Analysis) in worker processes and merge the
+# monthly ledgers into one company-wide view.
+
+SERIAL_THRESHOLD = 4  # Below this, process start-up costs more than it saves
+
+
+def _simulate_project(args):
+    # Runs in a worker process: only plain data in and out
+    project_name, project_folder, distribution, resolution = args
+    try:
+        schedule = load_schedule(project_folder)
+        if schedule is None or schedule.empty:
+            return project_name, None, "No saved schedule"
+        terms = load_terms(project_folder)
+        ledger, summary = simulate_cash_flow(schedule, terms, 0.0, distribution=distribution, resolution=resolution)
+    except Exception as e:
+        # A malformed or legacy schedule (bad dates, missing column) skips this project, not the portfolio
+        return project_name, None, f"Could not simulate: {type(e).__name__}: {e}"[:200]
+    if ledger.empty:
+        return project_name, None, "No dated activities"
+    return project_name, {"month": ledger["Month"].astype(str).tolist(), "amount": ledger["Amount"].to_numpy(), **summary}, None
+
+
+def _run_all(jobs, max_workers):
+    if len(jobs) < SERIAL_THRESHOLD:
+        return [_simulate_project(job) for job in jobs]
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(_simulate_project, jobs))
+    except (BrokenProcessPool, OSError, PermissionError):
+        # Some hosts forbid subprocesses - threads still overlap the file reads
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(_simulate_project, jobs))
+
+
+def simulate_portfolio(projects_root, project_names, start_balance=0.0, distribution="lump", resolution="monthly", max_workers=None):
+    """Company-wide cash flow. Returns {"ledger", "drivers", "peak_month", "peak_balance", "skipped"}."""
+    jobs = [(name, os.path.join(projects_root, name), distribution, resolution) for name in project_names]
+    results = _run_all(jobs, max_workers)
+
+    per_project = {}
+    skipped = {}
+    for name, result, reason in results:
+        if result is None:
+            skipped[name] = reason
+        else:
+            per_project[name] = result
+    if not per_project:
+        return {"ledger": pd.DataFrame(), "drivers": pd.DataFrame(), "peak_month": None, "peak_balance": float(start_balance), "skipped": skipped}
+
+    # One month x project matrix over the union of all project months
+    months = pd.PeriodIndex(sorted({m for r in per_project.values() for m in r["month"]}), freq="M")
+    months = pd.period_range(months.min(), months.max(), freq="M")
+    position = {str(m): i for i, m in enumerate(months)}
+    names = list(per_project)
+    flows = np.zeros((len(months), len(names)))
+    for j, name in enumerate(names):
+        rows = [position[m] for m in per_project[name]["month"]]
+        flows[rows, j] = per_project[name]["amount"]
+
+    cumulative = np.cumsum(flows, axis=0)
+    company_balance = cumulative.sum(axis=1) + start_balance
+    peak = int(np.argmin(company_balance))
+
+    ledger = pd.DataFrame(flows, columns=names)
+    ledger.insert(0, "Month_Str", months.astype(str))
+    ledger.insert(0, "Month", months)
+    ledger["Total"] = flows.sum(axis=1)
+    ledger["Cumulative Balance"] = company_balance
+
+    # Who is holding the cash at the company's worst month
+    at_peak = cumulative[peak]
+    need = at_peak[at_peak < 0].sum()
+    drivers = pd.DataFrame({
+        "Project": names,
+        "Position at Peak (RM)": at_peak,
+        "Share of Peak Need (%)": np.where(at_peak < 0, at_peak / need * 100 if need else 0.0, 0.0),
+        "Own Lowest Balance (RM)": [per_project[n]["min_balance"] for n in names],
+        "Contract Sum (RM)": [per_project[n]["contract_sum"] for n in names],
+    }).sort_values("Position at Peak (RM)").reset_index(drop=True)
+
+    return {
+        "ledger": ledger,
+        "drivers": drivers,
+        "peak_month": str(months[peak]),
+        "peak_balance": float(company_balance[peak]),
+        "skipped": skipped,
+    }
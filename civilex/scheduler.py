@@ -0,0 +1,229 @@
+import collections
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from civilex import metrics
+from civilex.backend import BackendError, RateLimitError
+
+# --- RATE-LIMITED REQUEST SCHEDULER ---
+# One scheduler is shared by every session on the server. Each model call and
+# upload first takes a token from a bucket sized to the API quota (requests per
+# minute). 429s and transient server errors are retried with full-jitter
+# exponential backoff; a 429 also empties the bucket so the other sessions back
+# off too instead of piling on. Identical generate_content calls that are
+# already in flight (same model, same prompt, same uploaded file) are coalesced:
+# the second caller waits for the first one's answer instead of paying again.
+#
+# ScheduledBackend wraps any civilex.backend backend, so the rest of the app is
+# unchanged.
+
+# google.api_core exception names, matched by name so the stub works without it
+RETRYABLE_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError", "DeadlineExceeded"}
+RATE_LIMIT_NAMES = {"ResourceExhausted", "TooManyRequests"}
+
+
+class QuotaExceededError(RateLimitError):
+    """Still rate limited after all retries - shown to the user instead of a stack trace."""
+
+
+def is_rate_limit(exc):
+    return isinstance(exc, RateLimitError) or type(exc).__name__ in RATE_LIMIT_NAMES or getattr(exc, "code", None) == 429
+
+
+def is_retryable(exc):
+    if is_rate_limit(exc) or type(exc).__name__ in RETRYABLE_NAMES:
+        return True
+    return isinstance(exc, BackendError) and (exc.status or 0) >= 500
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1, rate_per_minute // 4))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        # Blocks until a token is free; returns the seconds spent waiting
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return time.monotonic() - started
+                need = (1 - self.tokens) / self.rate
+            time.sleep(min(need, 1.0) + random.uniform(0, 0.05))
+
+    def drain(self):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+
+class RequestScheduler:
+    def __init__(self, requests_per_minute=15, burst=None, max_retries=4, base_delay=1.0, max_delay=30.0):
+        self.bucket = TokenBucket(requests_per_minute, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._in_flight = {}  # coalescing key -> Future
+        self._waits = collections.deque(maxlen=200)
+        self.counters = {"calls": 0, "waiting": 0, "running": 0, "retries": 0, "rate_limited": 0, "coalesced": 0, "failed": 0}
+
+    def _count(self, name, delta=1):
+        with self._lock:
+            self.counters[name] += delta
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, *args, key=None, **kwargs):
+        if key is None:
+            return self._call_with_retries(fn, args, kwargs)
+
+        with self._lock:
+            pending = self._in_flight.get(key)
+            if pending is None:
+                future = self._in_flight[key] = Future()
+        if pending is not None:
+            self._count("coalesced")
+            metrics.count("coalesced")
+            return pending.result()  # Same request already running for someone else
+
+        try:
+            result = self._call_with_retries(fn, args, kwargs)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _call_with_retries(self, fn, args, kwargs):
+        self._count("calls")
+        attempt = 0
+        while True:
+            self._count("waiting")
+            try:
+                waited = self.bucket.acquire()
+            finally:
+                self._count("waiting", -1)
+            metrics.add_stage("queue_wait", waited, attempt=attempt)
+            with self._lock:
+                self._waits.append(waited)
+                self.counters["running"] += 1
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    self._count("failed")
+                    raise
+                if is_rate_limit(e):
+                    self._count("rate_limited")
+                    self.bucket.drain()
+                if attempt >= self.max_retries:
+                    self._count("failed")
+                    if is_rate_limit(e):
+                        raise QuotaExceededError(
+                            "The AI service is over its request quota right now. Please try again in a minute.", status=429
+                        ) from e
+                    raise
+                self._count("retries")
+                metrics.count("retries")
+                time.sleep(self.backoff(attempt))
+                attempt += 1
+            finally:
+                self._count("running", -1)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = dict(self.counters)
+        stats["avg_wait"] = sum(waits) / len(waits) if waits else 0.0
+        stats["p95_wait"] = waits[int(0.95 * (len(waits) - 1))] if waits else 0.0
+        return stats
+
+
+# --- BACKEND WRAPPERS ---
+
+def request_key(model_name, contents, cached_content=None):
+    h = hashlib.sha256(f"{model_name}\0{cached_content}".encode())
+    for part in contents if isinstance(contents, list) else [contents]:
+        h.update(b"\0")
+        h.update(part.encode() if isinstance(part, str) else f"file:{getattr(part, 'name', repr(part))}".encode())
+    return h.hexdigest()
+
+
+class ScheduledModel:
+    def __init__(self, model, scheduler, model_name, cached_content=None):
+        self.model = model
+        self.scheduler = scheduler
+        self.model_name = model_name
+        self.cached_content = cached_content
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        with metrics.stage("generate_content", model=self.model_name, cached=self.cached_content is not None) as info:
+            if stream:
+                # A stream can't be shared or replayed; only opening it is scheduled/retried (and timed)
+                info["stream"] = True
+                return self.scheduler.call(self.model.generate_content, contents, stream=True, **kwargs)
+            key = request_key(self.model_name, contents, self.cached_content)
+            response = self.scheduler.call(self.model.generate_content, contents, key=key, **kwargs)
+            info["prompt_tokens"], info["response_tokens"] = metrics.usage_of(response)
+            return response
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class ScheduledCacheBackend:
+    def __init__(self, cache_backend, scheduler):
+        self.cache_backend = cache_backend
+        self.scheduler = scheduler
+
+    def create(self, *args, **kwargs):
+        with metrics.stage("context_cache"):
+            return self.scheduler.call(self.cache_backend.create, *args, **kwargs)
+
+    def model_for(self, handle):
+        model_name = getattr(self.cache_backend, "model_name", "")
+        return ScheduledModel(self.cache_backend.model_for(handle), self.scheduler, model_name, cached_content=handle)
+
+    def __getattr__(self, name):
+        return getattr(self.cache_backend, name)
+
+
+class ScheduledBackend:
+    def __init__(self, backend, scheduler):
+        self.backend = backend
+        self.scheduler = scheduler
+        self.name = backend.name
+
+    def upload_file(self, source, display_name=None, mime_type=None):
+        def attempt():
+            if hasattr(source, "seek"):
+                source.seek(0)  # A retried upload must send the whole file again
+            return self.backend.upload_file(source, display_name=display_name, mime_type=mime_type)
+        return self.scheduler.call(attempt)
+
+    def get_file(self, name):
+        return self.backend.get_file(name)  # Status polls are cheap and already back off
+
+    def model(self, model_name):
+        return ScheduledModel(self.backend.model(model_name), self.scheduler, model_name)
+
+    def cache_backend(self, model_name):
+        return ScheduledCacheBackend(self.backend.cache_backend(model_name), self.scheduler)
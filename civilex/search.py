@@ -0,0 +1,207 @@
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # Optional: without it PDFs are searchable by file name only
+    PdfReader = None
+
+# --- FULL-TEXT SEARCH OVER PROJECT CORRESPONDENCE ---
+# SQLite FTS5 index of letters, drafts, contracts and audit reports. Documents are
+# split into ~1,500 character passages so a search (or the Drafter's automatic
+# "prior correspondence" lookup) returns the relevant clause, not a whole file.
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5(
+    title, body, path UNINDEXED, project UNINDEXED, kind UNINDEXED,
+    tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS search_files (
+    path TEXT PRIMARY KEY,
+    project TEXT NOT NULL,
+    mtime REAL NOT NULL
+);
+"""
+
+TEXT_EXTENSIONS = (".txt", ".md")
+SEARCHABLE_FOLDERS = ("Incoming_Letters", "Outgoing_Drafts", "Contracts")
+PASSAGE_CHARS = 1500
+
+_STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "our", "your", "are", "was", "were", "has", "have",
+    "due", "claim", "letter", "draft", "dear", "sir", "please", "kindly", "regards",
+}
+
+
+def extract_pdf_text(path):
+    if PdfReader is None:
+        return ""
+    try:
+        return "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    except Exception:
+        return ""  # Scanned/encrypted PDFs: nothing to index
+
+
+def split_passages(text, size=PASSAGE_CHARS):
+    # Break on paragraph boundaries where possible so clauses stay together
+    passages, current = [], ""
+    for para in re.split(r"\n\s*\n", text or ""):
+        para = para.strip()
+        if not para:
+            continue
+        if current and len(current) + len(para) > size:
+            passages.append(current)
+            current = ""
+        while len(para) > size:
+            passages.append(para[:size])
+            para = para[size:]
+        current = f"{current}\n\n{para}" if current else para
+    if current:
+        passages.append(current)
+    return passages
+
+
+def to_fts_query(text, max_terms=12):
+    # Free text -> OR query of quoted terms (quotes stop FTS5 from parsing user punctuation)
+    terms = []
+    for word in re.findall(r"[A-Za-z0-9][A-Za-z0-9.]*", text or ""):
+        word = word.strip(".").lower()
+        if len(word) > 2 and word not in _STOPWORDS and word not in terms:
+            terms.append(word)
+    return " OR ".join(f'"{t}"' for t in terms[:max_terms])
+
+
+def kind_for(path):
+    name = os.path.basename(path)
+    if name.endswith("_Forensic_Report.md"):
+        return "Audit Report"
+    for folder in SEARCHABLE_FOLDERS:
+        if f"{os.sep}{folder}{os.sep}" in path:
+            return folder.replace("_", " ")
+    return "Document"
+
+
+class DocumentSearch:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._write_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="civilex-search")  # PDF parsing off the UI thread
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def index_text(self, project, path, text, mtime=None):
+        title = os.path.basename(path)
+        rows = [(title, passage, path, project, kind_for(path)) for passage in split_passages(text)]
+        if not rows:
+            rows = [(title, "", path, project, kind_for(path))]  # Still findable by name
+        if mtime is None:
+            mtime = os.path.getmtime(path) if os.path.exists(path) else 0.0
+        with self._write_lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM passages WHERE path = ?", (path,))
+                    conn.executemany("INSERT INTO passages(title, body, path, project, kind) VALUES (?, ?, ?, ?, ?)", rows)
+                    conn.execute("INSERT OR REPLACE INTO search_files(path, project, mtime) VALUES (?, ?, ?)", (path, project, mtime))
+            finally:
+                conn.close()
+
+    def index_file(self, project, path):
+        if path.lower().endswith(".pdf"):
+            text = extract_pdf_text(path)
+        elif path.lower().endswith(TEXT_EXTENSIONS):
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        else:
+            return False
+        self.index_text(project, path, text)
+        return True
+
+    def index_file_async(self, project, path):
+        return self._pool.submit(self.index_file, project, path)
+
+    def remove(self, path):
+        with self._write_lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM passages WHERE path = ?", (path,))
+                    conn.execute("DELETE FROM search_files WHERE path = ?", (path,))
+            finally:
+                conn.close()
+
+    def sync_project(self, project_folder, project):
+        """Index new/changed files and drop deleted ones. Returns number of files (re)indexed."""
+        conn = self._connect()
+        try:
+            known = dict(conn.execute("SELECT path, mtime FROM search_files WHERE project = ?", (project,)).fetchall())
+        finally:
+            conn.close()
+
+        seen, changed = set(), 0
+        for folder in SEARCHABLE_FOLDERS:
+            for root, _dirs, files in os.walk(os.path.join(project_folder, folder)):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if not name.lower().endswith(TEXT_EXTENSIONS + (".pdf",)):
+                        continue
+                    seen.add(path)
+                    if known.get(path) == os.path.getmtime(path):
+                        continue
+                    if self.index_file(project, path):
+                        changed += 1
+        for path in set(known) - seen:
+            self.remove(path)
+        return changed
+
+    def search(self, query, project=None, limit=10, kinds=None):
+        fts_query = to_fts_query(query)
+        if not fts_query:
+            return []
+        sql = ("SELECT path, project, kind, title, snippet(passages, 1, '**', '**', ' … ', 24), body, bm25(passages) "
+               "FROM passages WHERE passages MATCH ?")
+        params = [fts_query]
+        if project:
+            sql += " AND project = ?"
+            params.append(project)
+        if kinds:
+            sql += f" AND kind IN ({','.join('?' * len(kinds))})"
+            params.extend(kinds)
+        sql += " ORDER BY bm25(passages) LIMIT ?"
+        params.append(limit)
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        cols = ["path", "project", "kind", "title", "snippet", "passage", "score"]
+        return [dict(zip(cols, row)) for row in rows]
+
+    def related_context(self, query, project, max_chars=6000, limit=6, exclude_paths=()):
+        """Best-matching prior passages formatted for a prompt (one passage per file)."""
+        parts, used, total = [], set(exclude_paths), 0
+        for hit in self.search(query, project=project, limit=limit * 3):
+            if hit["path"] in used or not hit["passage"]:
+                continue
+            block = f"[{hit['kind']}: {hit['title']}]\n{hit['passage']}"
+            if total + len(block) > max_chars:
+                break
+            parts.append(block)
+            used.add(hit["path"])
+            total += len(block)
+            if len(parts) >= limit:
+                break
+        return "\n\n".join(parts)
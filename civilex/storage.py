@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# --- PROJECT SCHEDULE & TERMS STORAGE ---
+# The Commercial Manager's schedule table and money terms are saved inside the
+# project (Tenders/03_Cost_Analysis) so they survive a browser refresh and other
+# tools (portfolio cash flow, reports) can read them.
+#
+# Schedules are stored column by column in a compressed NumPy archive: dates as
+# datetime64[D], money as float64, text as fixed-width unicode. No pickle, no
+# extra dependency, and a 50k-line BQ loads in milliseconds.
+
+COST_ANALYSIS_DIR = os.path.join("Tenders", "03_Cost_Analysis")
+SCHEDULE_FILE = "schedule.npz"
+LEGACY_SCHEDULE_FILE = "schedule.csv"
+TERMS_FILE = "comm_terms.json"
+
+_COLUMNS_KEY = "__columns__"
+_KINDS_KEY = "__kinds__"
+
+
+def cost_analysis_folder(project_folder):
+    return os.path.join(project_folder, COST_ANALYSIS_DIR)
+
+
+def _column_arrays(df):
+    arrays, kinds = {}, []
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series) or col in ("Start Date", "End Date"):
+            arrays[f"c{i}"] = pd.to_datetime(series, errors="coerce").to_numpy(dtype="datetime64[D]")
+            kinds.append("date")
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            arrays[f"c{i}"] = series.to_numpy(dtype=float)
+            kinds.append("number")
+        else:
+            arrays[f"c{i}"] = series.fillna("").astype(str).to_numpy(dtype=str)
+            kinds.append("text")
+    arrays[_COLUMNS_KEY] = np.array([str(c) for c in df.columns], dtype=str)
+    arrays[_KINDS_KEY] = np.array(kinds, dtype=str)
+    return arrays
+
+
+def frame_fingerprint(df):
+    # Hash of the stored representation, so dtype noise from st.data_editor doesn't count as an edit
+    h = hashlib.sha256()
+    for key, values in sorted(_column_arrays(df).items()):
+        h.update(key.encode())
+        h.update(np.ascontiguousarray(values).tobytes())
+    return h.hexdigest()
+
+
+def terms_fingerprint(comm_terms):
+    return hashlib.sha256(json.dumps(comm_terms, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _atomic_write(path, write):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # Sessions saving the same project run on different threads
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def save_schedule(project_folder, schedule_df):
+    folder = cost_analysis_folder(project_folder)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, SCHEDULE_FILE)
+    arrays = _column_arrays(schedule_df)
+    _atomic_write(path, lambda f: np.savez_compressed(f, **arrays))
+    return path
+
+
+def load_schedule(project_folder):
+    folder = cost_analysis_folder(project_folder)
+    path = os.path.join(folder, SCHEDULE_FILE)
+    if os.path.exists(path):
+        with np.load(path, allow_pickle=False) as store:
+            columns = store[_COLUMNS_KEY].tolist()
+            kinds = store[_KINDS_KEY].tolist()
+            data = {}
+            for i, (col, kind) in enumerate(zip(columns, kinds)):
+                values = store[f"c{i}"]
+                data[col] = pd.to_datetime(values) if kind == "date" else values
+            return pd.DataFrame(data, columns=columns)
+
+    # Projects saved before the NumPy store
+    legacy_path = os.path.join(folder, LEGACY_SCHEDULE_FILE)
+    if os.path.exists(legacy_path):
+        return pd.read_csv(legacy_path, parse_dates=["Start Date", "End Date"])
+    return None
+
+
+def save_terms(project_folder, comm_terms):
+    folder = cost_analysis_folder(project_folder)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, TERMS_FILE)
+    payload = json.dumps(comm_terms, indent=2, default=float).encode("utf-8")
+    _atomic_write(path, lambda f: f.write(payload))
+    return path
+
+
+def load_terms(project_folder):
+    path = os.path.join(cost_analysis_folder(project_folder), TERMS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ProjectStore:
+    """Remembers what was last written so repeated Streamlit reruns only save real edits."""
+
+    def __init__(self, project_folder):
+        self.project_folder = project_folder
+        self._schedule_fp = None
+        self._terms_fp = None
+
+    def load(self):
+        schedule = load_schedule(self.project_folder)
+        terms = load_terms(self.project_folder)
+        if schedule is not None:
+            self._schedule_fp = frame_fingerprint(schedule)
+        if terms is not None:
+            self._terms_fp = terms_fingerprint(terms)
+        return schedule, terms
+
+    def mark_unchanged(self, schedule_df=None, comm_terms=None):
+        # For placeholder/demo data that shouldn't be written unless the user edits it
+        if schedule_df is not None:
+            self._schedule_fp = frame_fingerprint(schedule_df)
+        if comm_terms is not None:
+            self._terms_fp = terms_fingerprint(comm_terms)
+
+    def save_schedule_if_changed(self, schedule_df):
+        fp = frame_fingerprint(schedule_df)
+        if fp == self._schedule_fp:
+            return False
+        save_schedule(self.project_folder, schedule_df)
+        self._schedule_fp = fp
+        return True
+
+    def save_terms_if_changed(self, comm_terms):
+        fp = terms_fingerprint(comm_terms)
+        if fp == self._terms_fp:
+            return False
+        save_terms(self.project_folder, comm_terms)
+        self._terms_fp = fp
+        return True
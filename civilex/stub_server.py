@@ -0,0 +1,259 @@
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- LOCAL STAND-IN MODEL SERVER ---
+# Speaks just enough of an upload/poll/generate/cache API for StubBackend
+# (civilex.backend) with configurable latency, PROCESSING time, 429/500 error
+# rates and canned outputs. Used for load tests and the benchmark suite.
+#
+#   python -m civilex.stub_server --port 8765 --generate-latency 2.0 --error-rate 0.05
+#   python -m civilex.stub_server --config my_stub.json
+
+SCHEDULE_JSON = json.dumps([
+    {"Activity": "Preliminaries", "Start Date": "2025-01-01", "End Date": "2025-12-31", "Value": 150000.0, "Cost": 100000.0},
+    {"Activity": "Piling Works", "Start Date": "2025-02-01", "End Date": "2025-02-28", "Value": 300000.5, "Cost": 240000.0},
+    {"Activity": "Substructure", "Start Date": "2025-03-01", "End Date": "2025-03-31", "Value": 250000.0, "Cost": 200000.0},
+])
+
+DEFAULT_CONFIG = {
+    # [mean, jitter] in seconds
+    "latency": {
+        "upload": [0.3, 0.1],
+        "get_file": [0.05, 0.02],
+        "generate": [2.0, 0.8],
+        "first_token": [0.5, 0.2],
+        "cache": [0.4, 0.1],
+    },
+    "processing_seconds": 2.0,
+    "error_rate": 0.0,         # Share of upload/generate calls answered with 429
+    "server_error_rate": 0.0,  # Share answered with 500
+    "cache_min_chars": 0,      # Refuse cache creation below this many characters (like a min-token rule)
+    "canned": [
+        {"match": "Extract these 4 numerical values",
+         "text": '{"payment_period": 30, "honor_cert_period": 21, "retention_percent": 10, "retention_limit": 5}'},
+        {"match": "Extract the project schedule", "text": SCHEDULE_JSON},
+        {"match": "Forensic Audit",
+         "text": "## Forensic Audit\n**Form:** PWD 203A Rev 1/2010\n- LAD: Clause 40, no cap stated.\n- Payment: 30 days.\n"
+                 'SUMMARY_JSON: {"form": "PWD 203A Rev 1/2010", "lad_flag": true, "payment_flag": false, "design_liability_flag": false}'},
+        {"match": "Draft", "text": "Dear Sir,\n\nRE: NOTICE OF CLAIM\n\nWe refer to the above matter. " * 20 + "\n\nYours faithfully,"},
+    ],
+    "default_text": "OK",
+}
+
+
+def _merge(base, override):
+    out = dict(base)
+    for k, v in (override or {}).items():
+        out[k] = _merge(base[k], v) if isinstance(v, dict) and isinstance(base.get(k), dict) else v
+    return out
+
+
+class StubState:
+    def __init__(self, config):
+        self.config = _merge(DEFAULT_CONFIG, config)
+        self.lock = threading.Lock()
+        self.files = {}
+        self.caches = {}
+        self.ids = itertools.count(1)
+        self.counts = {"upload": 0, "get_file": 0, "generate": 0, "cache": 0, "errors": 0}
+
+    def sleep(self, kind):
+        mean, jitter = self.config["latency"].get(kind, [0, 0])
+        time.sleep(max(0.0, random.uniform(mean - jitter, mean + jitter)))
+
+    def injected_error(self):
+        r = random.random()
+        if r < self.config["error_rate"]:
+            return 429, "Resource has been exhausted (e.g. check quota)."
+        if r < self.config["error_rate"] + self.config["server_error_rate"]:
+            return 500, "Internal error (stub)."
+        return None
+
+    def canned_text(self, prompt):
+        for rule in self.config["canned"]:
+            if rule["match"] in prompt:
+                return rule["text"]
+        return self.config["default_text"]
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, code, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return self.rfile.read(length) if length else b""
+
+        def _count(self, kind):
+            with state.lock:
+                state.counts[kind] += 1
+
+        def _fail_if_injected(self):
+            error = state.injected_error()
+            if error:
+                with state.lock:
+                    state.counts["errors"] += 1
+                self._json(error[0], {"error": error[1]})
+                return True
+            return False
+
+        def _file_info(self, name):
+            f = state.files[name]
+            active = time.time() >= f["ready_at"]
+            return {"name": name, "display_name": f["display_name"], "state": "ACTIVE" if active else "PROCESSING",
+                    "size_bytes": f["size"]}
+
+        def do_GET(self):
+            if self.path == "/stats":
+                return self._json(200, {**state.counts, "files": len(state.files), "caches": len(state.caches)})
+            name = self.path.lstrip("/")
+            if name in state.files:
+                self._count("get_file")
+                state.sleep("get_file")
+                return self._json(200, self._file_info(name))
+            self._json(404, {"error": f"{name} not found"})
+
+        def do_DELETE(self):
+            with state.lock:
+                state.caches.pop(self.path.lstrip("/"), None)
+            self._json(200, {})
+
+        def do_POST(self):
+            if self.path == "/files":
+                return self._upload()
+            if self.path == "/generate":
+                return self._generate()
+            if self.path == "/caches":
+                return self._create_cache()
+            if self.path.endswith(":extend"):
+                name = self.path.lstrip("/")[:-len(":extend")]
+                ttl = json.loads(self._body() or b"{}").get("ttl", 3600)
+                with state.lock:
+                    if name not in state.caches:
+                        return self._json(404, {"error": f"CachedContent {name} not found"})
+                    state.caches[name] = time.time() + ttl
+                return self._json(200, {})
+            self._json(404, {"error": "unknown endpoint"})
+
+        def _upload(self):
+            data = self._body()
+            self._count("upload")
+            if self._fail_if_injected():
+                return
+            state.sleep("upload")
+            name = f"files/stub-{next(state.ids)}"
+            display_name = urllib.parse.unquote(self.headers.get("X-Display-Name", "file"))
+            with state.lock:
+                state.files[name] = {"display_name": display_name, "size": len(data),
+                                     "ready_at": time.time() + state.config["processing_seconds"]}
+            self._json(200, self._file_info(name))
+
+        def _create_cache(self):
+            body = json.loads(self._body() or b"{}")
+            self._count("cache")
+            state.sleep("cache")
+            if len(body.get("system_instruction", "")) < state.config["cache_min_chars"]:
+                return self._json(400, {"error": "Cached content is too small."})
+            name = f"cachedContents/stub-{next(state.ids)}"
+            with state.lock:
+                state.caches[name] = time.time() + body.get("ttl", 3600)
+            self._json(200, {"name": name})
+
+        def _generate(self):
+            body = json.loads(self._body() or b"{}")
+            self._count("generate")
+            for part in body.get("parts", []):
+                if "file" in part:
+                    if part["file"] not in state.files:
+                        return self._json(404, {"error": f"{part['file']} not found"})
+                    if self._file_info(part["file"])["state"] != "ACTIVE":
+                        return self._json(400, {"error": f"{part['file']} is not in an ACTIVE state"})
+            cached = body.get("cached_content")
+            if cached and state.caches.get(cached, 0) < time.time():
+                return self._json(404, {"error": f"CachedContent {cached} not found"})
+            if self._fail_if_injected():
+                return
+
+            prompt = "\n".join(p.get("text", "") for p in body.get("parts", []))
+            text = state.canned_text(prompt)
+            usage = {"prompt_token_count": len(prompt) // 4, "candidates_token_count": len(text) // 4}
+            if not body.get("stream"):
+                state.sleep("generate")
+                return self._json(200, {"text": text, "usage": usage})
+
+            # Stream NDJSON chunks: first one after first_token latency, the rest spread over generate latency
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            state.sleep("first_token")
+            pieces = [text[i:i + 60] for i in range(0, len(text), 60)] or [""]
+            gap = state.config["latency"]["generate"][0] / max(len(pieces), 1)
+            for i, piece in enumerate(pieces):
+                line = json.dumps({"text": piece, "usage": usage if i == len(pieces) - 1 else None}).encode() + b"\n"
+                self.wfile.write(f"{len(line):X}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+                time.sleep(gap)
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """Start in a background thread. Returns (server, base_url); call server.shutdown() to stop."""
+    state = StubState(config or {})
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True, name="civilex-stub").start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Civilex offline model stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--config", help="JSON file overriding DEFAULT_CONFIG")
+    parser.add_argument("--generate-latency", type=float)
+    parser.add_argument("--processing-seconds", type=float)
+    parser.add_argument("--error-rate", type=float)
+    args = parser.parse_args()
+
+    config = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    if args.generate_latency is not None:
+        config.setdefault("latency", {})["generate"] = [args.generate_latency, args.generate_latency * 0.3]
+    if args.processing_seconds is not None:
+        config["processing_seconds"] = args.processing_seconds
+    if args.error_rate is not None:
+        config["error_rate"] = args.error_rate
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(StubState(config)))
+    print(f"Civilex stub listening on http://{args.host}:{args.port}  (CIVILEX_BACKEND=stub)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
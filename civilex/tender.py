@@ -0,0 +1,452 @@
+import json
+import math
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from civilex import pdftext
+from civilex.cache import make_cache_key
+
+# --- SUPPLIER QUOTE COMPARISON ---
+# Reads every quote in Tenders/02_Supplier_Quotes into one line-item table,
+# matches each quote line to a BQ item from Tenders/01_BQ_Documents and builds
+# the (BQ item x supplier) rate matrix: lowest rate, spread, missing prices.
+#
+# Matching is TF-IDF cosine over description tokens, done through an inverted
+# index of the BQ (token -> items): each quote line only looks at the items that
+# share its rarest words, and only the best few of those get a full cosine -
+# no pairwise string comparison. Everything is scored with bincount/searchsorted.
+#
+# Quotes/BQs can be CSV, Excel (needs openpyxl) or PDF with a text layer.
+# Scanned PDFs go through extract_fn(pdf_bytes, name) -> [{"description", "unit",
+# "qty", "rate", "amount", "ref"}] when one is given (the app passes an AI reader).
+# Supplier = sub-folder name when quotes are filed per supplier, else file name.
+
+QUOTES_FOLDER = os.path.join("Tenders", "02_Supplier_Quotes")
+BQ_FOLDER = os.path.join("Tenders", "01_BQ_Documents")
+ANALYSIS_FOLDER = os.path.join("Tenders", "03_Cost_Analysis")
+COMPARISON_NAME = "quote_comparison.csv"
+SUMMARY_NAME = "quote_summary.csv"
+LINES_NAME = "quote_lines.csv"
+
+SUPPORTED = (".csv", ".xlsx", ".xls", ".pdf")
+LINE_COLUMNS = ["Supplier", "Source", "Ref", "Description", "Unit", "Qty", "Rate", "Amount"]
+PARSER_VERSION = "quote-lines-v1"  # Bump to re-read cached files after changing the parsers
+
+MIN_SCORE = 0.45       # Cosine below this = no match (item treated as not quoted)
+REF_WEIGHT = 3.0       # A matching item reference counts like several rare words
+CANDIDATE_TOKENS = 4   # Rarest tokens per quote line used to find candidate items
+CANDIDATES_PER_LINE = 10
+BLOCK_CELLS = 4_000_000  # (lines x BQ items) accumulator size per chunk (memory bound)
+
+STOPWORDS = {"the", "and", "of", "to", "in", "for", "with", "on", "at", "as", "by", "or", "a", "an", "including",
+             "incl", "complete", "all", "be", "is", "per", "nos", "no", "item", "supply", "provide"}
+
+UNITS = {"m", "m2", "m3", "m²", "m³", "nr", "no", "nos", "kg", "t", "tonne", "ton", "item", "lot", "ls", "sum",
+         "l.s", "lm", "sqm", "cum", "set", "pcs", "pc", "day", "hr", "week", "month", "bag", "unit", "roll", "litre"}
+
+_TOKEN_RE = re.compile(r"[a-z]+|\d+(?:\.\d+)?[a-z]*")
+_NUMBER_RE = re.compile(r"^\(?-?[\d,]*\.?\d+\)?$")
+_REF_RE = re.compile(r"^([A-Z]{0,3}\d*(?:[./-]\d+)+[a-z]?|[A-Z]{1,3}\d{0,3}|\d{1,4})$")
+
+COLUMN_HINTS = {  # Exact header names win over "contains", so "Unit Rate" is a rate, not a unit
+    "Ref": ("item no", "item", "ref", "no.", "code"),
+    "Description": ("description", "desc", "particular", "work", "material"),
+    "Rate": ("rate", "unit rate", "unit price", "price", "u/price"),
+    "Unit": ("unit", "uom"),
+    "Qty": ("qty", "quantity", "quant"),
+    "Amount": ("amount", "total", "sum", "value"),
+}
+
+
+# --- PARSING ---
+
+def _number(text):
+    if isinstance(text, (int, float)) and not (isinstance(text, float) and math.isnan(text)):
+        return float(text)
+    text = str(text or "").strip()
+    if not _NUMBER_RE.match(text.replace(" ", "")):
+        return None
+    negative = text.startswith("(") or text.startswith("-")
+    try:
+        value = float(text.strip("()-").replace(",", ""))
+    except ValueError:
+        return None
+    return -value if negative else value
+
+
+def parse_text_line(line):
+    """'A.1 Concrete grade 30  m3  12.5  285.00  3,562.50' -> line item, or None."""
+    parts = line.split()
+    numbers = []
+    while parts and len(numbers) < 3 and _number(parts[-1]) is not None:
+        numbers.insert(0, _number(parts.pop()))
+    if not numbers:
+        return None
+    unit = ""
+    if parts and parts[-1].lower().strip(".") in UNITS:
+        unit = parts.pop()
+    ref = ""
+    if len(parts) > 1 and _REF_RE.match(parts[0]):
+        ref = parts.pop(0)
+    description = " ".join(parts)
+    if len(re.findall(r"[A-Za-z]{3,}", description)) < 2:
+        return None  # Headers, page totals, dates
+
+    qty = rate = amount = None
+    if len(numbers) == 3 and abs(numbers[0] * numbers[1] - numbers[2]) <= 0.01 * max(abs(numbers[2]), 1):
+        qty, rate, amount = numbers
+    elif len(numbers) >= 2:
+        qty, rate = numbers[-2], numbers[-1]  # "Qty  Rate" (amount column left blank)
+    else:
+        rate = numbers[-1]
+    return {"Ref": ref, "Description": description, "Unit": unit, "Qty": qty, "Rate": rate, "Amount": amount}
+
+
+def _pick_columns(columns):
+    lower = {c: str(c).strip().lower() for c in columns}
+    picked = {}
+    for exact in (True, False):
+        for field, hints in COLUMN_HINTS.items():
+            if field in picked:
+                continue
+            for hint in hints:
+                match = next((c for c, name in lower.items() if (name == hint if exact else hint in name)
+                              and c not in picked.values()), None)
+                if match is not None:
+                    picked[field] = match
+                    break
+    return picked
+
+
+def read_table(path):
+    if path.lower().endswith(".csv"):
+        table = pd.read_csv(path, dtype=str, keep_default_na=False)
+    else:
+        table = pd.read_excel(path, dtype=str)  # Needs openpyxl (xlsx) / xlrd (xls)
+    picked = _pick_columns(table.columns)
+    if "Description" not in picked:
+        return []
+    items = []
+    for row in table.itertuples(index=False):
+        values = dict(zip(table.columns, row))
+        item = {field: values[col] for field, col in picked.items()}
+        item = {"Ref": str(item.get("Ref") or "").strip(), "Description": str(item.get("Description") or "").strip(),
+                "Unit": str(item.get("Unit") or "").strip(), "Qty": _number(item.get("Qty")),
+                "Rate": _number(item.get("Rate")), "Amount": _number(item.get("Amount"))}
+        if item["Description"]:
+            items.append(item)
+    return items
+
+
+def read_pdf(data, name, extract_fn=None):
+    items = []
+    if pdftext.PdfReader is not None:
+        try:
+            for text in pdftext.page_texts(data):
+                items.extend(filter(None, (parse_text_line(line) for line in text.splitlines())))
+        except Exception:
+            items = []
+    if not items and extract_fn is not None:
+        # Scanned quote (no text layer): let the AI read it
+        for raw in extract_fn(data, name) or []:
+            item = {k.lower(): v for k, v in raw.items() if isinstance(k, str)}
+            items.append({"Ref": str(item.get("ref") or ""), "Description": str(item.get("description") or "").strip(),
+                          "Unit": str(item.get("unit") or ""), "Qty": _number(item.get("qty")),
+                          "Rate": _number(item.get("rate")), "Amount": _number(item.get("amount"))})
+        items = [i for i in items if i["Description"]]
+    return items
+
+
+def read_document(path, extract_fn=None, cache=None):
+    with open(path, "rb") as f:
+        data = f.read()
+    key = make_cache_key(data, PARSER_VERSION, "local" if extract_fn is None else "local+ai")
+    cached = cache.get(key) if cache else None
+    if cached is not None:
+        return json.loads(cached)
+    if path.lower().endswith(".pdf"):
+        items = read_pdf(data, os.path.basename(path), extract_fn)
+    else:
+        items = read_table(path)
+    if cache and items:
+        cache.put(key, json.dumps(items), source=os.path.basename(path))
+    return items
+
+
+def find_documents(folder):
+    found = []
+    for root, _dirs, files in os.walk(folder):
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED) and not name.startswith(("~$", ".")):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def supplier_for(path, folder):
+    rel = os.path.relpath(path, folder)
+    head = rel.split(os.sep)[0]
+    return head if head != rel else os.path.splitext(rel)[0]
+
+
+def ingest_quotes(folder, extract_fn=None, cache=None, on_progress=None):
+    """Every quote file -> one DataFrame with LINE_COLUMNS (rate filled from amount/qty when missing)."""
+    paths = find_documents(folder)
+    frames, failed = [], {}
+    for done, path in enumerate(paths, 1):
+        try:
+            items = read_document(path, extract_fn, cache)
+        except Exception as e:
+            failed[path] = str(e)
+            items = []
+        if items:
+            frame = pd.DataFrame(items)
+            frame.insert(0, "Source", os.path.basename(path))
+            frame.insert(0, "Supplier", supplier_for(path, folder))
+            frames.append(frame)
+        if on_progress:
+            on_progress(done, len(paths), path)
+    lines = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=LINE_COLUMNS)
+    lines = lines.reindex(columns=LINE_COLUMNS)
+    for col in ("Qty", "Rate", "Amount"):
+        lines[col] = pd.to_numeric(lines[col], errors="coerce")
+    derived = lines["Amount"] / lines["Qty"].where(lines["Qty"] > 0)
+    lines["Rate"] = lines["Rate"].fillna(derived)
+    return lines, failed
+
+
+def load_bq(folder, extract_fn=None, cache=None):
+    items = []
+    for path in find_documents(folder):
+        items.extend(read_document(path, extract_fn, cache))
+    bq = pd.DataFrame(items, columns=["Ref", "Description", "Unit", "Qty", "Rate", "Amount"])
+    bq = bq.drop(columns=["Rate", "Amount"]).drop_duplicates(subset=["Ref", "Description"]).reset_index(drop=True)
+    bq["Qty"] = pd.to_numeric(bq["Qty"], errors="coerce")
+    return bq
+
+
+# --- TOKEN INDEX & MATCHING ---
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(str(text).lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+class TokenIndex:
+    """Inverted index of BQ descriptions with TF-IDF weights, built once per comparison."""
+
+    def __init__(self, descriptions, refs=None):
+        self.vocab = {}
+        item_ids, token_ids = [], []
+        refs = refs if refs is not None else [""] * len(descriptions)
+        for i, (text, ref) in enumerate(zip(descriptions, refs)):
+            tokens = set(tokenize(text))
+            if ref:
+                tokens.add("#" + str(ref).strip().lower())
+            for token in tokens:
+                token_ids.append(self.vocab.setdefault(token, len(self.vocab)))
+                item_ids.append(i)
+        self.n_items = len(descriptions)
+        item_ids, token_ids = np.array(item_ids, dtype=np.int64), np.array(token_ids, dtype=np.int64)
+
+        df = np.bincount(token_ids, minlength=len(self.vocab))
+        self.idf = np.log((1 + self.n_items) / (1 + df)) + 1.0
+        self.is_ref = np.array([t.startswith("#") for t in self.vocab], dtype=bool)
+        self.idf[self.is_ref] *= REF_WEIGHT
+        # Norms leave the item ref out: a quote without refs must still score 1.0 on the right
+        # description. A shared ref is added to both sides at scoring time instead.
+        text_weight = np.where(self.is_ref[token_ids], 0.0, self.idf[token_ids])
+        self.item_norm2 = np.bincount(item_ids, weights=text_weight ** 2, minlength=self.n_items)
+
+        # Postings sorted by token: items of token t are post_items[post_start[t]:post_start[t + 1]]
+        order = np.argsort(token_ids, kind="stable")
+        self.post_items = item_ids[order]
+        self.post_start = np.concatenate([[0], np.cumsum(df)])
+        self.item_token_keys = np.sort(item_ids * len(self.vocab) + token_ids)
+
+    def _query_tokens(self, texts, refs):
+        line_ids, token_ids = [], []
+        for i, (text, ref) in enumerate(zip(texts, refs)):
+            tokens = set(tokenize(text))
+            if ref:
+                tokens.add("#" + str(ref).strip().lower())
+            for token in tokens:
+                t = self.vocab.get(token)
+                if t is not None:
+                    line_ids.append(i)
+                    token_ids.append(t)
+        return np.array(line_ids, dtype=np.int64), np.array(token_ids, dtype=np.int64)
+
+    def match(self, texts, refs=None):
+        """Best BQ item per text: (item index or -1, cosine score).
+
+        Candidates come from each line's rarest tokens (cheap), then only the
+        top few candidates per line get their full cosine over all tokens.
+        """
+        n = len(texts)
+        best_item, best_score = np.full(n, -1, dtype=np.int64), np.zeros(n)
+        if n == 0 or self.n_items == 0:
+            return best_item, best_score
+        refs = refs if refs is not None else [""] * n
+        line_ids, token_ids = self._query_tokens(texts, refs)
+        if len(line_ids) == 0:
+            return best_item, best_score
+        weights = self.idf[token_ids]
+        line_norm2 = np.bincount(line_ids, weights=np.where(self.is_ref[token_ids], 0.0, weights) ** 2, minlength=n)
+
+        # 1. Candidates: postings of each line's CANDIDATE_TOKENS rarest tokens, a chunk of lines at a time
+        rare = np.lexsort((-weights, line_ids))
+        group_start = np.r_[0, np.flatnonzero(np.diff(line_ids[rare])) + 1]
+        rank = np.arange(len(rare)) - np.repeat(group_start, np.diff(np.r_[group_start, len(rare)]))
+        rare = rare[rank < CANDIDATE_TOKENS]
+        rows_per_chunk = max(1, BLOCK_CELLS // self.n_items)
+        chunk_of = line_ids[rare] // rows_per_chunk
+        bounds = np.r_[0, np.flatnonzero(np.diff(chunk_of)) + 1, len(rare)]
+        cand_line, cand_item = [], []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            chunk = rare[lo:hi]
+            lines_, items_ = self._top_candidates(line_ids[chunk], token_ids[chunk], weights[chunk])
+            cand_line.append(lines_)
+            cand_item.append(items_)
+        cand_line, cand_item = np.concatenate(cand_line), np.concatenate(cand_item)
+        if len(cand_line) == 0:
+            return best_item, best_score
+
+        # 2. Full cosine for the survivors: every line token looked up in the item's token set
+        by_line = np.argsort(line_ids, kind="stable")
+        line_start = np.r_[0, np.cumsum(np.bincount(line_ids, minlength=n))]
+        per_cand = line_start[cand_line + 1] - line_start[cand_line]
+        cand_rep = np.repeat(np.arange(len(cand_line)), per_cand)
+        offsets = np.arange(per_cand.sum()) - np.repeat(np.cumsum(per_cand) - per_cand, per_cand)
+        tok = by_line[np.repeat(line_start[cand_line], per_cand) + offsets]
+        lookup = cand_item[cand_rep] * len(self.vocab) + token_ids[tok]
+        pos = np.minimum(np.searchsorted(self.item_token_keys, lookup), len(self.item_token_keys) - 1)
+        shared = self.item_token_keys[pos] == lookup
+        dot = np.bincount(cand_rep, weights=np.where(shared, weights[tok] ** 2, 0.0), minlength=len(cand_line))
+        ref = np.bincount(cand_rep, weights=np.where(shared & self.is_ref[token_ids[tok]], weights[tok] ** 2, 0.0),
+                          minlength=len(cand_line))
+        score = dot / np.maximum(np.sqrt((line_norm2[cand_line] + ref) * (self.item_norm2[cand_item] + ref)), 1e-12)
+
+        # Highest score per line
+        order = np.lexsort((score, cand_line))
+        last = np.flatnonzero(np.r_[cand_line[order][1:] != cand_line[order][:-1], True])
+        winners = order[last]
+        best_item[cand_line[winners]] = cand_item[winners]
+        best_score[cand_line[winners]] = score[winners]
+        return best_item, best_score
+
+    def _top_candidates(self, line_ids, token_ids, weights):
+        # Rank (line, item) pairs by the weight of the rare tokens they share; keep the best few per line
+        pair_line, pair_item = self._expand(line_ids, token_ids)
+        if len(pair_line) == 0:
+            return pair_line, pair_item
+        pair_weight = np.repeat(weights, self._counts(token_ids)) ** 2
+        first = line_ids.min()
+        rows = line_ids.max() - first + 1
+        if len(pair_line) * 4 < rows * self.n_items:
+            # Sparse: sum duplicate pairs after a sort
+            keys, inverse = np.unique((pair_line - first) * self.n_items + pair_item, return_inverse=True)
+            partial = np.bincount(inverse, weights=pair_weight)
+            cand_line, cand_item = keys // self.n_items + first, keys % self.n_items
+            order = np.lexsort((-partial, cand_line))
+            group_start = np.r_[0, np.flatnonzero(np.diff(cand_line[order])) + 1]
+            rank = np.arange(len(order)) - np.repeat(group_start, np.diff(np.r_[group_start, len(order)]))
+            keep = order[rank < CANDIDATES_PER_LINE]
+            return cand_line[keep], cand_item[keep]
+        # Dense: common tokens touch most items anyway, a (lines x items) block is cheaper than sorting
+        block = np.bincount((pair_line - first) * self.n_items + pair_item, weights=pair_weight,
+                            minlength=rows * self.n_items).reshape(rows, self.n_items)
+        k = min(CANDIDATES_PER_LINE, self.n_items)
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        keep = np.take_along_axis(block, top, axis=1) > 0
+        cand_line = np.broadcast_to(np.arange(first, first + rows)[:, None], top.shape)
+        return cand_line[keep], top[keep]
+
+    def _counts(self, token_ids):
+        return self.post_start[token_ids + 1] - self.post_start[token_ids]
+
+    def _expand(self, line_ids, token_ids):
+        # Every (line, token) -> one (line, item) pair per posting of the token
+        counts = self._counts(token_ids)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(line_ids, counts), self.post_items[np.repeat(self.post_start[token_ids], counts) + offsets]
+
+
+# --- COMPARISON ---
+
+def compare_quotes(bq, lines, min_score=MIN_SCORE):
+    """Returns (comparison_df, summary_df, matched_lines_df)."""
+    index = TokenIndex(bq["Description"].tolist(), bq["Ref"].tolist())
+    suppliers = sorted(lines["Supplier"].dropna().unique().tolist()) if len(lines) else []
+    rates = np.full((len(bq), len(suppliers)), np.nan)
+    matched = lines.copy()
+    matched["BQ Item"] = -1
+    matched["Match Score"] = 0.0
+
+    for s, supplier in enumerate(suppliers):
+        rows = np.flatnonzero((lines["Supplier"] == supplier).to_numpy())
+        quoted = lines.iloc[rows]
+        item, score = index.match(quoted["Description"].tolist(), quoted["Ref"].fillna("").tolist())
+        ok = (item >= 0) & (score >= min_score) & quoted["Rate"].notna().to_numpy()
+        matched.iloc[rows, matched.columns.get_loc("BQ Item")] = np.where(ok, item, -1)
+        matched.iloc[rows, matched.columns.get_loc("Match Score")] = score
+
+        # One rate per BQ item and supplier: the best-matching line wins
+        order = np.lexsort((score[ok], item[ok]))
+        items_ok, rates_ok = item[ok][order], quoted["Rate"].to_numpy(dtype=float)[ok][order]
+        best = np.r_[items_ok[1:] != items_ok[:-1], True] if len(items_ok) else np.zeros(0, dtype=bool)
+        rates[items_ok[best], s] = rates_ok[best]
+
+    quoted_mask = ~np.isnan(rates)
+    n_quotes = quoted_mask.sum(axis=1)
+    any_quote = n_quotes > 0
+    with np.errstate(all="ignore"):
+        lowest = np.where(any_quote, np.nanmin(np.where(quoted_mask, rates, np.inf), axis=1), np.nan)
+        highest = np.where(any_quote, np.nanmax(np.where(quoted_mask, rates, -np.inf), axis=1), np.nan)
+        spread = highest - lowest
+        spread_pct = np.where(lowest > 0, spread / lowest * 100, np.nan)
+    lowest_idx = np.argmin(np.where(quoted_mask, rates, np.inf), axis=1)
+
+    comparison = bq.copy()
+    for s, supplier in enumerate(suppliers):
+        comparison[supplier] = rates[:, s]
+    names = np.array(suppliers + [""], dtype=object)
+    comparison["Lowest Rate"] = lowest
+    comparison["Lowest Supplier"] = np.where(any_quote, names[np.where(any_quote, lowest_idx, len(suppliers))], "")
+    comparison["Spread"] = spread
+    comparison["Spread %"] = spread_pct
+    comparison["Quotes"] = n_quotes
+    missing = ~quoted_mask
+    comparison["Missing From"] = [", ".join(names[:-1][m]) for m in missing] if suppliers else ""
+
+    qty = bq["Qty"].fillna(0.0).to_numpy(dtype=float)
+    summary = pd.DataFrame({
+        "Supplier": suppliers,
+        "Items Priced": quoted_mask.sum(axis=0) if suppliers else [],
+        "Coverage %": quoted_mask.mean(axis=0) * 100 if len(bq) and suppliers else 0.0,
+        "Total (priced items)": np.nansum(rates * qty[:, None], axis=0) if suppliers else [],
+        "Lowest On": np.bincount(lowest_idx[any_quote], minlength=len(suppliers)) if suppliers else [],
+        "Lines Read": [int((lines["Supplier"] == s).sum()) for s in suppliers],
+        "Lines Unmatched": [int(((matched["Supplier"] == s) & (matched["BQ Item"] < 0)).sum()) for s in suppliers],
+    })
+    return comparison, summary, matched
+
+
+def run_comparison(project_folder, extract_fn=None, cache=None, min_score=MIN_SCORE, on_progress=None):
+    """Ingest, match, compare and save the three CSVs into Tenders/03_Cost_Analysis."""
+    bq = load_bq(os.path.join(project_folder, BQ_FOLDER), extract_fn, cache)
+    lines, failed = ingest_quotes(os.path.join(project_folder, QUOTES_FOLDER), extract_fn, cache, on_progress)
+    result = {"bq_items": len(bq), "lines": len(lines), "failed": failed, "paths": {}}
+    if bq.empty or lines.empty:
+        return {**result, "comparison": None, "summary": None}
+
+    comparison, summary, matched = compare_quotes(bq, lines, min_score)
+    out = os.path.join(project_folder, ANALYSIS_FOLDER)
+    os.makedirs(out, exist_ok=True)
+    for name, frame in ((COMPARISON_NAME, comparison), (SUMMARY_NAME, summary), (LINES_NAME, matched)):
+        path = os.path.join(out, name)
+        frame.to_csv(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        result["paths"][name] = path
+    return {**result, "comparison": comparison, "summary": summary}
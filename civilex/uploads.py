@@ -0,0 +1,86 @@
+import io
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from civilex import metrics
+from civilex.cache import content_hash
+
+# --- GEMINI FILE UPLOAD MANAGER ---
+# Gemini keeps uploaded files for 48 hours. We remember which remote file belongs
+# to which document (by SHA-256) so the Scanner, Drafter and Commercial Manager
+# can share one upload instead of paying the upload + PROCESSING wait each time.
+
+FILE_TTL_SECONDS = 47 * 3600  # Safety margin before Gemini's 48h expiry
+PROCESSING_TIMEOUT = 300
+
+
+class UploadTimeoutError(TimeoutError):
+    pass
+
+
+class UploadFailedError(RuntimeError):
+    pass
+
+
+def wait_until_active(client, remote_file, timeout=PROCESSING_TIMEOUT, first_delay=0.5, max_delay=5.0):
+    # Poll with exponential backoff instead of a fixed 1s loop
+    deadline = time.monotonic() + timeout
+    delay = first_delay
+    while remote_file.state.name == "PROCESSING":
+        if time.monotonic() + delay > deadline:
+            raise UploadTimeoutError(f"{remote_file.name} still PROCESSING after {timeout}s")
+        time.sleep(delay)
+        delay = min(delay * 1.6, max_delay)
+        remote_file = client.get_file(remote_file.name)
+    if remote_file.state.name == "FAILED":
+        raise UploadFailedError(f"Gemini could not process {remote_file.name}")
+    return remote_file
+
+
+class UploadManager:
+    def __init__(self, client, max_workers=4, ttl=FILE_TTL_SECONDS, timeout=PROCESSING_TIMEOUT):
+        self.client = client  # google.generativeai (or anything with upload_file/get_file)
+        self.ttl = ttl
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="civilex-upload")
+        self._lock = threading.RLock()
+        self._live = {}     # content hash -> (remote file, expires_at)
+        self._pending = {}  # content hash -> Future of an upload in flight
+
+    def submit(self, data, display_name, mime_type="application/pdf"):
+        # Returns a Future so callers can start several uploads and wait later
+        key = content_hash(data)
+        now = time.time()
+        with self._lock:
+            # Drop remote files past their TTL so the map doesn't grow for the life of the process
+            for expired in [k for k, (_f, expires_at) in self._live.items() if expires_at <= now]:
+                del self._live[expired]
+            live = self._live.get(key)
+            if live:
+                metrics.count("upload_reused")
+                done = Future()
+                done.set_result(live[0])
+                return done
+            if key in self._pending:
+                metrics.count("upload_shared")
+                return self._pending[key]  # Same file already uploading for someone else
+
+            future = self._pool.submit(metrics.bind(self._upload), key, bytes(data), display_name, mime_type)
+            self._pending[key] = future
+            future.add_done_callback(lambda _f: self._pending.pop(key, None))
+            return future
+
+    def upload(self, data, display_name, mime_type="application/pdf"):
+        return self.submit(data, display_name, mime_type).result()
+
+    def _upload(self, key, data, display_name, mime_type):
+        started = time.time()
+        # Streamed from memory: nothing is written to a shared temp file
+        with metrics.stage("upload", bytes=len(data)):
+            remote_file = self.client.upload_file(io.BytesIO(data), display_name=display_name, mime_type=mime_type)
+        with metrics.stage("processing_poll"):
+            remote_file = wait_until_active(self.client, remote_file, timeout=self.timeout)
+        with self._lock:
+            self._live[key] = (remote_file, started + self.ttl)
+        return remote_file
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from civilex.cashflow import DEFAULT_TERMS, retention_deductions, simulate_cash_flow
+
+
+def demo_schedule():
+    # The Commercial Manager's default table
+    return pd.DataFrame({
+        "Activity": ["Preliminaries", "Piling Works", "Substructure", "Superstructure", "Architecture", "M&E First Fix"],
+        "Start Date": pd.to_datetime(["2025-01-01", "2025-02-01", "2025-03-01", "2025-04-01", "2025-06-01", "2025-05-01"]),
+        "End Date": pd.to_datetime(["2025-12-31", "2025-02-28", "2025-03-31", "2025-06-30", "2025-09-30", "2025-08-30"]),
+        "Value (RM)": [150000.0, 300000.50, 250000.0, 800000.0, 600000.0, 400000.0],
+        "Cost (RM)": [100000.0, 240000.0, 200000.0, 650000.0, 480000.0, 320000.0],
+    })
+
+
+def original_row_loop(df, terms, start_balance=0.0):
+    # The "Run Simulation" button logic as it was in app.py before civilex.cashflow
+    df = df.copy()
+    pay_lag = terms["payment_period"] + terms["honor_cert_period"]
+    ret_percent = terms["retention_percent"] / 100
+    max_retention = df["Value (RM)"].sum() * terms["retention_limit"] / 100
+    df["End Date"] = pd.to_datetime(df["End Date"])
+    df["Cash In Date"] = df["End Date"] + pd.Timedelta(days=pay_lag)
+
+    cumulative_retention = 0
+    deductions = []
+    for val in df["Value (RM)"]:
+        potential_cut = val * ret_percent
+        if cumulative_retention + potential_cut > max_retention:
+            actual_cut = max_retention - cumulative_retention
+            cumulative_retention = max_retention
+        elif cumulative_retention >= max_retention:
+            actual_cut = 0
+        else:
+            actual_cut = potential_cut
+            cumulative_retention += actual_cut
+        deductions.append(actual_cut)
+    df["Net Cash In"] = df["Value (RM)"] - np.array(deductions)
+
+    inflow = df[["Cash In Date", "Net Cash In"]].rename(columns={"Cash In Date": "Date", "Net Cash In": "Amount"})
+    outflow = df[["End Date", "Cost (RM)"]].rename(columns={"End Date": "Date", "Cost (RM)": "Amount"})
+    outflow["Amount"] = outflow["Amount"] * -1
+    last_date = df["End Date"].max()
+    releases = pd.DataFrame([{"Date": last_date + pd.Timedelta(days=pay_lag), "Amount": cumulative_retention * 0.5},
+                             {"Date": last_date + pd.Timedelta(days=365), "Amount": cumulative_retention * 0.5}])
+    timeline = pd.concat([inflow, outflow, releases])
+    timeline["Month"] = pd.to_datetime(timeline["Date"]).dt.to_period("M")
+    monthly = timeline.groupby("Month")["Amount"].sum().reset_index()
+    monthly["Month_Str"] = monthly["Month"].astype(str)
+    monthly["Cumulative Balance"] = monthly["Amount"].cumsum() + start_balance
+    return monthly, cumulative_retention
+
+
+@pytest.mark.parametrize("start_balance", [0.0, -250000.0])
+def test_simulate_matches_original_row_loop(start_balance):
+    expected, expected_retention = original_row_loop(demo_schedule(), DEFAULT_TERMS, start_balance)
+    ledger, summary = simulate_cash_flow(demo_schedule(), DEFAULT_TERMS, start_balance)
+
+    merged = expected.merge(ledger, on="Month_Str", suffixes=("_expected", ""))
+    assert len(merged) == len(expected)  # Every month of the original is in the ledger
+    np.testing.assert_allclose(merged["Amount"], merged["Amount_expected"], atol=1e-6)
+    np.testing.assert_allclose(merged["Cumulative Balance"], merged["Cumulative Balance_expected"], atol=1e-6)
+    # Months without events (filled in by the ledger) carry no money
+    assert np.allclose(ledger.loc[~ledger["Month_Str"].isin(expected["Month_Str"]), "Amount"], 0.0)
+    assert summary["total_retention"] == pytest.approx(expected_retention)
+    assert summary["min_balance"] == pytest.approx(expected["Cumulative Balance"].min())
+
+
+def test_retention_stops_at_the_limit():
+    # 10% retention, limit 5% of 1,000,000 = 50,000: reached part-way through the third claim
+    claims = [200000.0, 200000.0, 200000.0, 200000.0, 200000.0]
+    cuts = retention_deductions(claims, 0.10, 50000.0)
+    np.testing.assert_allclose(cuts, [20000.0, 20000.0, 10000.0, 0.0, 0.0])
+
+    schedule = demo_schedule().iloc[:5].copy()
+    schedule["Value (RM)"] = claims
+    expected, expected_retention = original_row_loop(schedule, DEFAULT_TERMS)
+    _, summary = simulate_cash_flow(schedule, DEFAULT_TERMS)
+    assert summary["total_retention"] == pytest.approx(50000.0) == pytest.approx(expected_retention)
+
+
+def test_retention_below_the_limit_is_kept_in_full():
+    terms = {**DEFAULT_TERMS, "retention_limit": 50.0}
+    _, summary = simulate_cash_flow(demo_schedule(), terms)
+    assert summary["total_retention"] == pytest.approx(demo_schedule()["Value (RM)"].sum() * 0.10)
@@ -0,0 +1,94 @@
+import threading
+import time
+
+from civilex import context_cache
+from civilex.context_cache import ContextCacheManager, FakeCacheBackend
+
+
+class FallbackModel:
+    def __init__(self):
+        self.calls = []
+
+    def generate_content(self, contents, stream=False):
+        self.calls.append(contents)
+        return context_cache._FakeResponse("[full] " + " ".join(str(p) for p in contents))
+
+
+def test_warm_cache_is_reused():
+    backend = FakeCacheBackend()
+    manager = ContextCacheManager(backend)
+    fallback = FallbackModel()
+    first = manager.generate("SYSTEM", "one", fallback)
+    second = manager.generate("SYSTEM", "two", fallback)
+    assert first.text.startswith("[cachedContents/fake-1]") and second.text.endswith("two")
+    assert backend.created == 1 and manager.stats["hits"] == 1 and not fallback.calls
+
+
+def test_ttl_is_extended_when_nearly_used_up():
+    backend = FakeCacheBackend()
+    manager = ContextCacheManager(backend, ttl_seconds=100)
+    manager.generate("SYSTEM", "one", FallbackModel())
+    entry = manager._entries[manager.key("SYSTEM")]
+    entry["expires"] = time.time() + 10  # Less than EXTEND_WHEN_LEFT of the TTL left
+    manager.generate("SYSTEM", "two", FallbackModel())
+    assert entry["expires"] > time.time() + 90
+    assert backend.live[entry["handle"]] > time.time() + 90
+    assert backend.created == 1
+
+
+def test_server_side_expiry_rebuilds_the_cache():
+    backend = FakeCacheBackend()
+    manager = ContextCacheManager(backend)
+    fallback = FallbackModel()
+    manager.generate("SYSTEM", "one", fallback)
+    backend.expire("cachedContents/fake-1")
+    reply = manager.generate("SYSTEM", "two", fallback)
+    assert reply.text.startswith("[cachedContents/fake-2]")
+    assert manager.stats["expired"] == 1 and backend.created == 2 and not fallback.calls
+
+
+def test_refused_creation_falls_back_inline_and_backs_off():
+    backend = FakeCacheBackend(min_chars=1000)
+    manager = ContextCacheManager(backend)
+    fallback = FallbackModel()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return "CONTRACT"
+
+    reply = manager.generate("SYSTEM", "one", fallback, contract_loader=loader, contract_key="c1")
+    assert reply.text == "[full] SYSTEM CONTRACT one"
+    manager.generate("SYSTEM", "two", fallback, contract_loader=loader, contract_key="c1")
+    # Second call doesn't try to create again within RETRY_CREATE_AFTER
+    assert len(loads) == 3 and manager.stats["fallbacks"] == 2 and backend.created == 0
+    assert fallback.calls[-1] == ["SYSTEM", "CONTRACT", "two"]
+
+
+def test_slow_build_does_not_block_other_keys():
+    backend = FakeCacheBackend()
+    manager = ContextCacheManager(backend)
+    release = threading.Event()
+
+    def slow_loader():
+        release.wait(5)  # Contract upload stuck in PROCESSING
+        return "CONTRACT"
+
+    results = {}
+
+    def slow_call(name):
+        results[name] = manager.generate("SYSTEM", name, FallbackModel(), contract_loader=slow_loader, contract_key="slow")
+
+    threads = [threading.Thread(target=slow_call, args=(f"t{i}",)) for i in range(2)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    started = time.perf_counter()
+    other = manager.generate("SYSTEM", "other", FallbackModel(), contract_key="other")
+    assert time.perf_counter() - started < 1 and other.text.endswith("other")
+
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert results["t0"].text.split()[0] == results["t1"].text.split()[0]  # One build shared by both callers
+    assert backend.created == 2
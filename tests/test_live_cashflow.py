@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from civilex.cashflow import DEFAULT_TERMS, LiveCashFlow, simulate_cash_flow
+
+from test_cashflow import demo_schedule
+
+
+@pytest.mark.parametrize("distribution,resolution", [("lump", "monthly"), ("linear", "monthly"), ("s-curve", "daily")])
+def test_live_cash_flow_matches_full_recompute_after_edits(distribution, resolution):
+    live = LiveCashFlow(DEFAULT_TERMS, start_balance=-50000.0, distribution=distribution, resolution=resolution)
+    schedule = demo_schedule()
+    live.update(schedule)
+
+    edits = [
+        lambda df: df.assign(**{"Value (RM)": df["Value (RM)"].where(df.index != 1, 900000.0)}),  # Moves the cap
+        lambda df: df.assign(**{"End Date": df["End Date"].where(df.index != 3, pd.Timestamp("2026-02-15"))}),
+        lambda df: pd.concat([df, pd.DataFrame({"Activity": ["Landscape"], "Start Date": [pd.Timestamp("2026-01-01")],
+                                                "End Date": [pd.Timestamp("2026-03-31")], "Value (RM)": [120000.0],
+                                                "Cost (RM)": [90000.0]})], ignore_index=True),
+        lambda df: df.drop(index=2).reset_index(drop=True),
+    ]
+    for edit in edits:
+        schedule = edit(schedule)
+        ledger, summary = live.update(schedule)
+        expected_ledger, expected = simulate_cash_flow(schedule, DEFAULT_TERMS, -50000.0, distribution, resolution)
+        assert list(ledger["Month_Str"]) == list(expected_ledger["Month_Str"])
+        np.testing.assert_allclose(ledger["Cumulative Balance"], expected_ledger["Cumulative Balance"], atol=1e-4)
+        for name in ("contract_sum", "total_retention", "min_balance", "min_balance_daily"):
+            if name in expected:
+                assert summary[name] == pytest.approx(expected[name], abs=1e-4)
+
+
+def test_live_cash_flow_only_rebooks_changed_rows():
+    live = LiveCashFlow(DEFAULT_TERMS, distribution="linear")
+    schedule = demo_schedule()
+    live.update(schedule)
+    schedule = schedule.assign(**{"Cost (RM)": schedule["Cost (RM)"].where(schedule.index != 4, 500000.0)})
+    _, summary = live.update(schedule)
+    assert summary["rows_recomputed"] == 1
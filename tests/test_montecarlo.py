@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from civilex.cashflow import DEFAULT_TERMS, monte_carlo_cash_flow, simulate_cash_flow
+
+from test_cashflow import demo_schedule
+
+
+@pytest.mark.parametrize("distribution", ["lump", "linear"])
+def test_monte_carlo_without_delays_is_deterministic(distribution):
+    _, summary = simulate_cash_flow(demo_schedule(), DEFAULT_TERMS, 10000.0, distribution)
+    result = monte_carlo_cash_flow(demo_schedule(), DEFAULT_TERMS, 10000.0, n_scenarios=50, cert_delay_days=0.0,
+                                   pay_delay_days=0.0, overrun_mean_pct=0.0, overrun_sd_pct=0.0,
+                                   distribution=distribution, seed=1)
+    np.testing.assert_allclose(result["min_balances"], summary["min_balance"], atol=1e-6)
+    for p in (50, 90, 99):
+        assert result["percentiles"][p]["min_balance"] == pytest.approx(summary["min_balance"])
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from civilex.portfolio import SERIAL_THRESHOLD, simulate_portfolio
+from civilex.storage import cost_analysis_folder, save_schedule, save_terms
+
+from test_cashflow import demo_schedule
+
+
+def make_project(root, name, schedule=None, legacy_csv=None, raw_store=None):
+    folder = os.path.join(root, name)
+    if schedule is not None:
+        save_schedule(folder, schedule)
+        save_terms(folder, {"payment_period": 30, "honor_cert_period": 14, "retention_percent": 10, "retention_limit": 5})
+    if legacy_csv is not None:
+        os.makedirs(cost_analysis_folder(folder), exist_ok=True)
+        with open(os.path.join(cost_analysis_folder(folder), "schedule.csv"), "w", encoding="utf-8") as f:
+            f.write(legacy_csv)
+    if raw_store is not None:
+        os.makedirs(cost_analysis_folder(folder), exist_ok=True)
+        with open(os.path.join(cost_analysis_folder(folder), "schedule.npz"), "wb") as f:
+            f.write(raw_store)
+    return name
+
+
+@pytest.mark.parametrize("healthy", [1, SERIAL_THRESHOLD])  # Serial path and worker pool
+def test_malformed_schedule_is_skipped(tmp_path, healthy):
+    root = str(tmp_path)
+    good = [make_project(root, f"Good {i}", schedule=demo_schedule()) for i in range(healthy)]
+    no_dates = make_project(root, "Legacy", legacy_csv="Activity,Value (RM)\nPiling,1000\n")
+    truncated = make_project(root, "Truncated", raw_store=b"PK\x03\x04 half-synced")
+    empty = make_project(root, "Empty")
+
+    result = simulate_portfolio(root, good + [no_dates, truncated, empty])
+
+    assert list(result["ledger"].columns[2:2 + healthy]) == good
+    assert set(result["skipped"]) == {no_dates, truncated, empty}
+    assert result["skipped"][empty] == "No saved schedule"
+    assert result["skipped"][no_dates].startswith("Could not simulate")
+    assert result["skipped"][truncated].startswith("Could not simulate")
+
+
+def test_all_projects_skipped(tmp_path):
+    root = str(tmp_path)
+    name = make_project(root, "Legacy", legacy_csv="Activity,Value (RM)\nPiling,1000\n")
+    result = simulate_portfolio(root, [name], start_balance=5000.0)
+    assert result["ledger"].empty
+    assert result["peak_balance"] == 5000.0
+    assert name in result["skipped"]